@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+import timeit
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import plantcv as pcv
+from pipeline import components
+import synthetic
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Benchmark ROI object filtering on masks with many objects")
+    parser.add_argument("-d", "--densities", help="Comma-separated fractions of frame pixels set as noise.",
+                        default="0.0002,0.001,0.005")
+    parser.add_argument("-n", "--repeat", help="Number of timed repetitions.", type=int, default=3)
+    args = parser.parse_args()
+    return args
+
+
+def noisy_mask(density, seed=0, shape=synthetic.VIS_SHAPE):
+    # Plant mask (stem, leaves with holes, pot rim) plus speckle noise and small blobs over the whole frame
+    rng = np.random.RandomState(seed)
+    rows, cols = shape
+    mask = np.zeros(shape, dtype=np.uint8)
+    center = cols // 2
+    cv2.line(mask, (center, int(rows * 0.66)), (center, int(rows * 0.25)), 255, 18)
+    for leaf in range(8):
+        y = rng.randint(int(rows * 0.25), int(rows * 0.62))
+        angle = rng.uniform(-50, 50) + (180 if leaf % 2 else 0)
+        cv2.ellipse(mask, (center, y), (rng.randint(150, 450), 25), angle, 0, 180, 255, -1)
+    cv2.rectangle(mask, (center - 200, int(rows * 0.66)), (center + 200, int(rows * 0.68)), 255, -1)
+    leaf_pixels = np.flatnonzero(mask)
+    mask.flat[rng.choice(leaf_pixels, len(leaf_pixels) // 200)] = 0
+    mask.flat[rng.choice(mask.size, int(mask.size * density))] = 255
+    for blob in range(int(mask.size * density / 500)):
+        cv2.circle(mask, (rng.randint(cols), rng.randint(rows)), rng.randint(1, 6), 255, -1)
+    return mask
+
+
+def best_time(function, repeat):
+    times = []
+    result = None
+    for i in range(repeat):
+        start = timeit.default_timer()
+        result = function()
+        times.append(timeit.default_timer() - start)
+    return min(times), result
+
+
+def plantcv_objects(img, mask, roi, roi_hierarchy):
+    # find_objects, roi_objects and object_composition, as in the debug path of the pipeline
+    device, objects, obj_hierarchy = pcv.find_objects(img=img, mask=mask, device=0)
+    device, kept, hierarchy, kept_mask, obj_area = pcv.roi_objects(img=img, roi_type="partial", roi_contour=roi,
+                                                                   roi_hierarchy=roi_hierarchy,
+                                                                   object_contour=objects,
+                                                                   obj_hierarchy=obj_hierarchy, device=device)
+    device, plant_obj, plant_mask = pcv.object_composition(img=img, contours=kept, hierarchy=hierarchy,
+                                                           device=device)
+    return len(objects), plant_obj, plant_mask
+
+
+def component_objects(img, mask, roi):
+    # Connected-component filtering, then object_composition of the kept objects
+    device, kept, hierarchy, kept_mask, obj_area = components.roi_objects(mask=mask, roi_contour=roi, device=0)
+    device, plant_obj, plant_mask = pcv.object_composition(img=img, contours=kept, hierarchy=hierarchy,
+                                                           device=device)
+    return plant_obj, plant_mask
+
+
+def main():
+    # Get options
+    args = options()
+
+    img = np.zeros(synthetic.VIS_SHAPE + (3,), dtype=np.uint8)
+    device, roi, roi_hierarchy = pcv.define_roi(img=img, shape="rectangle", device=0, roi=None, roi_input="default",
+                                                adjust=True, x_adj=600, y_adj=0, w_adj=-1200, h_adj=-600)
+
+    print("{0:>10}{1:>10}{2:>14}{3:>16}{4:>10}{5:>12}".format("density", "objects", "plantcv (s)", "components (s)",
+                                                              "speedup", "same mask"))
+    for density in [float(d) for d in args.densities.split(",")]:
+        mask = noisy_mask(density)
+        # find_objects may modify its mask, so each call gets a copy
+        ref_time, (count, ref_obj, ref_mask) = best_time(
+            lambda: plantcv_objects(img=img, mask=np.copy(mask), roi=roi, roi_hierarchy=roi_hierarchy), args.repeat)
+        cc_time, (cc_obj, cc_mask) = best_time(lambda: component_objects(img=img, mask=np.copy(mask), roi=roi),
+                                               args.repeat)
+        same = np.array_equal(ref_mask, cc_mask) and np.array_equal(ref_obj, cc_obj)
+        print("{0:>10}{1:>10}{2:>14.4f}{3:>16.4f}{4:>9.1f}x{5:>12}".format(density, count, ref_time, cc_time,
+                                                                          ref_time / cc_time, str(same)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import argparse
+import fnmatch
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import engine, naive_bayes, sink
+import synthetic
+
+# Features compared with the full-frame results
+FEATURES = ["area", "convex-hull_area", "perimeter", "width", "height", "center-of-mass-x", "center-of-mass-y",
+            "height_above_bound", "height_below_bound", "hue_median"]
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Compare ROI-cropped and coarse-to-fine segmentation with "
+                                                 "full-frame segmentation on synthetic side-view images")
+    parser.add_argument("-s", "--snapshots", help="Number of synthetic snapshots.", type=int, default=2)
+    parser.add_argument("-c", "--coarse", help="Comma-separated coarse-to-fine downscaling factors.", default="2,4")
+    parser.add_argument("-m", "--margin", help="Pixels added around the ROI.", type=int, default=100)
+    parser.add_argument("-t", "--tolerance", help="Largest accepted relative feature difference (coarse modes lose "
+                        "structures thinner than the downscaling factor).", type=float, default=0.02)
+    parser.add_argument("-p", "--pipelines", help="Comma-separated pipelines.",
+                        default=",".join(sorted(synthetic.PIPELINE_IMAGES)))
+    args = parser.parse_args()
+    return args
+
+
+def run_mode(images, pipeline, files, lut_cache, crop=False, coarse=None, margin=100):
+    # Analyze images in one mode; returns the features of each image and the mean segment and total times
+    args = argparse.Namespace(pdfs=files["pdfs"], lut_cache=lut_cache, bgimg=files["bg_SV"], cache_bg=True,
+                              crop=crop, coarse=coarse, crop_margin=margin, stage_log="", debug=None)
+    for name, value in engine.DEFAULT_OPTIONS.items():
+        if not hasattr(args, name):
+            setattr(args, name, value)
+    features = {}
+    segment = 0.0
+    start = timeit.default_timer()
+    for image in images:
+        records = engine.process_image(image=image, pipeline=pipeline, args=args)
+        features[image] = sink.record_features(records[0])[0]
+        segment += sum(stage["wall_s"] for stage in records[0]["stats"]["stages"]
+                       if stage["stage"] in ("segment", "fill"))
+    total = timeit.default_timer() - start
+    return features, segment / len(images), total / len(images)
+
+
+def largest_difference(reference, features):
+    # Largest relative difference of the compared features over all images
+    worst = (0.0, None)
+    for image in reference:
+        for name in FEATURES:
+            if name not in reference[image]:
+                continue
+            expected = float(reference[image][name])
+            observed = float(features[image][name])
+            difference = abs(observed - expected) / max(abs(expected), 1.0)
+            if difference > worst[0]:
+                worst = (difference, name)
+    return worst
+
+
+def main():
+    # Get options
+    args = options()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        files = synthetic.write_dataset(directory=tmpdir, snapshots=args.snapshots)
+        lut_cache = os.path.join(tmpdir, "lut")
+        naive_bayes.get_lut(pdf_file=files["pdfs"], cache_dir=lut_cache)
+
+        failed = False
+        print("{0:<16}{1:<12}{2:>12}{3:>12}{4:>10}{5:>12}  {6}".format("pipeline", "mode", "segment s", "total s",
+                                                                       "speedup", "max diff", "feature"))
+        for pipeline in args.pipelines.split(","):
+            images = [image for image in files["images"]
+                      if fnmatch.fnmatch(os.path.basename(image), synthetic.PIPELINE_IMAGES[pipeline])]
+            # Warm up the background models and lookup table
+            run_mode(images[:1], pipeline, files, lut_cache)
+            reference, segment, total = run_mode(images, pipeline, files, lut_cache)
+            print("{0:<16}{1:<12}{2:>12.4f}{3:>12.4f}".format(pipeline, "full", segment, total))
+            modes = [("crop", None)] + [("coarse " + factor, int(factor)) for factor in args.coarse.split(",")]
+            for mode, coarse in modes:
+                features, mode_segment, mode_total = run_mode(images, pipeline, files, lut_cache, crop=True,
+                                                              coarse=coarse, margin=args.margin)
+                difference, name = largest_difference(reference, features)
+                failed = failed or difference > args.tolerance
+                print("{0:<16}{1:<12}{2:>12.4f}{3:>12.4f}{4:>9.2f}x{5:>12.5f}  {6}".format(
+                    pipeline, mode, mode_segment, mode_total, segment / mode_segment, difference, name or ""))
+        if failed:
+            print("Some features differ from full-frame results by more than {0}".format(args.tolerance))
+            sys.exit(1)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import background, engine, foreground, lean, profiles
+import synthetic
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2: no allocation tracing
+    tracemalloc = None
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Compare the fused foreground mask with the background "
+                                                 "subtraction chain of the transect pipelines")
+    parser.add_argument("-p", "--pipelines", help="Comma-separated background-segmentation pipelines.",
+                        default="transect_z1,transect_z300,transect_z300_old")
+    parser.add_argument("-n", "--repeat", help="Number of timed repetitions.", type=int, default=5)
+    args = parser.parse_args()
+    return args
+
+
+def measure(function, repeat):
+    # Best wall time over the repetitions, then the peak traced allocation of one more call
+    times = []
+    for i in range(repeat):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1] / 1048576.0
+        tracemalloc.stop()
+    else:
+        result = function()
+    return min(times), peak, result
+
+
+def main():
+    # Get options
+    args = options()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        bgfile = os.path.join(tmpdir, "background_SV.png")
+        cv2.imwrite(bgfile, synthetic.vis_image(seed=1, plant=False))
+        run(img=synthetic.vis_image(seed=0), bgfile=bgfile, pipelines=args.pipelines.split(","), repeat=args.repeat)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def run(img, bgfile, pipelines, repeat):
+    # Both methods use the cached background model (--cache-bg)
+    metadata = {"camera": "SV", "zoom": "z1"}
+    model = background.get_model(bgfile=bgfile, camera=metadata["camera"], zoom=metadata["zoom"])
+    chain_args = argparse.Namespace(cache_bg=True, lean=False, bgimg=bgfile, debug=None)
+    buffers = lean.Buffers()
+
+    print("Image: {0} x {1}".format(img.shape[1], img.shape[0]))
+    print("{0:<20}{1:>12}{2:>12}{3:>14}{4:>14}{5:>10}{6:>12}".format(
+        "pipeline", "chain (s)", "fused (s)", "chain (MB)", "fused (MB)", "speedup", "same mask"))
+    for pipeline in pipelines:
+        profile = profiles.get_profile(profiles=profiles.load_profiles(), pipeline=pipeline, metadata=metadata)
+        chain_time, chain_peak, chain_mask = measure(
+            lambda: engine.subtract_background(vis=img, metadata=metadata, profile=profile, device=0,
+                                               args=chain_args)[1], repeat)
+        # Buffers are allocated by the first call, so the measured calls reuse them
+        foreground.foreground_mask(img=img, model=model, profile=profile, buffers=buffers)
+        fused_time, fused_peak, fused_mask = measure(
+            lambda: foreground.foreground_mask(img=img, model=model, profile=profile, buffers=buffers), repeat)
+        peaks = ["n/a" if peak is None else "{0:.1f}".format(peak) for peak in (chain_peak, fused_peak)]
+        print("{0:<20}{1:>12.4f}{2:>12.4f}{3:>14}{4:>14}{5:>9.1f}x{6:>12}".format(
+            pipeline, chain_time, fused_time, peaks[0], peaks[1], chain_time / fused_time,
+            str(np.array_equal(chain_mask, fused_mask))))
+
+
+if __name__ == '__main__':
+    main()
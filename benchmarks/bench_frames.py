@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import plantcv as pcv
+from pipeline import batch, frames, pairing
+import synthetic
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Compare PNG decoding with reads from a frame store")
+    parser.add_argument("-s", "--snapshots", help="Number of synthetic snapshots.", type=int, default=2)
+    parser.add_argument("-n", "--repeat", help="Number of timed repetitions.", type=int, default=3)
+    args = parser.parse_args()
+    return args
+
+
+def read_all(images, read):
+    # Read every image and touch every pixel, as the first pipeline step would
+    return sum(int(read(image).sum(dtype=np.uint64)) for image in images)
+
+
+def best_time(function, repeat):
+    times = []
+    result = None
+    for i in range(repeat):
+        start = timeit.default_timer()
+        result = function()
+        times.append(timeit.default_timer() - start)
+    return min(times), result
+
+
+def main():
+    # Get options
+    args = options()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        files = synthetic.write_dataset(os.path.join(tmpdir, "data"), snapshots=args.snapshots)
+        images = batch.collect_images(directory=os.path.join(tmpdir, "data"))
+        images.extend(nirpath for nirpath in pairing.index_pairs(images).values() if nirpath is not None)
+        store_dir = os.path.join(tmpdir, "frames")
+        os.makedirs(store_dir)
+        convert_time, count = best_time(lambda: frames.FrameStore(store_dir).add(images), 1)
+
+        decode_time, decode_sum = best_time(lambda: read_all(images, lambda image: pcv.readimage(image)[0]),
+                                            args.repeat)
+        store_time, store_sum = best_time(
+            lambda: read_all(images, lambda image: frames.readimage(image, store=store_dir)[0]), args.repeat)
+        cached_time, cached_sum = best_time(lambda: read_all([files["bg_SV"]] * len(images), frames.read_cached),
+                                            args.repeat)
+
+        print("{0} images, converted in {1:.2f} s".format(count, convert_time))
+        print("{0:<28}{1:>12}{2:>10}{3:>12}".format("reader", "s/image", "speedup", "same"))
+        for name, t, total in [("pcv.readimage (decode)", decode_time, decode_sum),
+                               ("frame store (mmap)", store_time, store_sum)]:
+            print("{0:<28}{1:>12.4f}{2:>9.1f}x{3:>12}".format(name, t / len(images), decode_time / t,
+                                                              str(total == decode_sum)))
+        print("{0:<28}{1:>12.4f}".format("cached background", cached_time / len(images)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
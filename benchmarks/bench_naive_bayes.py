@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import plantcv as pcv
+from pipeline import naive_bayes
+import synthetic
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Benchmark Naive Bayes pixel classification methods")
+    parser.add_argument("-i", "--image", help="VIS image (default: synthetic full-resolution frame).",
+                        required=False)
+    parser.add_argument("-p", "--pdfs", help="Naive Bayes PDF file (default: synthetic PDFs).", required=False)
+    parser.add_argument("-n", "--repeat", help="Number of timed repetitions.", type=int, default=3)
+    parser.add_argument("--reference", help="Also time pcv.naive_bayes_classifier (slow).", default=False,
+                        action="store_true")
+    args = parser.parse_args()
+    return args
+
+
+def best_time(function, repeat):
+    times = []
+    result = None
+    for i in range(repeat):
+        start = timeit.default_timer()
+        result = function()
+        times.append(timeit.default_timer() - start)
+    return min(times), result
+
+
+def same_masks(masks1, masks2):
+    return sorted(masks1) == sorted(masks2) and all(np.array_equal(masks1[c], masks2[c]) for c in masks1)
+
+
+def main():
+    # Get options
+    args = options()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        pdf_file = args.pdfs
+        if pdf_file is None:
+            pdf_file = os.path.join(tmpdir, "synthetic_pdfs.txt")
+            synthetic.write_pdf_file(pdf_file)
+        if args.image is None:
+            img = synthetic.vis_image()
+        else:
+            img, path, filename = pcv.readimage(filename=args.image)
+        print("Image: {0} x {1}".format(img.shape[1], img.shape[0]))
+
+        rows = []
+        # Vectorized classifier, including parsing the PDF file on every call
+        vec_time, vec_masks = best_time(
+            lambda: naive_bayes.naive_bayes_classifier(img=img, pdfs=naive_bayes.read_pdfs(pdf_file), device=0)[1],
+            args.repeat)
+        rows.append(("vectorized (parse per image)", vec_time, True))
+
+        # Lookup table: one-off compile, cached load, then per-image classification
+        cache_dir = os.path.join(tmpdir, "lut")
+        compile_time, _ = best_time(lambda: naive_bayes.load_lut(pdf_file=pdf_file, cache_dir=cache_dir), 1)
+        load_time, (classes, lut) = best_time(lambda: naive_bayes.load_lut(pdf_file=pdf_file, cache_dir=cache_dir),
+                                              args.repeat)
+        lut_time, lut_masks = best_time(
+            lambda: naive_bayes.lut_classifier(img=img, classes=classes, lut=lut, device=0)[1], args.repeat)
+        rows.append(("lookup table (per image)", lut_time, same_masks(lut_masks, vec_masks)))
+
+        if args.reference:
+            ref_time, ref_masks = best_time(
+                lambda: pcv.naive_bayes_classifier(img=img, pdf_file=pdf_file, device=0)[1], 1)
+            rows.insert(0, ("pcv.naive_bayes_classifier", ref_time, True))
+            rows = [(name, t, same_masks(masks, ref_masks)) for (name, t, _), masks in
+                    zip(rows, [ref_masks, vec_masks, lut_masks])]
+
+        print("Lookup table compile: {0:.2f} s, cached load: {1:.4f} s".format(compile_time, load_time))
+        print("{0:<32}{1:>12}{2:>10}{3:>14}".format("method", "seconds", "speedup", "same masks"))
+        for name, t, same in rows:
+            print("{0:<32}{1:>12.4f}{2:>9.1f}x{3:>14}".format(name, t, rows[0][1] / t, str(same)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from pipeline import naive_bayes
+import synthetic
+
+# Pipeline variants: script and the filename pattern of synthetic VIS images each one processes
+VARIANTS = {
+    "lt1": {"script": "plantcv-lt1.py", "images": "VIS_*.png"},
+    "transect_z1": {"script": "transect.vis_sv_z1.py", "images": "VIS_SV_*_z1_*.png"},
+    "transect_z300": {"script": "transect.vis_sv_z300.py", "images": "VIS_SV_*_z300_*.png"}
+}
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline scripts on synthetic LemnaTec images")
+    parser.add_argument("-o", "--output", help="Benchmark results file (JSON).", default="bench_pipelines.json")
+    parser.add_argument("-s", "--snapshots", help="Number of synthetic snapshots (3 VIS/NIR pairs each).",
+                        type=int, default=4)
+    parser.add_argument("-n", "--procs", help="Number of worker processes per script.", type=int, default=1)
+    parser.add_argument("-r", "--repeat", help="Number of timed runs per variant (the fastest is kept).", type=int,
+                        default=1)
+    parser.add_argument("-v", "--variants", help="Comma-separated pipeline variants.",
+                        default=",".join(sorted(VARIANTS)))
+    parser.add_argument("-l", "--label", help="Label of this run (e.g. the release).", default=None)
+    parser.add_argument("-c", "--compare", help="Earlier benchmark results file to compare throughput with.",
+                        default=None)
+    parser.add_argument("-w", "--workdir", help="Keep the synthetic data and outputs in this directory.",
+                        default=None)
+    parser.add_argument("--script-args", help="Extra options passed to every script (e.g. \"--lean\").",
+                        default="")
+    args = parser.parse_args()
+    return args
+
+
+def run_script(command):
+    """Run a pipeline script and measure its wall time and peak memory.
+
+    Inputs:
+    command = command line
+
+    Returns:
+    wall    = wall time (seconds)
+    maxrss  = peak resident set size of the script process (kB)
+
+    :param command: list
+    :return wall: float
+    :return maxrss: int
+    """
+    start = timeit.default_timer()
+    proc = subprocess.Popen(command)
+    pid, status, rusage = os.wait4(proc.pid, 0)
+    wall = timeit.default_timer() - start
+    if os.WIFSIGNALED(status):
+        # Killed, e.g. by the OOM killer; the exit status of a signaled process is 0
+        sys.stderr.write("Command killed by signal {0}: {1}\n".format(os.WTERMSIG(status), " ".join(command)))
+        sys.exit(1)
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+        sys.stderr.write("Command failed: {0}\n".format(" ".join(command)))
+        sys.exit(1)
+    maxrss = rusage.ru_maxrss
+    if sys.platform == "darwin":
+        maxrss //= 1024
+    return wall, maxrss
+
+
+def stage_summary(stage_log):
+    # Mean and total wall time of each stage from a --stage-log file
+    stages = {}
+    with open(stage_log, "r") as sl:
+        for line in sl:
+            stage = json.loads(line)
+            stages.setdefault(stage["stage"], []).append(stage["wall_s"])
+    return dict((name, {"mean_s": float(np.mean(wall)), "total_s": float(np.sum(wall))})
+                for name, wall in stages.items())
+
+
+def main():
+    # Get options
+    args = options()
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp()
+    try:
+        # Synthetic images, PDFs and background frames
+        data_dir = os.path.join(workdir, "data")
+        files = synthetic.write_dataset(directory=data_dir, snapshots=args.snapshots)
+        # Compile the classifier lookup table before timing
+        lut_cache = os.path.join(workdir, "lut")
+        naive_bayes.get_lut(pdf_file=files["pdfs"], cache_dir=lut_cache)
+
+        results = {"label": args.label, "date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+                   "platform": platform.platform(), "processor": platform.processor(),
+                   "snapshots": args.snapshots, "procs": args.procs, "script_args": args.script_args,
+                   "variants": {}}
+        for name in args.variants.split(","):
+            variant = VARIANTS[name]
+            pattern = os.path.join(data_dir, "snapshot*", variant["images"])
+            n_images = len([image for image in files["images"]
+                            if fnmatch.fnmatch(os.path.basename(image), variant["images"])])
+            runs = []
+            for i in range(args.repeat):
+                out_dir = os.path.join(workdir, "{0}_{1}".format(name, i))
+                if os.path.exists(out_dir):
+                    shutil.rmtree(out_dir)
+                os.makedirs(out_dir)
+                stage_log = os.path.join(out_dir, "stages.jsonl")
+                command = [sys.executable, os.path.join(ROOT, variant["script"]), "-g", pattern,
+                           "-n", str(args.procs), "-r", os.path.join(out_dir, "results.txt"),
+                           "--stage-log", stage_log] + args.script_args.split()
+                if name == "lt1":
+                    command += ["-r2", os.path.join(out_dir, "coresults.txt"), "-p", files["pdfs"], "-l", lut_cache]
+                else:
+                    command += ["-b", files["bg_SV"]]
+                wall, maxrss = run_script(command)
+                runs.append({"wall_s": wall, "images_per_s": n_images / wall, "peak_rss_kb": maxrss,
+                             "stages": stage_summary(stage_log)})
+            best = min(runs, key=lambda run: run["wall_s"])
+            best["images"] = n_images
+            results["variants"][name] = best
+            print("{0:<16}{1:>8} images{2:>10.2f} s{3:>10.3f} images/s{4:>10.1f} MB".format(
+                name, n_images, best["wall_s"], best["images_per_s"], best["peak_rss_kb"] / 1024.0))
+
+        with open(args.output, "w") as of:
+            json.dump(results, of, indent=2, sort_keys=True)
+
+        if args.compare is not None:
+            with open(args.compare, "r") as cf:
+                earlier = json.load(cf)
+            print("Throughput relative to {0}:".format(earlier.get("label") or args.compare))
+            for name in sorted(results["variants"]):
+                if name in earlier["variants"]:
+                    print("{0:<16}{1:>8.2f}x".format(name, results["variants"][name]["images_per_s"] /
+                                                     earlier["variants"][name]["images_per_s"]))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+import timeit
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import plantcv as pcv
+from pipeline import profiles, registration
+import synthetic
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Compare pcv.resize and pcv.crop_position_mask with the VIS to NIR "
+                                                 "registration warp")
+    parser.add_argument("-P", "--pipeline", help="Pipeline whose NIR views are benchmarked.", default="lt1")
+    parser.add_argument("-m", "--masks", help="Number of random plant masks per view.", type=int, default=10)
+    parser.add_argument("-n", "--repeat", help="Number of timed repetitions.", type=int, default=3)
+    args = parser.parse_args()
+    return args
+
+
+def plant_mask(seed, shape=synthetic.VIS_SHAPE):
+    # Random leaves (ellipses) of many sizes and some single pixels, anywhere in the frame
+    rng = np.random.RandomState(seed)
+    rows, cols = shape
+    mask = np.zeros(shape, dtype=np.uint8)
+    for leaf in range(rng.randint(5, 40)):
+        cv2.ellipse(mask, (rng.randint(cols), rng.randint(rows)), (rng.randint(1, 300), rng.randint(1, 100)),
+                    rng.randint(180), 0, 360, 255, -1)
+    mask.flat[rng.choice(mask.size, mask.size // 1000)] = 255
+    return mask
+
+
+def plantcv_mask(mask, nir, settings):
+    # pcv.resize and pcv.crop_position_mask, as in the debug path of the pipeline
+    crop = settings["crop_position"]
+    device, nir_mask = pcv.resize(img=mask, resize_x=settings["resize"], resize_y=settings["resize"], device=0)
+    device, newmask = pcv.crop_position_mask(img=nir, mask=nir_mask, device=device, x=crop["x"], y=crop["y"],
+                                             v_pos=crop["v_pos"], h_pos=crop["h_pos"])
+    return newmask
+
+
+def best_time(function, masks, repeat):
+    # Best time per mask and the results of the last repetition
+    times = []
+    result = None
+    for i in range(repeat):
+        start = timeit.default_timer()
+        result = [function(mask) for mask in masks]
+        times.append(timeit.default_timer() - start)
+    return min(times) / len(masks), result
+
+
+def main():
+    # Get options
+    args = options()
+
+    pipeline = profiles.load_profiles()[args.pipeline]
+    masks = [plant_mask(seed) for seed in range(args.masks)]
+    nir = np.zeros(synthetic.NIR_SHAPE, dtype=np.uint8)
+
+    print("{0:<12}{1:<20}{2:>12}{3:>10}{4:>16}".format("view", "method", "ms/mask", "speedup", "pixels differ"))
+    for view, view_settings in sorted(pipeline.get("views", {}).items()):
+        settings = (view_settings or {}).get("nir", pipeline.get("nir"))
+        if settings is None:
+            continue
+        start = timeit.default_timer()
+        reg = registration.get_registration(vis_shape=synthetic.VIS_SHAPE, nir_shape=synthetic.NIR_SHAPE,
+                                            settings=settings)
+        calibrate_time = timeit.default_timer() - start
+
+        methods = [("pcv resize + crop", lambda mask: plantcv_mask(mask, nir, settings)),
+                   ("warp (bilinear)", lambda mask: reg.warp(mask, "bilinear")),
+                   ("warp (nearest)", lambda mask: reg.warp(mask, "nearest"))]
+        ref_time, ref_masks = None, None
+        for name, method in methods:
+            t, results = best_time(method, masks, args.repeat)
+            if ref_masks is None:
+                ref_time, ref_masks = t, results
+            differ = sum(np.count_nonzero((ref > 0) != (result > 0)) for ref, result in zip(ref_masks, results))
+            total = sum(np.count_nonzero(ref) for ref in ref_masks)
+            print("{0:<12}{1:<20}{2:>12.3f}{3:>9.2f}x{4:>16}".format(view, name, t * 1000, ref_time / t,
+                                                                    "{0} of {1}".format(differ, total)))
+        print("{0:<12}{1:<20}{2:>12.3f}".format(view, "calibration", calibrate_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import batch, engine, frames, pairing, profiles, sink
+import synthetic
+
+# Golden output file format version
+GOLDEN_VERSION = 2
+# Pipeline options of each mode checked against the reference outputs ("coarseN" modes are built from their name)
+MODES = {
+    "reference": {"reference": True},
+    "default": {},
+    "lean": {"lean": True},
+    "crop": {"crop": True},
+    "cache_bg": {"cache_bg": True},
+    "frames": {},
+    "nir_warp": {"nir_warp": "bilinear"},
+    "nir_nearest": {"nir_warp": "nearest"}
+}
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Check optimized pipeline modes against golden reference outputs "
+                                                 "(feature drift and speedup)")
+    parser.add_argument("-G", "--golden", help="Golden output file (JSON); recorded with the reference mode when it "
+                        "does not exist.", required=True)
+    parser.add_argument("--record", help="Record the golden outputs again.", default=False, action="store_true")
+    parser.add_argument("-P", "--pipelines", help="Comma-separated pipelines (synthetic data).",
+                        default=",".join(sorted(synthetic.PIPELINE_IMAGES)))
+    parser.add_argument("-d", "--dir", help="Fixture image directory instead of synthetic data (use with one "
+                        "pipeline, --pdfs and --bgimg).", required=False)
+    parser.add_argument("-p", "--pdfs", help="Naive Bayes PDF file of the fixture images.", required=False)
+    parser.add_argument("-b", "--bgimg", help="Background image file of the fixture images.", required=False)
+    parser.add_argument("-s", "--snapshots", help="Number of synthetic snapshots.", type=int, default=2)
+    parser.add_argument("-m", "--modes", help="Comma-separated modes to check: default, lean, crop, coarseN (e.g. "
+                        "coarse2), cache_bg, frames, nir_warp, nir_nearest.", default="default,lean,frames")
+    parser.add_argument("-t", "--tolerance", help="Largest accepted drift of a feature, as FEATURE=VALUE (FEATURE is "
+                        "a name such as area, NIR:area or default; repeatable). Numbers drift by their relative "
+                        "difference and histograms by the fraction of counts moved. The default tolerance is 0.",
+                        default=[], action="append")
+    parser.add_argument("--cache-bg", help="Use the cached background model in every mode, including the "
+                        "reference.", default=False, action="store_true")
+    parser.add_argument("-a", "--all", help="List every feature, not only those that drift.", default=False,
+                        action="store_true")
+    args = parser.parse_args()
+    if args.dir is not None and len(args.pipelines.split(",")) != 1:
+        parser.error("--dir requires a single pipeline")
+    try:
+        args.tolerance = parse_tolerances(args.tolerance)
+    except ValueError:
+        parser.error("tolerances are given as FEATURE=VALUE")
+    return args
+
+
+def mode_options(mode):
+    # Pipeline options of a mode
+    if mode.startswith("coarse") and mode[len("coarse"):].isdigit():
+        return {"crop": True, "coarse": int(mode[len("coarse"):])}
+    if mode not in MODES:
+        raise ValueError("Unknown mode: {0}".format(mode))
+    return MODES[mode]
+
+
+def parse_tolerances(specs):
+    tolerances = {"default": 0.0}
+    for spec in specs:
+        if "=" not in spec:
+            raise ValueError(spec)
+        name, value = spec.rsplit("=", 1)
+        tolerances[name] = float(value)
+    return tolerances
+
+
+def tolerance(tolerances, feature):
+    # Tolerance of a feature (e.g. NIR:area), else of its name in any image type (area), else the default
+    for name in (feature, feature.split(":", 1)[1], "default"):
+        if name in tolerances:
+            return tolerances[name]
+
+
+def feature_rows(records, root):
+    # Feature values of the VIS and NIR records of each image, keyed by the image path relative to root
+    rows = {}
+    for image, image_records in records.items():
+        row = {}
+        for record in image_records:
+            features, images = sink.record_features(record)
+            for name, value in features.items():
+                row[record["metadata"]["imgtype"] + ":" + name] = sink._native(value)
+        rows[os.path.relpath(image, root)] = row
+    return rows
+
+
+def drift(expected, observed):
+    """Drift of a feature value from its reference value.
+
+    Numbers drift by their difference relative to the reference (at least 1), histograms by the
+    fraction of their counts that moved; other values (and NaN against a number) drift infinitely
+    when they differ.
+
+    :param expected: object
+    :param observed: object
+    :return drift: float
+    """
+    if observed is None:
+        return float("inf")
+    if isinstance(expected, list):
+        if not isinstance(observed, list) or len(observed) != len(expected):
+            return float("inf")
+        expected = np.asarray(expected, dtype=np.float64)
+        observed = np.asarray(observed, dtype=np.float64)
+        return float(np.abs(observed - expected).sum() / max(np.abs(expected).sum(), 1.0))
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        try:
+            observed = float(observed)
+        except (TypeError, ValueError):
+            return float("inf")
+        if math.isnan(expected) or math.isnan(observed):
+            return 0.0 if math.isnan(expected) and math.isnan(observed) else float("inf")
+        return abs(observed - expected) / max(abs(expected), 1.0)
+    return 0.0 if observed == expected else float("inf")
+
+
+def compare(golden, rows):
+    """Largest drift of each feature over all images.
+
+    :param golden: dict
+    :param rows: dict
+    :return drifts: dict
+    """
+    drifts = {}
+    for image, expected in golden.items():
+        observed = rows.get(image, {})
+        for name, value in expected.items():
+            drifts[name] = max(drifts.get(name, 0.0), drift(value, observed.get(name)))
+    return drifts
+
+
+def digest(path):
+    # SHA-1 hash of a file (None for no file)
+    if path is None:
+        return None
+    with open(path, "rb") as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+
+def golden_settings(args, pipelines):
+    """Settings that golden outputs depend on, besides the code being checked.
+
+    Inputs:
+    args      = options
+    pipelines = names of the pipelines run
+
+    Returns:
+    settings  = dictionary of input data, PDF and background files, cached background and pipeline profiles
+
+    :param args: argparse.Namespace
+    :param pipelines: list
+    :return settings: dict
+    """
+    settings = {"data": "synthetic" if args.dir is None else os.path.abspath(args.dir), "cache_bg": args.cache_bg,
+                "profiles": dict((pipeline, profiles.load_profiles()[pipeline]) for pipeline in pipelines)}
+    if args.dir is not None:
+        # Synthetic data is made from a fixed seed; fixture files may change
+        settings["pdfs"] = digest(args.pdfs)
+        settings["bgimg"] = digest(args.bgimg)
+    return settings
+
+
+def changed_settings(recorded, current):
+    # Names of the settings that differ from those the golden outputs were recorded with
+    changed = [name for name in ("data", "cache_bg", "pdfs", "bgimg") if recorded.get(name) != current.get(name)]
+    for pipeline, profile in sorted(current["profiles"].items()):
+        if pipeline in recorded["profiles"] and recorded["profiles"][pipeline] != profile:
+            changed.append("profile of " + pipeline)
+    return changed
+
+
+def run_mode(images, pipeline, settings, mode):
+    # Analyze images in one mode (after one warm-up image) with the per-run setup of the pipeline scripts; returns
+    # the records of each image and seconds per image
+    args = argparse.Namespace(**settings)
+    for name, value in mode_options(mode).items():
+        setattr(args, name, value)
+    engine._prepare(args)
+    pairs = None
+    if engine._uses_nir(pipeline, args):
+        pairs = pairing.index_pairs(images)
+    engine.process_image(image=images[0], pipeline=pipeline, args=args, pairs=pairs)
+    records = {}
+    start = timeit.default_timer()
+    for image in images:
+        records[image] = engine.process_image(image=image, pipeline=pipeline, args=args, pairs=pairs)
+    return records, (timeit.default_timer() - start) / len(images)
+
+
+def main():
+    # Get options
+    args = options()
+    tolerances = args.tolerance
+    golden = None
+    if os.path.exists(args.golden) and not args.record:
+        with open(args.golden, "r") as gf:
+            golden = json.load(gf)
+        if golden.get("version") != GOLDEN_VERSION:
+            sys.stderr.write("Golden file {0} has an unsupported version\n".format(args.golden))
+            sys.exit(2)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # Input images: fixtures, or a synthetic data set made like the one the golden outputs were recorded on
+        if args.dir is not None:
+            root = args.dir
+            files = {"pdfs": args.pdfs, "bg_SV": args.bgimg,
+                     "images": batch.collect_images(directory=args.dir)}
+            pipelines = {args.pipelines: "VIS_*"}
+        else:
+            root = os.path.join(tmpdir, "data")
+            snapshots = golden["snapshots"] if golden is not None else args.snapshots
+            files = synthetic.write_dataset(directory=root, snapshots=snapshots)
+            pipelines = dict((pipeline, synthetic.PIPELINE_IMAGES[pipeline])
+                             for pipeline in args.pipelines.split(","))
+        settings = {"pdfs": files["pdfs"], "lut_cache": os.path.join(tmpdir, "lut"), "bgimg": files["bg_SV"],
+                    "cache_bg": args.cache_bg, "debug": None}
+        current = golden_settings(args, sorted(pipelines))
+
+        if golden is None:
+            # Record the reference outputs
+            golden = {"version": GOLDEN_VERSION, "snapshots": None if args.dir else args.snapshots,
+                      "settings": current, "pipelines": {}}
+            for pipeline, pattern in sorted(pipelines.items()):
+                images = [image for image in files["images"] if fnmatch.fnmatch(os.path.basename(image), pattern)]
+                records, seconds = run_mode(images, pipeline, settings, "reference")
+                golden["pipelines"][pipeline] = {"seconds": seconds, "images": feature_rows(records, root)}
+                print("{0:<16}{1:<12}{2:>10.4f} s/image, {3} images recorded".format(pipeline, "reference", seconds,
+                                                                                     len(images)))
+            with open(args.golden, "w") as gf:
+                json.dump(golden, gf, indent=1, sort_keys=True)
+            return
+
+        changed = changed_settings(golden["settings"], current)
+        if len(changed) > 0:
+            sys.stderr.write("Golden file {0} was recorded with other settings ({1}); record it again with "
+                             "--record\n".format(args.golden, ", ".join(changed)))
+            sys.exit(2)
+
+        failed = False
+        print("{0:<16}{1:<12}{2:>10}{3:>10}  {4:<32}{5:>12}{6:>12}".format("pipeline", "mode", "s/image", "speedup",
+                                                                          "feature", "drift", "tolerance"))
+        for pipeline, pattern in sorted(pipelines.items()):
+            if pipeline not in golden["pipelines"]:
+                print("{0:<16}no golden outputs".format(pipeline))
+                failed = True
+                continue
+            reference = golden["pipelines"][pipeline]
+            images = [image for image in files["images"] if fnmatch.fnmatch(os.path.basename(image), pattern)]
+            for mode in args.modes.split(","):
+                mode_settings = dict(settings)
+                if mode == "frames":
+                    # Convert the images (and their NIR partners and the background) to a frame store first
+                    mode_settings["frames"] = os.path.join(tmpdir, "frames")
+                    if not os.path.exists(mode_settings["frames"]):
+                        os.makedirs(mode_settings["frames"])
+                        nir = [nirpath for nirpath in pairing.index_pairs(files["images"]).values() if nirpath]
+                        background = [files["bg_SV"]] if files["bg_SV"] is not None else []
+                        frames.FrameStore(mode_settings["frames"]).add(files["images"] + nir + background)
+                records, seconds = run_mode(images, pipeline, mode_settings, mode)
+                drifts = compare(reference["images"], feature_rows(records, root))
+                over = sorted(name for name in drifts if drifts[name] > tolerance(tolerances, name))
+                failed = failed or len(over) > 0
+                print("{0:<16}{1:<12}{2:>10.4f}{3:>9.2f}x  {4:<32}".format(
+                    pipeline, mode, seconds, reference["seconds"] / seconds,
+                    "{0} of {1} features over tolerance".format(len(over), len(drifts))).rstrip())
+                for name in sorted(drifts):
+                    if args.all or drifts[name] > 0:
+                        print("{0:<48}  {1:<32}{2:>12.6f}{3:>12}{4}".format(
+                            "", name, drifts[name], tolerance(tolerances, name),
+                            "  FAIL" if name in over else ""))
+        if failed:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
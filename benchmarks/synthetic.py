@@ -0,0 +1,193 @@
+import csv
+import os
+import cv2
+import numpy as np
+
+# LemnaTec VIS and NIR frame sizes (rows, columns)
+VIS_SHAPE = (2056, 2454)
+NIR_SHAPE = (480, 640)
+
+# Images of each synthetic snapshot: (camera, frame, zoom, exposure)
+SNAPSHOT_VIEWS = [("SV", "0", "z1", "e82"), ("SV", "90", "z300", "e82"), ("TV", None, "z1", "e65")]
+
+# Pipelines run on synthetic data and the filename pattern of the VIS images each one processes
+PIPELINE_IMAGES = {
+    "lt1": "VIS_*.png",
+    "transect_z1": "VIS_SV_*_z1_*.png",
+    "transect_z300": "VIS_SV_*_z300_*.png"
+}
+
+# Gaussian HSV models (mean, standard deviation) used to generate synthetic Naive Bayes PDFs
+CLASS_MODELS = {
+    "plant": {"hue": (45, 8), "saturation": (150, 40), "value": (120, 40)},
+    "background": {"hue": (105, 20), "saturation": (40, 30), "value": (190, 40)}
+}
+
+
+def write_pdf_file(filename):
+    """Write a synthetic Naive Bayes PDF file in the format produced by the plantcv training script.
+
+    Inputs:
+    filename = output PDF file
+
+    :param filename: str
+    """
+    x = np.arange(256)
+    with open(filename, "w") as pf:
+        pf.write("\t".join(["class", "channel"] + [str(i) for i in x]) + "\n")
+        for class_name in sorted(CLASS_MODELS):
+            for channel in ["hue", "saturation", "value"]:
+                mean, sd = CLASS_MODELS[class_name][channel]
+                pdf = np.exp(-0.5 * ((x - mean) / float(sd)) ** 2)
+                pdf /= pdf.sum()
+                pf.write("\t".join([class_name, channel] + [repr(float(p)) for p in pdf]) + "\n")
+
+
+def vis_image(seed=0, shape=VIS_SHAPE, plant=True):
+    """Generate a synthetic side-view VIS frame: backdrop, pot and a plant.
+
+    Inputs:
+    seed  = random seed
+    shape = frame size (rows, columns)
+    plant = draw the plant (False gives a background frame)
+
+    Returns:
+    img   = BGR image
+
+    :param seed: int
+    :param shape: tuple
+    :param plant: bool
+    :return img: ndarray
+    """
+    rng = np.random.RandomState(seed)
+    rows, cols = shape
+    # Light backdrop with a vertical gradient
+    gradient = np.linspace(170, 215, rows).astype(np.uint8)[:, None]
+    img = np.dstack((gradient + np.zeros((rows, cols), dtype=np.uint8),) * 3)
+    img[:, :, 0] = np.clip(img[:, :, 0].astype(np.int16) + 15, 0, 255)
+    # Pot
+    cv2.rectangle(img, (cols // 2 - 200, int(rows * 0.66)), (cols // 2 + 200, rows - 1), (40, 40, 40), -1)
+    # Plant: stem and leaves
+    if plant:
+        center = cols // 2 + rng.randint(-50, 50)
+        top = int(rows * 0.2) + rng.randint(0, 200)
+        cv2.line(img, (center, int(rows * 0.66)), (center, top), (40, 140, 50), 18)
+        for leaf in range(8):
+            y = rng.randint(top, int(rows * 0.62))
+            length = rng.randint(150, 450)
+            angle = rng.uniform(-50, 50) + (180 if leaf % 2 else 0)
+            cv2.ellipse(img, (center, y), (length, 25), angle, 0, 180, (30 + leaf * 3, 150, 60), -1)
+    return _add_noise(img, rng)
+
+
+def tv_image(seed=0, shape=VIS_SHAPE, plant=True):
+    """Generate a synthetic top-view VIS frame: tray, pot and a rosette seen from above.
+
+    Inputs:
+    seed  = random seed
+    shape = frame size (rows, columns)
+    plant = draw the plant (False gives a background frame)
+
+    Returns:
+    img   = BGR image
+
+    :param seed: int
+    :param shape: tuple
+    :param plant: bool
+    :return img: ndarray
+    """
+    rng = np.random.RandomState(seed)
+    rows, cols = shape
+    img = np.zeros((rows, cols, 3), dtype=np.uint8)
+    img[:] = (205, 195, 190)
+    center = (cols // 2, rows // 2)
+    # Pot
+    cv2.circle(img, center, min(rows, cols) // 4, (40, 40, 40), -1)
+    # Plant: leaves radiating from the center
+    if plant:
+        for leaf in range(10):
+            angle = rng.uniform(0, 360)
+            length = rng.randint(150, 500)
+            cv2.ellipse(img, center, (length, 30), angle, 0, 180, (30 + leaf * 3, 150, 60), -1)
+    return _add_noise(img, rng)
+
+
+def nir_image(vis, shape=NIR_SHAPE):
+    """Generate the NIR partner of a VIS frame: a smaller grayscale frame, brighter where the plant is.
+
+    Inputs:
+    vis   = synthetic VIS image
+    shape = NIR frame size (rows, columns)
+
+    Returns:
+    nir   = grayscale image
+
+    :param vis: ndarray
+    :param shape: tuple
+    :return nir: ndarray
+    """
+    small = cv2.resize(vis, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+    # Leaves reflect strongly in the near infrared
+    return cv2.addWeighted(small[:, :, 1], 0.8, small[:, :, 2], 0.2, 20)
+
+
+def _add_noise(img, rng):
+    # Sensor noise
+    noise = rng.randint(-6, 7, size=img.shape)
+    return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def write_dataset(directory, snapshots=4, seed=0, shape=VIS_SHAPE):
+    """Write a synthetic LemnaTec export: snapshot directories of VIS/NIR pairs, SnapshotInfo.csv,
+    Naive Bayes PDFs and side-view and top-view background frames.
+
+    Inputs:
+    directory = output directory
+    snapshots = number of snapshots (each has SV z1, SV z300 and TV z1 images)
+    seed      = random seed
+    shape     = VIS frame size (rows, columns)
+
+    Returns:
+    files     = dictionary with the PDF file ("pdfs"), background frames ("bg_SV", "bg_TV") and VIS images
+                ("images")
+
+    :param directory: str
+    :param snapshots: int
+    :param seed: int
+    :param shape: tuple
+    :return files: dict
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    files = {"pdfs": os.path.join(directory, "naive_bayes_pdfs.txt"),
+             "bg_SV": os.path.join(directory, "background_SV.png"),
+             "bg_TV": os.path.join(directory, "background_TV.png"),
+             "images": []}
+    write_pdf_file(files["pdfs"])
+    cv2.imwrite(files["bg_SV"], vis_image(seed=seed, shape=shape, plant=False))
+    cv2.imwrite(files["bg_TV"], tv_image(seed=seed, shape=shape, plant=False))
+
+    image_id = 100000
+    with open(os.path.join(directory, "SnapshotInfo.csv"), "w") as sf:
+        writer = csv.writer(sf)
+        writer.writerow(["id", "plant barcode", "car tag", "timestamp", "measurement label", "treatment"])
+        for snapshot in range(snapshots):
+            snapshot_id = str(10000 + snapshot)
+            writer.writerow([snapshot_id, "Dp{0:05d}".format(snapshot % 8), str(snapshot),
+                             "2016-01-{0:02d} 10:00:00.000".format(1 + snapshot % 28), "synthetic",
+                             ["control", "drought"][snapshot % 2]])
+            snapshot_dir = os.path.join(directory, "snapshot" + snapshot_id)
+            if not os.path.exists(snapshot_dir):
+                os.makedirs(snapshot_dir)
+            for camera, frame, zoom, exposure in SNAPSHOT_VIEWS:
+                image_id += 1
+                if camera == "SV":
+                    vis = vis_image(seed=seed + image_id, shape=shape)
+                    name = "_".join([camera, frame, zoom, "h1", "g0", exposure, str(image_id)]) + ".png"
+                else:
+                    vis = tv_image(seed=seed + image_id, shape=shape)
+                    name = "_".join([camera, zoom, "h1", "g0", exposure, str(image_id)]) + ".png"
+                cv2.imwrite(os.path.join(snapshot_dir, "VIS_" + name), vis)
+                cv2.imwrite(os.path.join(snapshot_dir, "NIR_" + name), nir_image(vis))
+                files["images"].append(os.path.join(snapshot_dir, "VIS_" + name))
+    return files
@@ -0,0 +1 @@
+# Shared helpers for the Missouri transect image processing scripts
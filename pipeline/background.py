@@ -0,0 +1,178 @@
+import os
+import cv2
+import numpy as np
+import plantcv as pcv
+
+# OpenCV BackgroundSubtractorMOG defaults
+MOG_VAR_THRESHOLD = 2.5 * 2.5
+MOG_NOISE_SIGMA = 15.0
+# OpenCV BackgroundSubtractorMOG2 defaults
+MOG2_VAR_THRESHOLD = 16.0
+MOG2_VAR_INIT = 15.0
+MOG2_SHADOW_TAU = 0.5
+MOG2_SHADOW_VALUE = 127
+
+# Background models already learned by this process, keyed by (camera, zoom, background file)
+_models = {}
+
+
+class BackgroundModel(object):
+    """Background state learned from a single background frame.
+
+    The pipelines build a fresh MOG or MOG2 background subtractor for every image, apply it to the
+    background frame and then to the foreground frame. After one background frame each pixel holds a
+    single Gaussian with the background value as its mean and the initial variance, so the output for
+    the foreground frame only depends on the background and foreground pixel values. This class keeps
+    that learned state and reproduces the output of the second apply() with array operations, without
+    re-reading the background image or re-learning the model for each foreground image.
+    """
+
+    def __init__(self, bg_img):
+        self.shape = bg_img.shape
+        self.bg = bg_img.astype(np.float32)
+        # Squared norm of each background pixel (MOG2 shadow detection denominator)
+        self.bg_norm = np.sum(self.bg * self.bg, axis=2)
+        # Derived models (crops and downscaled copies), built on first use
+        self._derived = {}
+
+    def crop(self, window):
+        """Model of a window (x0, y0, x1, y1) of the background frame.
+
+        :param window: tuple
+        :return model: BackgroundModel
+        """
+        key = ("crop", tuple(window))
+        if key not in self._derived:
+            x0, y0, x1, y1 = window
+            self._derived[key] = BackgroundModel(self.bg[y0:y1, x0:x1])
+        return self._derived[key]
+
+    def scaled(self, scale):
+        """Model of the background frame downscaled by an integer factor (area interpolation).
+
+        :param scale: int
+        :return model: BackgroundModel
+        """
+        key = ("scaled", scale)
+        if key not in self._derived:
+            size = (max(self.shape[1] // scale, 1), max(self.shape[0] // scale, 1))
+            self._derived[key] = BackgroundModel(cv2.resize(self.bg, size, interpolation=cv2.INTER_AREA))
+        return self._derived[key]
+
+    def pixels(self, index):
+        """Model of a list of background pixels, shaped (n, 1, 3) like the foreground pixels it is applied to.
+
+        :param index: tuple
+        :return model: BackgroundModel
+        """
+        return BackgroundModel(self.bg[index][:, np.newaxis, :])
+
+    def channels(self):
+        """Background channels as separate contiguous arrays, and the mask of black background pixels.
+
+        :return channels: list
+        :return black: ndarray
+        """
+        if "channels" not in self._derived:
+            self._derived["channels"] = ([np.ascontiguousarray(self.bg[:, :, c]) for c in range(3)],
+                                         self.bg_norm == 0)
+        return self._derived["channels"]
+
+    def _distance(self, img):
+        diff = img.astype(np.float32) - self.bg
+        return np.sum(diff * diff, axis=2)
+
+    def mog(self, img, device, debug=None):
+        """Foreground mask from the MOG method; equivalent to pcv.background_subtraction.
+
+        Inputs:
+        img    = BGR foreground image
+        device = device counter
+        debug  = None, print, or plot. Print = save to file, Plot = print to screen.
+
+        Returns:
+        device = device number
+        fgmask = binary foreground mask
+
+        :param img: ndarray
+        :param device: int
+        :param debug: str
+        :return device: int
+        :return fgmask: ndarray
+        """
+        device += 1
+        # A pixel is background when it lies within the threshold of the learned Gaussian
+        var = np.float32(MOG_NOISE_SIGMA * MOG_NOISE_SIGMA * 4 * 3)
+        fgmask = np.zeros(self.shape[:2], dtype=np.uint8)
+        fgmask[self._distance(img) >= np.float32(MOG_VAR_THRESHOLD) * var] = 255
+
+        if debug == "print":
+            pcv.print_image(fgmask, str(device) + "_background_subtraction.png")
+        elif debug == "plot":
+            pcv.plot_image(fgmask, cmap="gray")
+
+        return device, fgmask
+
+    def mog2(self, img):
+        """Foreground mask from the MOG2 method, including shadow labels.
+
+        Equivalent to applying a new cv2.BackgroundSubtractorMOG2 to the background image and then
+        to img.
+
+        Inputs:
+        img    = BGR foreground image
+
+        Returns:
+        fgmask = foreground mask (255 = foreground, 127 = shadow)
+
+        :param img: ndarray
+        :return fgmask: ndarray
+        """
+        fg = img.astype(np.float32)
+        diff = fg - self.bg
+        dist2 = np.sum(diff * diff, axis=2)
+        threshold = np.float32(MOG2_VAR_THRESHOLD) * np.float32(MOG2_VAR_INIT)
+        foreground = dist2 >= threshold
+
+        # Shadow detection against the background Gaussian
+        numerator = np.sum(fg * self.bg, axis=2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            a = numerator / self.bg_norm
+            diff = a[:, :, np.newaxis] * self.bg - fg
+            dist2a = np.sum(diff * diff, axis=2)
+            shadow = (self.bg_norm > 0) & (numerator <= self.bg_norm) & \
+                     (numerator >= np.float32(MOG2_SHADOW_TAU) * self.bg_norm) & (dist2a < threshold * a * a)
+        # The background Gaussian holds too little weight to decide on its own, so the new Gaussian created
+        # for the foreground pixel is also tested; it matches unless the pixel is black. Detection stops
+        # early when the background pixel is black.
+        shadow |= (self.bg_norm > 0) & (np.sum(fg * fg, axis=2) > 0)
+
+        fgmask = np.zeros(self.shape[:2], dtype=np.uint8)
+        fgmask[foreground] = 255
+        fgmask[foreground & shadow] = MOG2_SHADOW_VALUE
+        return fgmask
+
+
+def get_model(bgfile, camera, zoom, debug=None):
+    """Return the background model for a camera and zoom level, learning it on first use.
+
+    Inputs:
+    bgfile = background image file
+    camera = camera (SV or TV)
+    zoom   = zoom level
+    debug  = None, print, or plot. Print = save to file, Plot = print to screen.
+
+    Returns:
+    model  = BackgroundModel
+
+    :param bgfile: str
+    :param camera: str
+    :param zoom: str
+    :param debug: str
+    :return model: BackgroundModel
+    """
+    key = (camera, zoom, os.path.abspath(bgfile))
+    if key not in _models:
+        bg_img, bg_path, bg_filename = pcv.readimage(filename=bgfile, debug=debug)
+        _models[key] = BackgroundModel(bg_img)
+    return _models[key]
@@ -0,0 +1,97 @@
+import glob
+import multiprocessing
+import os
+import sys
+import traceback
+
+
+def collect_images(directory=None, pattern=None, manifest=None, imgtype="VIS"):
+    """Build the list of images for a batch run.
+
+    Inputs:
+    directory = directory tree to search for images of type imgtype
+    pattern   = glob pattern of input images
+    manifest  = text file with one image path per line (blank lines and # comments are skipped)
+    imgtype   = image type prefix used to select images when searching a directory
+
+    Returns:
+    images    = sorted list of image paths
+
+    :param directory: str
+    :param pattern: str
+    :param manifest: str
+    :param imgtype: str
+    :return images: list
+    """
+    images = []
+    if directory is not None:
+        for root, dirs, files in os.walk(directory):
+            for name in files:
+                if name.split("_")[0] == imgtype and name.lower().endswith(".png"):
+                    images.append(os.path.join(root, name))
+    if pattern is not None:
+        images.extend(glob.glob(pattern))
+    if manifest is not None:
+        with open(manifest, "r") as mf:
+            for line in mf:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    images.append(line)
+    return sorted(set(images))
+
+
+def _call(args):
+    # Run the worker on one image and trap errors so one bad image does not stop the batch
+    worker, image = args
+    try:
+        return image, worker(image), None
+    except Exception:
+        return image, None, traceback.format_exc()
+
+
+def run_batch(images, worker, initializer=None, initargs=(), procs=None, chunksize=1, callback=None):
+    """Process images in a pool of persistent worker processes.
+
+    The initializer runs once in each worker, so expensive setup (imports, PDF files, background
+    models) is paid once per process instead of once per image.
+
+    Inputs:
+    images      = list of image paths
+    worker      = function called with each image path in a worker process
+    initializer = function run once when each worker starts
+    initargs    = arguments for the initializer
+    procs       = number of worker processes (default: number of CPUs)
+    chunksize   = number of images sent to a worker at a time
+    callback    = function called in this process with the return value of each successful worker call
+
+    Returns:
+    failed      = list of images that raised an error
+
+    :param images: list
+    :param worker: function
+    :param initializer: function
+    :param initargs: tuple
+    :param procs: int
+    :param chunksize: int
+    :param callback: function
+    :return failed: list
+    """
+    if procs is None:
+        procs = multiprocessing.cpu_count()
+    failed = []
+    pool = multiprocessing.Pool(processes=procs, initializer=initializer, initargs=initargs)
+    try:
+        for image, result, error in pool.imap_unordered(_call, [(worker, image) for image in images],
+                                                        chunksize=chunksize):
+            if error is not None:
+                failed.append(image)
+                sys.stderr.write("Error processing {0}:\n{1}".format(image, error))
+            elif callback is not None:
+                callback(result)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return failed
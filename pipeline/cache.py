@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+
+# Code version of cached results: bump with every change to the results of an unchanged image, profile and mode
+CACHE_VERSION = 4
+MANIFEST = "manifest.sqlite3"
+
+
+class ResultsCache(object):
+    """Content-addressed cache of per-image results records.
+
+    Each VIS image is stored under a key hashing everything its results depend on: the image and
+    NIR partner contents, image metadata, the resolved pipeline profile and execution mode, the PDF
+    or background file and the code version (CACHE_VERSION). A rerun looks up each image's key and
+    only processes images that are new or whose inputs changed. Records are committed as soon as
+    each image finishes, so a crashed batch resumes where it stopped. File hashes are remembered by
+    (size, modification time) so unchanged files are not read again.
+    """
+
+    def __init__(self, directory):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = sqlite3.connect(os.path.join(directory, MANIFEST))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                          "sha1 TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results (image TEXT PRIMARY KEY, key TEXT, records BLOB)")
+        self.conn.commit()
+
+    def digest(self, path):
+        """SHA-1 hash of a file's contents, reusing the stored hash when the file is unchanged.
+
+        :param path: str
+        :return sha1: str
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime, sha1 FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as fp:
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                sha1.update(block)
+        digest = sha1.hexdigest()
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                              (path, stat.st_size, stat.st_mtime, digest))
+        return digest
+
+    def key(self, image, metadata, profile, files):
+        """Cache key of an image.
+
+        Inputs:
+        image    = VIS image file
+        metadata = image metadata
+        profile  = resolved pipeline settings
+        files    = other input files the results depend on (NIR partner, PDF or background file)
+
+        Returns:
+        key      = SHA-1 hex digest
+
+        :param image: str
+        :param metadata: dict
+        :param profile: dict
+        :param files: list
+        :return key: str
+        """
+        parts = [str(CACHE_VERSION), json.dumps(metadata, sort_keys=True), json.dumps(profile, sort_keys=True),
+                 self.digest(image)]
+        parts.extend(self.digest(f) for f in files)
+        return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, image, key):
+        """Cached records of an image, or None when the image is new or its key changed.
+
+        :param image: str
+        :param key: str
+        :return records: list
+        """
+        row = self.conn.execute("SELECT key, records FROM results WHERE image = ?", (image,)).fetchone()
+        if row is None or row[0] != key:
+            return None
+        return pickle.loads(bytes(row[1]))
+
+    def put(self, image, key, records):
+        """Store the records of an image (per-run statistics are not cached).
+
+        :param image: str
+        :param key: str
+        :param records: list
+        """
+        records = [dict((k, v) for k, v in record.items() if k != "stats") for record in records]
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                              (image, key, sqlite3.Binary(pickle.dumps(records, protocol=2))))
+
+    def close(self):
+        self.conn.close()
+
+
+def result_settings(profile, args, outdir):
+    """Pipeline profile and run options that the results of an image depend on.
+
+    Inputs:
+    profile  = resolved pipeline settings
+    args     = parsed command-line options
+    outdir   = directory of the analysis images, or None when they are not written
+
+    Returns:
+    settings = profile with the output directory, crop settings and execution mode added
+
+    :param profile: dict
+    :param args: argparse.Namespace
+    :param outdir: str
+    :return settings: dict
+    """
+    # Analysis image paths are part of the results
+    settings = dict(profile, outdir=outdir)
+    if args.crop or args.coarse is not None:
+        # Cropped and coarse-to-fine segmentation may differ slightly from full-frame results
+        settings["crop"] = {"margin": args.crop_margin, "coarse": args.coarse}
+    # Reference, debug, lean, cached-background and NIR warp runs take other code paths, whose results may differ
+    settings["mode"] = {"reference": args.reference, "debug": args.debug is not None, "lean": args.lean,
+                        "cache_bg": args.cache_bg, "nir_warp": args.nir_warp}
+    return settings
@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+
+# 4-neighborhood of a pixel
+CROSS = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+
+
+def _outer_points(labels, label, x, y, w, h):
+    # Outer contour points of one component, as traced by pcv.find_objects, in frame coordinates
+    component = (labels[y:y + h, x:x + w] == label).astype(np.uint8)
+    contour = cv2.findContours(component, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[-2][0]
+    return contour.reshape(-1, 2) + (x, y)
+
+
+def roi_objects(mask, roi_contour, device):
+    """Objects of a mask partially inside a rectangular ROI; same result as pcv.find_objects followed by
+    pcv.roi_objects(roi_type="partial").
+
+    pcv.roi_objects tests and draws every contour of the mask one at a time, which is slow for noisy
+    masks with thousands of small objects. Here the objects are labeled once as connected components
+    and kept or dropped together from their bounding boxes: objects inside the ROI are kept (except
+    single pixels, which pcv.roi_objects never keeps) and objects outside it are dropped. Only the
+    few objects that cross the ROI border have their outer contour traced, to apply the contour point
+    test of pcv.roi_objects. As in pcv.roi_objects, objects inside holes of other objects and the
+    pixels bordering holes are removed. Only the kept mask is traced into contours.
+
+    Inputs:
+    mask        = binary mask of objects
+    roi_contour = ROI contour from pcv.define_roi(shape="rectangle")
+    device      = device counter
+
+    Returns:
+    device      = device number
+    kept_cnt    = contours of the kept objects
+    hierarchy   = contour hierarchy of the kept objects
+    kept_mask   = binary mask of the kept objects
+    obj_area    = area of the kept objects
+
+    :param mask: ndarray
+    :param roi_contour: list
+    :param device: int
+    :return device: int
+    :return kept_cnt: list
+    :return hierarchy: ndarray
+    :return kept_mask: ndarray
+    :return obj_area: int
+    """
+    device += 1
+    # ROI rectangle, inclusive (points on the ROI contour count as inside)
+    rx0, ry0, rw, rh = cv2.boundingRect(roi_contour[0])
+    rx1 = rx0 + rw - 1
+    ry1 = ry0 + rh - 1
+
+    # Label objects (8-connected, as traced by cv2.findContours) with their bounding boxes and areas
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8, ltype=cv2.CV_32S)
+    x0 = stats[:, cv2.CC_STAT_LEFT]
+    y0 = stats[:, cv2.CC_STAT_TOP]
+    x1 = x0 + stats[:, cv2.CC_STAT_WIDTH] - 1
+    y1 = y0 + stats[:, cv2.CC_STAT_HEIGHT] - 1
+    inside = (x0 >= rx0) & (x1 <= rx1) & (y0 >= ry0) & (y1 <= ry1)
+    crossing = (x0 <= rx1) & (x1 >= rx0) & (y0 <= ry1) & (y1 >= ry0) & ~inside
+
+    # A single-pixel contour has no points to test (pcv.roi_objects skips the last contour point)
+    keep = inside & (stats[:, cv2.CC_STAT_AREA] > 1)
+    # Label 0 is the background
+    keep[0] = False
+    crossing[0] = False
+    for label in np.flatnonzero(crossing):
+        points = _outer_points(labels=labels, label=label, x=x0[label], y=y0[label],
+                               w=stats[label, cv2.CC_STAT_WIDTH], h=stats[label, cv2.CC_STAT_HEIGHT])[:-1]
+        keep[label] = bool(np.any((points[:, 0] >= rx0) & (points[:, 0] <= rx1) &
+                                  (points[:, 1] >= ry0) & (points[:, 1] <= ry1)))
+
+    kept_mask = np.zeros(mask.shape[:2], dtype=np.uint8)
+    kept = np.flatnonzero(keep)
+    if len(kept) > 0:
+        # Work in the bounding box of the kept objects and of every object that may enclose one of them (its
+        # bounding box holds the kept object's box), plus a pixel for the background around them. Background
+        # that reaches the border of this window then also reaches the border of the frame.
+        bx0, by0, bx1, by1 = x0[kept].min(), y0[kept].min(), x1[kept].max(), y1[kept].max()
+        outer = (x0 <= bx1) & (x1 >= bx0) & (y0 <= by1) & (y1 >= by0) & ~((x0 >= bx0) & (x1 <= bx1) &
+                                                                           (y0 >= by0) & (y1 <= by1))
+        outer[0] = False
+        for label in np.flatnonzero(outer):
+            if np.any((x0[kept] >= x0[label]) & (x1[kept] <= x1[label]) & (y0[kept] >= y0[label]) &
+                      (y1[kept] <= y1[label])):
+                bx0, by0 = min(bx0, x0[label]), min(by0, y0[label])
+                bx1, by1 = max(bx1, x1[label]), max(by1, y1[label])
+        wx0 = max(bx0 - 1, 0)
+        wy0 = max(by0 - 1, 0)
+        wx1 = min(bx1 + 2, mask.shape[1])
+        wy1 = min(by1 + 2, mask.shape[0])
+        window_labels = labels[wy0:wy1, wx0:wx1]
+        objects = window_labels > 0
+        selected = keep[window_labels]
+
+        # Background connected to the outside of the window; the rest of the background is holes
+        padded = np.pad(objects.astype(np.uint8), 1, mode="constant")
+        cv2.floodFill(padded, None, (0, 0), 2, flags=4)
+        outside = padded[1:-1, 1:-1] == 2
+        holes = ~objects & ~outside
+        if holes.any():
+            # pcv.roi_objects erases every hole contour (the object pixels bordering a hole) and
+            # everything inside it, including objects in holes of other objects
+            touching = cv2.dilate(outside.astype(np.uint8), np.ones((3, 3), np.uint8), borderValue=1) > 0
+            top_level = np.zeros(count, dtype=bool)
+            top_level[window_labels[touching & objects]] = True
+            rims = cv2.dilate(holes.astype(np.uint8), CROSS) > 0
+            selected &= top_level[window_labels] & ~rims
+        kept_mask[wy0:wy1, wx0:wx1][selected] = 255
+
+    obj_area = cv2.countNonZero(kept_mask)
+    kept_cnt, hierarchy = cv2.findContours(np.copy(kept_mask), cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[-2:]
+    return device, kept_cnt, hierarchy, kept_mask, obj_area
@@ -0,0 +1,227 @@
+import cv2
+import numpy as np
+import plantcv as pcv
+from pipeline import background, frames, naive_bayes
+
+# Static masks and ROI windows already built by this process, keyed by frame shape and settings
+_masks = {}
+_windows = {}
+
+
+def roi_window(shape, roi_adj, margin):
+    """Bounding box of the pipeline ROI rectangle, widened by a margin and clipped to the frame.
+
+    Inputs:
+    shape   = frame shape
+    roi_adj = ROI adjustments of the profile (x_adj, y_adj, w_adj, h_adj)
+    margin  = pixels added on every side of the ROI
+
+    Returns:
+    window  = (x0, y0, x1, y1) in full-resolution coordinates
+
+    :param shape: tuple
+    :param roi_adj: dict
+    :param margin: int
+    :return window: tuple
+    """
+    key = (tuple(shape[:2]), tuple(sorted(roi_adj.items())), margin)
+    if key not in _windows:
+        # The same ROI the pipeline defines later, on a blank frame
+        device, roi, roi_hierarchy = pcv.define_roi(img=np.zeros(shape[:2] + (3,), dtype=np.uint8),
+                                                    shape="rectangle", device=0, roi=None, roi_input="default",
+                                                    debug=None, adjust=True, x_adj=roi_adj["x_adj"],
+                                                    y_adj=roi_adj["y_adj"], w_adj=roi_adj["w_adj"],
+                                                    h_adj=roi_adj["h_adj"])
+        x, y, w, h = cv2.boundingRect(np.vstack(roi))
+        _windows[key] = (max(x - margin, 0), max(y - margin, 0), min(x + w + margin, shape[1]),
+                         min(y + h + margin, shape[0]))
+    return _windows[key]
+
+
+def static_masks(shape, profile):
+    """Full-frame keep masks (255 = keep) of the profile's MOG2 and pot rectangle masks.
+
+    The masks are made by applying pcv.rectangle_mask to an all-white frame with the pipeline's
+    arguments, so cropping them reproduces rectangle_mask exactly (including rectangles that extend
+    past the frame).
+
+    Inputs:
+    shape   = frame shape
+    profile = pipeline settings
+
+    Returns:
+    masks   = dictionary with "mog2" and "pot" keep masks (None when the profile has no such mask)
+
+    :param shape: tuple
+    :param profile: dict
+    :return masks: dict
+    """
+    key = (tuple(shape[:2]), profile["name"])
+    if key not in _masks:
+        template = np.full(shape[:2], 255, dtype=np.uint8)
+        masks = {"mog2": None, "pot": None}
+        if profile["mog2"] is not None:
+            device, masks["mog2"], _, _, _ = pcv.rectangle_mask(img=template, p1=tuple(profile["mog2"]["mask_p1"]),
+                                                                p2=(shape[1], shape[0]), device=0, debug=None,
+                                                                color="black")
+        if profile["pot_mask"] is not None:
+            p1, p2 = profile["pot_mask"]
+            device, masks["pot"], _, _, _ = pcv.rectangle_mask(img=template, p1=tuple(p1), p2=tuple(p2), device=0,
+                                                               debug=None, color="black")
+        _masks[key] = masks
+    return _masks[key]
+
+
+def background_pixels(img, model, profile, masks):
+    """Foreground mask before median blur and fill, computed pixel by pixel.
+
+    MOG, MOG2, the shadow threshold and the rectangle masks only depend on each pixel, so this can be
+    applied to a crop, a downscaled frame or a list of pixels shaped (n, 1, 3).
+
+    Inputs:
+    img     = BGR pixels
+    model   = BackgroundModel of the same pixels
+    profile = pipeline settings
+    masks   = keep masks of the same pixels (see static_masks)
+
+    Returns:
+    fgmask  = binary foreground mask
+
+    :param img: ndarray
+    :param model: background.BackgroundModel
+    :param profile: dict
+    :param masks: dict
+    :return fgmask: ndarray
+    """
+    device, fgmask = model.mog(img=img, device=0)
+    if profile["mog2"] is not None:
+        # Shadow pixels (127) are removed by the threshold
+        fgmask2 = model.mog2(img=img)
+        fgmask2[fgmask2 <= profile["mog2"]["threshold"]] = 0
+        if masks["mog2"] is not None:
+            np.bitwise_and(fgmask2, masks["mog2"], out=fgmask2)
+        np.bitwise_or(fgmask, fgmask2, out=fgmask)
+    if masks["pot"] is not None:
+        np.bitwise_and(fgmask, masks["pot"], out=fgmask)
+    return fgmask
+
+
+def _crop_masks(masks, window):
+    x0, y0, x1, y1 = window
+    return dict((name, None if mask is None else mask[y0:y1, x0:x1]) for name, mask in masks.items())
+
+
+def small_size(shape, scale):
+    """Size (columns, rows) of a frame downscaled by an integer factor, for cv2.resize.
+
+    :param shape: tuple
+    :param scale: int
+    :return size: tuple
+    """
+    return max(shape[1] // scale, 1), max(shape[0] // scale, 1)
+
+
+def coarse_to_fine(img, classify, scale):
+    """Segment at reduced resolution, then reclassify full-resolution pixels near the mask boundary.
+
+    Inputs:
+    img      = BGR image
+    classify = function(pixels, index) returning the binary mask of pixels; index is None for the
+               downscaled frame, or the (rows, columns) of full-resolution pixels shaped (n, 1, 3)
+    scale    = downscaling factor
+
+    Returns:
+    mask     = binary mask at full resolution
+
+    :param img: ndarray
+    :param classify: function
+    :param scale: int
+    :return mask: ndarray
+    """
+    rows, cols = img.shape[:2]
+    small = cv2.resize(img, small_size(img.shape, scale), interpolation=cv2.INTER_AREA)
+    mask = cv2.resize(classify(small, None), (cols, rows), interpolation=cv2.INTER_NEAREST)
+    # Pixels within one coarse pixel of a boundary are classified again at full resolution
+    kernel = np.ones((2 * scale + 1, 2 * scale + 1), dtype=np.uint8)
+    band = np.nonzero(cv2.dilate(mask, kernel) != cv2.erode(mask, kernel))
+    if len(band[0]) > 0:
+        mask[band] = classify(img[band][:, np.newaxis, :], band)[:, 0]
+    return mask
+
+
+def segment_window(vis, metadata, profile, device, args):
+    """Segment only the ROI window of an image (optionally coarse-to-fine).
+
+    Per-pixel classification and median blur run on the window only. The caller fills the window
+    mask and places it in a full-frame mask, so later steps and features keep full-resolution
+    coordinates.
+
+    Inputs:
+    vis      = BGR image
+    metadata = image metadata
+    profile  = pipeline settings
+    device   = device counter
+    args     = pipeline options (crop_margin, coarse, cache_bg, bgimg, frames, pdfs, lut_cache)
+
+    Returns:
+    device   = device number
+    fgmask   = binary mask of the window
+    window   = (x0, y0, x1, y1) window in full-resolution coordinates
+
+    :param vis: ndarray
+    :param metadata: dict
+    :param profile: dict
+    :param device: int
+    :param args: argparse.Namespace
+    :return device: int
+    :return fgmask: ndarray
+    :return window: tuple
+    """
+    window = roi_window(shape=vis.shape, roi_adj=profile["roi"], margin=args.crop_margin)
+    x0, y0, x1, y1 = window
+    img = vis[y0:y1, x0:x1]
+
+    if profile["segmentation"] == "naive_bayes":
+        classes, lut = naive_bayes.get_lut(pdf_file=args.pdfs, cache_dir=args.lut_cache)
+
+        def classify(pixels, index):
+            return naive_bayes.lut_classifier(img=pixels, classes=classes, lut=lut, device=0)[1]["plant"]
+        device += 1
+        if args.coarse is None:
+            fgmask = classify(img, None)
+        else:
+            fgmask = coarse_to_fine(img=img, classify=classify, scale=args.coarse)
+    elif profile["segmentation"] == "background":
+        if not args.cache_bg and args.coarse is not None:
+            pcv.fatal_error("Coarse-to-fine segmentation requires a cached background model (--cache-bg)")
+        masks = _crop_masks(static_masks(shape=vis.shape, profile=profile), window)
+        if args.cache_bg:
+            model = background.get_model(bgfile=args.bgimg, camera=metadata["camera"],
+                                         zoom=metadata.get("zoom")).crop(window)
+        else:
+            bg_img = frames.read_cached(filename=args.bgimg, store=args.frames)
+            model = background.BackgroundModel(bg_img[y0:y1, x0:x1])
+        device += 1
+        if args.coarse is None:
+            fgmask = background_pixels(img=img, model=model, profile=profile, masks=masks)
+        else:
+            small_model = model.scaled(args.coarse)
+            size = (small_model.shape[1], small_model.shape[0])
+            small_masks = dict((name, None if mask is None else
+                                cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST))
+                               for name, mask in masks.items())
+
+            def classify(pixels, index):
+                if index is None:
+                    return background_pixels(img=pixels, model=small_model, profile=profile, masks=small_masks)
+                pixel_masks = dict((name, None if mask is None else mask[index][:, np.newaxis])
+                                   for name, mask in masks.items())
+                return background_pixels(img=pixels, model=model.pixels(index), profile=profile, masks=pixel_masks)
+            fgmask = coarse_to_fine(img=img, classify=classify, scale=args.coarse)
+
+        # Use median blur to remove the vertical pot lines
+        if profile["median_blur"] is not None:
+            device, fgmask = pcv.median_blur(img=fgmask, ksize=profile["median_blur"], device=device, debug=None)
+    else:
+        pcv.fatal_error("Unknown segmentation method: {0}".format(profile["segmentation"]))
+    return device, fgmask, window
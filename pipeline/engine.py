@@ -0,0 +1,899 @@
+import collections
+import copy
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import cv2
+import numpy as np
+import plantcv as pcv
+from pipeline import (background, batch, cache, components, crop, foreground, frames, histograms, instrument, lean,
+                      memory, naive_bayes, pairing, profiles, registration, sink, watch, writer)
+from pipeline.metadata import image_metadata, parse_filename
+
+# Options the pipeline scripts may leave out
+DEFAULT_OPTIONS = {
+    "image": None,
+    "dir": None,
+    "glob": None,
+    "manifest": None,
+    "procs": None,
+    "outdir": None,
+    "result": None,
+    "coresult": None,
+    "pdfs": None,
+    "lut_cache": naive_bayes.LUT_CACHE,
+    "bgimg": None,
+    "cache_bg": False,
+    "frames": None,
+    "profiles": profiles.PROFILES,
+    "writeimg": False,
+    "img_format": None,
+    "img_quality": None,
+    "img_every": 1,
+    "img_queue": 64,
+    "img_staging": None,
+    "img_sample": None,
+    "watch": False,
+    "poll": 2.0,
+    "settle": 10.0,
+    "partner_wait": 600.0,
+    "max_latency": 30.0,
+    "job_timeout": 600.0,
+    "status": None,
+    "lean": False,
+    "reference": False,
+    "crop": False,
+    "coarse": None,
+    "crop_margin": 100,
+    "nir_warp": None,
+    "stage_log": None,
+    "trace_alloc": False,
+    "cache": None,
+    "debug": None
+}
+
+
+def add_options(parser):
+    """Add the options shared by all pipeline scripts (inputs, outputs, modes, watch mode, timing and debug).
+
+    Inputs:
+    parser = argparse.ArgumentParser of the script
+
+    :param parser: argparse.ArgumentParser
+    """
+    parser.add_argument("-i", "--image", help="Input image file.", required=False)
+    parser.add_argument("-d", "--dir", help="Batch mode: directory of input VIS images.", required=False)
+    parser.add_argument("-g", "--glob", help="Batch mode: glob pattern of input VIS images.", required=False)
+    parser.add_argument("-m", "--manifest", help="Batch mode: file listing input VIS images, one per line.",
+                        required=False)
+    parser.add_argument("-n", "--procs", help="Batch mode: number of worker processes (default: all CPUs).",
+                        type=int, default=None)
+    parser.add_argument("-o", "--outdir", help="Output directory for image files.", required=False)
+    parser.add_argument("-r", "--result", help="Results file (.sqlite3 or .parquet for a results store).",
+                        required=False)
+    parser.add_argument("--frames", help="Frame store made by plantcv-frames.py; stored images are read from it "
+                        "instead of being decoded.", default=None)
+    parser.add_argument("-w", "--writeimg", help="write out images.", default=False, action="store_true")
+    parser.add_argument("--img-format", help="Re-encode analysis images in this format.", choices=["png", "jpg"],
+                        default=None)
+    parser.add_argument("--img-quality", help="JPEG quality (0-100) or PNG compression level (0-9) of analysis "
+                        "images.", type=int, default=None)
+    parser.add_argument("--img-every", help="Write analysis images of every Nth image only.", type=int, default=1)
+    parser.add_argument("--img-queue", help="Analysis images waiting to be moved to --outdir before processing "
+                        "waits.", type=int, default=64)
+    parser.add_argument("--img-staging", help="Local directory where analysis images are written before being moved "
+                        "to --outdir (default: a temporary directory).", default=None)
+    parser.add_argument("--reference", help="Reference mode: run the plantcv functions for every step (no fast "
+                        "paths), e.g. to record results that optimized modes are checked against.", default=False,
+                        action="store_true")
+    parser.add_argument("--lean", help="Lean mode: reuse mask buffers, skip copies and debug output.",
+                        default=False, action="store_true")
+    parser.add_argument("--crop", help="Segment only the ROI (plus a margin) instead of the full frame.",
+                        default=False, action="store_true")
+    parser.add_argument("--coarse", help="Coarse-to-fine segmentation of the ROI: classify at 1/N resolution, then "
+                        "reclassify pixels near object boundaries at full resolution (implies --crop).", type=int,
+                        default=None)
+    parser.add_argument("--crop-margin", help="Pixels added around the ROI in --crop and --coarse modes.", type=int,
+                        default=100)
+    parser.add_argument("--cache", help="Results cache directory; reruns only process new or changed images. A "
+                        "tab-delimited results file is rewritten with the results of all images, cached ones "
+                        "included; a SQLite or Parquet store only gets the results it does not hold yet.",
+                        default=None)
+    parser.add_argument("--watch", help="Watch mode: keep running, analyzing new images as they are written to "
+                        "--dir.", default=False, action="store_true")
+    parser.add_argument("--poll", help="Watch mode: seconds between checks for new files.", type=float, default=2.0)
+    parser.add_argument("--settle", help="Watch mode: seconds a file found by polling must stay unchanged before it "
+                        "is analyzed.", type=float, default=10.0)
+    parser.add_argument("--partner-wait", help="Watch mode: seconds to wait for the NIR partner of a VIS image.",
+                        type=float, default=600.0)
+    parser.add_argument("--max-latency", help="Watch mode: seconds results may be held before they are written to "
+                        "the results file.", type=float, default=30.0)
+    parser.add_argument("--job-timeout", help="Watch mode: seconds an image may take before it is counted as failed "
+                        "(e.g. when its worker was killed).", type=float, default=600.0)
+    parser.add_argument("--status", help="Watch mode: status file (JSON) with queue depth and throughput.",
+                        default=None)
+    parser.add_argument("--stage-log", help="Append per-stage timings of each image to this file (JSON lines) "
+                        "and print a summary.", default=None)
+    parser.add_argument("--trace-alloc", help="With --stage-log, also trace the peak Python allocation of each stage "
+                        "(tracemalloc; slows down the timed stages).", default=False, action="store_true")
+    parser.add_argument("-D", "--debug", help="Turn on debug, prints intermediate images.", default=None)
+
+
+def check_options(parser, args):
+    """Check the options added by add_options; exits with a usage error if they conflict.
+
+    Inputs:
+    parser = argparse.ArgumentParser of the script
+    args   = parsed options
+
+    :param parser: argparse.ArgumentParser
+    :param args: argparse.Namespace
+    """
+    inputs = [args.image, args.dir, args.glob, args.manifest]
+    if len([i for i in inputs if i is not None]) != 1:
+        parser.error("exactly one of --image, --dir, --glob or --manifest is required")
+    if args.watch and args.dir is None:
+        parser.error("--watch requires --dir")
+
+
+# Reusable mask buffers of this process (lean mode)
+_buffers = lean.Buffers()
+
+
+def segment(vis, metadata, profile, device, args, timer=None):
+    """Create the binary plant mask of a VIS image with the profile's segmentation method.
+
+    Inputs:
+    vis      = BGR image
+    metadata = image metadata
+    profile  = pipeline settings
+    device   = device counter
+    args     = pipeline options
+    timer    = instrument.StageTimer of the image (optional)
+
+    Returns:
+    device   = device number
+    mask     = binary plant mask
+
+    :param vis: ndarray
+    :param metadata: dict
+    :param profile: dict
+    :param device: int
+    :param args: argparse.Namespace
+    :param timer: instrument.StageTimer
+    :return device: int
+    :return mask: ndarray
+    """
+    if timer is None:
+        timer = instrument.StageTimer(image=None, enabled=False)
+
+    window = None
+    with timer.stage("segment"):
+        if args.crop or args.coarse is not None:
+            # Only the ROI window (plus a margin) is segmented
+            device, mask, window = crop.segment_window(vis=vis, metadata=metadata, profile=profile, device=device,
+                                                       args=args)
+        else:
+            device, mask = _classify(vis=vis, metadata=metadata, profile=profile, device=device, args=args)
+
+    # Fill in small objects
+    with timer.stage("fill"):
+        if profile["fill_size"] is not None and args.lean:
+            # The mask is owned by this function, so small objects are removed in place
+            device += 1
+            mask = lean.fill(mask=mask, size=profile["fill_size"], buffers=_buffers)
+        elif profile["fill_size"] is not None:
+            device, mask = pcv.fill(img=np.copy(mask), mask=np.copy(mask), size=profile["fill_size"],
+                                    device=device, debug=args.debug)
+
+    if window is not None:
+        # Place the window mask in a full-resolution frame so features keep full-frame coordinates
+        x0, y0, x1, y1 = window
+        full = np.zeros(vis.shape[:2], dtype=np.uint8)
+        full[y0:y1, x0:x1] = mask
+        mask = full
+    return device, mask
+
+
+def _classify(vis, metadata, profile, device, args):
+    # Initial plant mask from the profile's segmentation method
+    if profile["segmentation"] == "naive_bayes" and args.reference:
+        # Classify each pixel as plant or background (background and system components) from the PDFs
+        device, masks = pcv.naive_bayes_classifier(img=vis, pdf_file=args.pdfs, device=device, debug=args.debug)
+        mask = masks["plant"]
+    elif profile["segmentation"] == "naive_bayes":
+        # Classify each pixel as plant or background (background and system components)
+        classes, lut = naive_bayes.get_lut(pdf_file=args.pdfs, cache_dir=args.lut_cache)
+        if args.lean:
+            # Only the plant mask is needed; it is computed in this worker's reusable buffers
+            device += 1
+            mask = naive_bayes.lut_mask(img=vis, classes=classes, lut=lut, class_name="plant", buffers=_buffers)
+        else:
+            device, masks = naive_bayes.lut_classifier(img=vis, classes=classes, lut=lut, device=device,
+                                                       debug=args.debug)
+            mask = masks["plant"]
+    elif profile["segmentation"] == "background":
+        device, mask = subtract_background(vis=vis, metadata=metadata, profile=profile, device=device, args=args)
+    else:
+        pcv.fatal_error("Unknown segmentation method: {0}".format(profile["segmentation"]))
+    return device, mask
+
+
+def subtract_background(vis, metadata, profile, device, args):
+    """Foreground mask from MOG background subtraction, optionally combined with MOG2.
+
+    Inputs:
+    vis      = BGR image
+    metadata = image metadata
+    profile  = pipeline settings
+    device   = device counter
+    args     = pipeline options
+
+    Returns:
+    device   = device number
+    mask     = binary foreground mask
+
+    :param vis: ndarray
+    :param metadata: dict
+    :param profile: dict
+    :param device: int
+    :param args: argparse.Namespace
+    :return device: int
+    :return mask: ndarray
+    """
+    if args.lean:
+        # The whole chain in one pass, in this worker's reusable buffers (no debug output)
+        if args.cache_bg:
+            model = background.get_model(bgfile=args.bgimg, camera=metadata["camera"], zoom=metadata.get("zoom"))
+        else:
+            model = background.BackgroundModel(frames.read_cached(filename=args.bgimg, store=args.frames))
+        # Same device numbers as the steps of the chain
+        device += 1 + sum(1 for setting in ("pot_mask", "median_blur") if profile[setting] is not None)
+        if profile["mog2"] is not None:
+            device += 3
+        return device, foreground.foreground_mask(img=vis, model=model, profile=profile, buffers=_buffers)
+
+    if args.cache_bg:
+        # Reuse the background model learned for this camera and zoom level
+        model = background.get_model(bgfile=args.bgimg, camera=metadata["camera"], zoom=metadata.get("zoom"),
+                                     debug=args.debug)
+        device, fgmask = model.mog(img=vis, device=device, debug=args.debug)
+        if profile["mog2"] is not None:
+            fgmask2 = model.mog2(img=vis)
+    else:
+        if args.debug is None:
+            # The background frame is decoded once per process
+            bg_img = frames.read_cached(filename=args.bgimg, store=args.frames)
+        else:
+            bg_img, bg_path, bg_filename = pcv.readimage(filename=args.bgimg, debug=args.debug)
+        device, fgmask = pcv.background_subtraction(foreground_image=vis, background_image=bg_img, device=device,
+                                                    debug=args.debug)
+        if profile["mog2"] is not None:
+            bgsub = cv2.BackgroundSubtractorMOG2()
+            _ = bgsub.apply(bg_img)
+            fgmask2 = bgsub.apply(vis)
+
+    # The background subtraction MOG method misses plant areas that overlap dark background areas
+    # The MOG2 method captures these areas
+    if profile["mog2"] is not None:
+        # Threshold the MOG2 image to remove pixels labeled as shadow
+        device, fgmask2_thresh = pcv.binary_threshold(img=fgmask2, threshold=profile["mog2"]["threshold"],
+                                                      maxValue=255, object_type="light", device=device,
+                                                      debug=args.debug)
+        # Apply a rectangle mask to remove the corrugated lines on the pots of the MOG2 image
+        img_size = np.shape(vis)
+        device, fgmask2_masked, _, _, _ = pcv.rectangle_mask(img=fgmask2_thresh,
+                                                             p1=tuple(profile["mog2"]["mask_p1"]),
+                                                             p2=(img_size[1], img_size[0]), device=device,
+                                                             debug=args.debug, color="black")
+        # Add the MOG and MOG2 masks together
+        device, fgmask = pcv.logical_or(img1=fgmask2_masked, img2=fgmask, device=device, debug=args.debug)
+
+    # Mask the top of the pot (it's hard to get rid of otherwise)
+    if profile["pot_mask"] is not None:
+        p1, p2 = profile["pot_mask"]
+        device, fgmask, _, _, _ = pcv.rectangle_mask(img=fgmask, p1=tuple(p1), p2=tuple(p2), device=device,
+                                                     debug=args.debug, color="black")
+
+    # Use median blur to remove the vertical pot lines
+    if profile["median_blur"] is not None:
+        device, fgmask = pcv.median_blur(img=fgmask, ksize=profile["median_blur"], device=device, debug=args.debug)
+
+    return device, fgmask
+
+
+def image_dir(image, args):
+    """Directory the analysis images of an image are written to, or None when none are written.
+
+    With --writeimg and an image writer (see run), images are staged on local disk and moved to the
+    output directory in the background. With --img-every N only every Nth image of the batch is
+    selected.
+
+    :param image: str
+    :param args: argparse.Namespace
+    :return imgdir: str
+    """
+    if not args.writeimg or (args.img_sample is not None and image not in args.img_sample):
+        return None
+    if args.img_staging is not None:
+        return args.img_staging
+    return args.outdir
+
+
+def process_image(image, pipeline, args, pairs=None):
+    """Analyze one VIS image (and its NIR partner when the profile has NIR settings).
+
+    Inputs:
+    image    = VIS image file
+    pipeline = pipeline name
+    args     = pipeline options
+    pairs    = dictionary of VIS image to NIR image from pairing.index_pairs (optional)
+
+    Returns:
+    records  = list of results records (VIS, then NIR)
+
+    :param image: str
+    :param pipeline: str
+    :param args: argparse.Namespace
+    :param pairs: dict
+    :return records: list
+    """
+    memory.reset_peak_rss()
+    timer = instrument.StageTimer(image=image, enabled=args.stage_log is not None, trace_alloc=args.trace_alloc)
+    with timer.stage("total"):
+        records = analyze_image(image=image, pipeline=pipeline, args=args, timer=timer, pairs=pairs)
+
+    # Peak memory use and stage timings of this image (not written to the results)
+    records[0]["stats"] = {"peak_rss_kb": memory.peak_rss(), "stages": timer.stages}
+    return records
+
+
+def analyze_image(image, pipeline, args, timer, pairs=None):
+    """Run the pipeline stages on one VIS image, timing each stage.
+
+    Inputs:
+    image    = VIS image file
+    pipeline = pipeline name
+    args     = pipeline options
+    timer    = instrument.StageTimer of the image
+    pairs    = dictionary of VIS image to NIR image from pairing.index_pairs (optional)
+
+    Returns:
+    records  = list of results records (VIS, then NIR)
+
+    :param image: str
+    :param pipeline: str
+    :param args: argparse.Namespace
+    :param timer: instrument.StageTimer
+    :param pairs: dict
+    :return records: list
+    """
+    # Initialize device counter
+    device = 0
+
+    # Read in the input image
+    with timer.stage("readimage"):
+        vis, path, filename = frames.readimage(filename=image, debug=args.debug, store=args.frames)
+
+    # Select the pipeline settings for this camera and zoom level
+    with timer.stage("metadata"):
+        metadata = image_metadata(image)
+        if metadata["imgtype"] is None:
+            # Images that are not named like LemnaTec images are analyzed as VIS images with the default view
+            metadata["imgtype"] = "VIS"
+        profile = profiles.get_profile(profiles=profiles.load_profiles(args.profiles), pipeline=pipeline,
+                                       metadata=metadata)
+    if profile["imgname"] == "path":
+        imgname = image
+    else:
+        imgname = filename
+
+    # Start reading the NIR partner while the VIS image is analyzed
+    nir_read = None
+    if profile["nir"] is not None:
+        if pairs is None or image not in pairs:
+            pairs = pairing.index_pairs([image])
+        nirpath = pairs[image]
+        if nirpath is None:
+            pcv.fatal_error("No NIR image found for {0}".format(image))
+        if args.debug is None:
+            nir_read = pairing.Prefetch(frames.readimage, filename=nirpath, debug=None, store=args.frames)
+
+    # Segment the plant
+    device, mask = segment(vis=vis, metadata=metadata, profile=profile, device=device, args=args, timer=timer)
+
+    # Define a region of interest
+    roi_adj = profile["roi"]
+    device, roi, roi_hierarchy = pcv.define_roi(img=vis, shape="rectangle", device=device, roi=None,
+                                                roi_input="default", debug=args.debug, adjust=True,
+                                                x_adj=roi_adj["x_adj"], y_adj=roi_adj["y_adj"],
+                                                w_adj=roi_adj["w_adj"], h_adj=roi_adj["h_adj"])
+
+    if args.debug is None and not args.reference:
+        # Keep objects that overlap the ROI, labeled as connected components (no contours of the whole mask)
+        device += 1
+        with timer.stage("roi_objects"):
+            device, roi_objects, hierarchy, kept_mask, obj_area = components.roi_objects(mask=mask,
+                                                                                         roi_contour=roi,
+                                                                                         device=device)
+    else:
+        # Find contours
+        with timer.stage("find_objects"):
+            device, objects, obj_hierarchy = pcv.find_objects(img=vis, mask=mask, device=device, debug=args.debug)
+
+        # Keep contours that overlap the ROI
+        with timer.stage("roi_objects"):
+            device, roi_objects, hierarchy, kept_mask, obj_area = pcv.roi_objects(img=vis, roi_type="partial",
+                                                                                  roi_contour=roi,
+                                                                                  roi_hierarchy=roi_hierarchy,
+                                                                                  object_contour=objects,
+                                                                                  obj_hierarchy=obj_hierarchy,
+                                                                                  device=device,
+                                                                                  debug=args.debug)
+
+    # Combine remaining contours into a single object (the plant)
+    with timer.stage("object_composition"):
+        device, plant_obj, plant_mask = pcv.object_composition(img=vis, contours=roi_objects, hierarchy=hierarchy,
+                                                               device=device, debug=args.debug)
+
+    # Analyze the shape features of the plant object
+    imgdir = image_dir(image=image, args=args)
+    if imgdir is not None and imgdir == args.img_staging:
+        # Staged files of this image are moved to outdir together when its results are written
+        imgdir = writer.staging_dir(staging=imgdir, image=image)
+    if imgdir is not None:
+        outfile = os.path.join(imgdir, filename)
+    else:
+        outfile = False
+    tables = []
+    with timer.stage("analyze_object"):
+        device, shape_header, shape_data, shape_img = pcv.analyze_object(img=vis, imgname=imgname, obj=plant_obj,
+                                                                         mask=plant_mask, device=device,
+                                                                         debug=args.debug, filename=outfile)
+    tables.append((shape_header, shape_data, shape_img))
+
+    # Boundary line tool
+    if profile["line_position"] is not None:
+        with timer.stage("analyze_bound"):
+            device, boundary_header, boundary_data, boundary_img = pcv.analyze_bound(
+                img=vis, imgname=imgname, obj=plant_obj, mask=plant_mask, line_position=profile["line_position"],
+                device=device, debug=args.debug, filename=outfile)
+        tables.append((boundary_header, boundary_data, boundary_img))
+
+    # Analyze color
+    with timer.stage("analyze_color"):
+        if outfile or args.debug is not None or args.reference:
+            device, color_header, color_data, analysis_images = pcv.analyze_color(
+                img=vis, imgname=imgname, mask=plant_mask, bins=256, device=device, debug=args.debug,
+                hist_plot_type=None, pseudo_channel="v", pseudo_bkg="img", resolution=300, filename=outfile)
+        else:
+            # Same histograms in one pass over the plant pixels, without the pseudocolored image
+            device, color_header, color_data, analysis_images = histograms.analyze_color(img=vis, mask=plant_mask,
+                                                                                         bins=256, device=device)
+    tables.append((color_header, color_data, analysis_images))
+
+    records = [sink.make_record(image=image, metadata=metadata, tables=tables)]
+
+    if profile["nir"] is not None:
+        with timer.stage("nir"):
+            device, nir_record = process_nir(nirpath=nirpath, nir_read=nir_read, plant_mask=plant_mask,
+                                             profile=profile, device=device, args=args, imgdir=imgdir)
+        records.append(nir_record)
+    return records
+
+
+def process_nir(nirpath, nir_read, plant_mask, profile, device, args, imgdir=None):
+    """Map the VIS plant mask onto the NIR partner image and analyze it.
+
+    Inputs:
+    nirpath    = NIR image file
+    nir_read   = pairing.Prefetch reading the NIR image (None to read it here)
+    plant_mask = VIS plant mask
+    profile    = pipeline settings
+    device     = device counter
+    args       = pipeline options
+    imgdir     = directory for analysis images (None to write none)
+
+    Returns:
+    device     = device number
+    record     = NIR results record
+
+    :param nirpath: str
+    :param nir_read: pairing.Prefetch
+    :param plant_mask: ndarray
+    :param profile: dict
+    :param device: int
+    :param args: argparse.Namespace
+    :param imgdir: str
+    :return device: int
+    :return record: dict
+    """
+    settings = profile["nir"]
+
+    # The NIR partner was found when the VIS image was read (pcv.get_nir step)
+    device += 1
+    if nir_read is not None:
+        nir, nir_path, nir_filename = nir_read.result()
+    else:
+        nir, nir_path, nir_filename = frames.readimage(filename=nirpath, debug=args.debug, store=args.frames)
+    device, nir = pcv.rgb2gray(img=nir, device=device, debug=args.debug)
+    if settings["flip"] and args.lean:
+        # A vertical and a horizontal flip in one pass
+        device += 2
+        nir = cv2.flip(nir, -1)
+    elif settings["flip"]:
+        # The top-view camera needs to be rotated
+        device, nir = pcv.flip(img=nir, direction="vertical", device=device, debug=args.debug)
+        device, nir = pcv.flip(img=nir, direction="horizontal", device=device, debug=args.debug)
+
+    if args.nir_warp is not None and args.debug is None:
+        # Rescale and position the VIS plant mask on the NIR image in one pass (pcv.resize and
+        # pcv.crop_position_mask steps)
+        device += 2
+        newmask = registration.get_registration(vis_shape=plant_mask.shape, nir_shape=nir.shape,
+                                                settings=settings).warp(mask=plant_mask, interpolation=args.nir_warp)
+    else:
+        # Rescale the size of the VIS plant mask to fit on the smaller NIR image
+        device, nir_mask = pcv.resize(img=plant_mask, resize_x=settings["resize"], resize_y=settings["resize"],
+                                      device=device, debug=args.debug)
+
+        # Map the plant mask onto the NIR image
+        crop = settings["crop_position"]
+        device, newmask = pcv.crop_position_mask(img=nir, mask=nir_mask, device=device, x=crop["x"], y=crop["y"],
+                                                 v_pos=crop["v_pos"], h_pos=crop["h_pos"], debug=args.debug)
+
+    # In lean mode one color copy of the NIR image is shared by the plantcv functions below (none modify it)
+    nir_bgr = cv2.cvtColor(nir, cv2.COLOR_GRAY2BGR) if args.lean else None
+
+    def nir_color():
+        if nir_bgr is not None:
+            return nir_bgr
+        return cv2.cvtColor(nir, cv2.COLOR_GRAY2BGR)
+
+    # Identify contours
+    device, nir_objects, nir_hierarchy = pcv.find_objects(img=nir_color(), mask=newmask, device=device,
+                                                          debug=args.debug)
+
+    # Combine contours into a single object (plant)
+    device, nir_combined, nir_combinedmask = pcv.object_composition(img=nir_color(),
+                                                                    contours=nir_objects, hierarchy=nir_hierarchy,
+                                                                    device=device, debug=args.debug)
+
+    if imgdir is not None:
+        outfile = os.path.join(imgdir, nir_filename)
+    else:
+        outfile = False
+    tables = []
+    # Measure the NIR contour shape properties
+    device, nir_shape_header, nir_shape_data, nir_shape_img = pcv.analyze_object(
+        img=nir_color(), imgname=nir_filename, obj=nir_combined, mask=nir_combinedmask,
+        device=device, debug=args.debug, filename=outfile)
+    tables.append((nir_shape_header, nir_shape_data, nir_shape_img))
+
+    # Analyze NIR signal
+    if outfile or args.debug is not None or args.reference:
+        device, nhist_header, nhist_data, nir_imgs = pcv.analyze_NIR_intensity(img=nir,
+                                                                               rgbimg=nir_color(),
+                                                                               mask=nir_combinedmask, bins=256,
+                                                                               device=device, histplot=False,
+                                                                               debug=args.debug, filename=outfile)
+    else:
+        # Histogram of the plant pixels only, without the pseudocolored image
+        device, nhist_header, nhist_data, nir_imgs = histograms.analyze_nir_intensity(img=nir,
+                                                                                      mask=nir_combinedmask,
+                                                                                      bins=256, device=device)
+    tables.append((nhist_header, nhist_data, nir_imgs))
+
+    return device, sink.make_record(image=nirpath, metadata=image_metadata(nirpath), tables=tables)
+
+
+# Per-worker state for batch mode, set once when each worker process starts
+_pipeline = None
+_args = None
+_pairs = None
+
+
+def init_worker(pipeline, args, pairs=None):
+    global _pipeline, _args, _pairs
+    _pipeline = pipeline
+    _args = args
+    _pairs = pairs
+
+
+def batch_worker(image):
+    return process_image(image=image, pipeline=_pipeline, args=_args, pairs=_pairs)
+
+
+def init_stream_worker(pipeline, args):
+    # Interrupts stop the watching process, which lets running images finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    init_worker(pipeline, args)
+
+
+def stream_worker(task):
+    image, nirpath, write_images = task
+    args = _args
+    if not write_images:
+        args = copy.copy(_args)
+        args.writeimg = False
+    return process_image(image=image, pipeline=_pipeline, args=args, pairs={image: nirpath})
+
+
+def _uses_nir(pipeline, args):
+    # True when any view of the pipeline analyzes NIR partner images
+    settings = profiles.load_profiles(args.profiles).get(pipeline, {})
+    views = [settings] + list(settings.get("views", {}).values())
+    return any(view.get("nir") is not None for view in views)
+
+
+def _has_profile(pipeline, args, image):
+    # True for VIS images of a camera and zoom level the pipeline has settings for
+    name = os.path.basename(image)
+    if name.split("_")[0] != "VIS" or not name.lower().endswith(".png"):
+        return False
+    views = profiles.load_profiles(args.profiles).get(pipeline, {}).get("views", {})
+    return any(view in views for view in profiles.view_names(parse_filename(image)))
+
+
+def _cache_key(results_cache, image, pipeline, args, pairs):
+    # Cache key over everything the results of an image depend on
+    metadata = image_metadata(image)
+    profile = profiles.get_profile(profiles=profiles.load_profiles(args.profiles), pipeline=pipeline,
+                                   metadata=metadata)
+    files = []
+    if profile["nir"] is not None and pairs is not None and pairs.get(image) is not None:
+        files.append(pairs[image])
+    if profile["segmentation"] == "naive_bayes":
+        files.append(args.pdfs)
+    else:
+        files.append(args.bgimg)
+    settings = cache.result_settings(profile=profile, args=args,
+                                     outdir=args.outdir if image_dir(image=image, args=args) is not None else None)
+    return results_cache.key(image=image, metadata=metadata, profile=settings, files=files)
+
+
+def _prepare(args):
+    # Fill in options the script left out and compile the classifier lookup table before any workers start
+    for name, value in DEFAULT_OPTIONS.items():
+        if not hasattr(args, name):
+            setattr(args, name, value)
+    if args.reference:
+        # Reference mode runs the plantcv functions for every step (only --cache-bg and --frames are kept)
+        args.lean = False
+        args.crop = False
+        args.coarse = None
+        args.nir_warp = None
+    if args.lean:
+        # Lean mode skips all debug output
+        args.debug = None
+    if args.pdfs is not None:
+        naive_bayes.get_lut(pdf_file=args.pdfs, cache_dir=args.lut_cache)
+
+
+def _image_writer(args):
+    # Analysis images are written to local staging files by the workers and moved to outdir in the background
+    if not args.writeimg:
+        return None
+    images_out = writer.ImageWriter(outdir=args.outdir, staging=args.img_staging, img_format=args.img_format,
+                                    quality=args.img_quality, queue_size=args.img_queue)
+    args.img_staging = images_out.staging
+    return images_out
+
+
+def _record_writer(results, results_cache, keys, images_out, peaks, stages):
+    # Function writing the records of one image; results from all workers are written by this process only
+    def write(records):
+        if images_out is not None:
+            images_out.publish(records)
+        for record in records:
+            results.add(record)
+            if "stats" in record:
+                peaks.append(record["stats"]["peak_rss_kb"])
+                stages.add(record["stats"]["stages"])
+        if results_cache is not None:
+            results_cache.put(image=records[0]["image"], key=keys[records[0]["image"]], records=records)
+    return write
+
+
+def _report_peaks(peaks, args):
+    if len(peaks) > 0:
+        sys.stderr.write("Peak RSS per image ({0} mode): mean {1:.1f} MB, max {2:.1f} MB\n".format(
+            "lean" if args.lean else "standard", np.mean(peaks) / 1024.0, max(peaks) / 1024.0))
+
+
+def run(args, pipeline):
+    """Run a pipeline on a single image or a batch of images.
+
+    With a results cache, images whose inputs are unchanged since an earlier (possibly interrupted)
+    run are not processed again. Their cached results are written along with the new ones, except to
+    a results store (SQLite or Parquet) that already holds them.
+
+    Inputs:
+    args     = pipeline options (image or dir/glob/manifest, results path, PDF or background files, ...)
+    pipeline = pipeline name
+
+    :param args: argparse.Namespace
+    :param pipeline: str
+    """
+    _prepare(args)
+    if args.watch:
+        serve(args=args, pipeline=pipeline)
+        return
+
+    if args.image is not None:
+        images = [args.image]
+    else:
+        images = batch.collect_images(directory=args.dir, pattern=args.glob, manifest=args.manifest)
+    if args.writeimg and args.img_every > 1:
+        # Analysis images of every Nth image only
+        args.img_sample = set(images[::args.img_every])
+    # Pair VIS and NIR images with one directory listing per snapshot directory
+    pairs = None
+    if _uses_nir(pipeline, args):
+        pairs = pairing.index_pairs(images)
+
+    results_cache = None
+    keys = {}
+    if args.cache is not None:
+        results_cache = cache.ResultsCache(args.cache)
+
+    # Results from all workers are written by this process only
+    peaks = []
+    stages = instrument.StageLog(filename=args.stage_log)
+    images_out = _image_writer(args)
+    try:
+        # A cached run writes complete results, so an earlier tab-delimited file is replaced rather than appended to
+        with sink.open_sink(result=args.result, coresult=args.coresult,
+                            overwrite=results_cache is not None) as results:
+            write = _record_writer(results=results, results_cache=results_cache, keys=keys, images_out=images_out,
+                                   peaks=peaks, stages=stages)
+
+            if results_cache is not None:
+                todo = []
+                for image in images:
+                    keys[image] = _cache_key(results_cache=results_cache, image=image, pipeline=pipeline, args=args,
+                                             pairs=pairs)
+                    records = results_cache.get(image=image, key=keys[image])
+                    if records is None:
+                        todo.append(image)
+                    else:
+                        for record in records:
+                            if not results.stored(record["image"]):
+                                results.add(record)
+                sys.stderr.write("{0} of {1} images cached, {2} to process\n".format(
+                    len(images) - len(todo), len(images), len(todo)))
+                images = todo
+
+            if args.image is not None:
+                if len(images) > 0:
+                    write(process_image(image=args.image, pipeline=pipeline, args=args, pairs=pairs))
+            else:
+                failed = batch.run_batch(images=images, worker=batch_worker, initializer=init_worker,
+                                         initargs=(pipeline, args, pairs), procs=args.procs, callback=write)
+                if len(failed) > 0:
+                    pcv.fatal_error("{0} of {1} images failed".format(len(failed), len(images)))
+    finally:
+        if images_out is not None:
+            images_out.close()
+        stages.close()
+        if results_cache is not None:
+            results_cache.close()
+
+    _report_peaks(peaks, args)
+
+
+def serve(args, pipeline):
+    """Watch a LemnaTec export directory and analyze VIS images as the imaging system writes them.
+
+    New images are found with inotify (or by polling), grouped with their NIR partner and analyzed
+    by a pool of warm worker processes. Results are appended to the results store and flushed at
+    least every max_latency seconds. The status file reports queue depth, throughput and latency.
+    The process runs until it is interrupted (SIGINT or SIGTERM), then lets running images finish.
+    Images that take longer than job_timeout seconds are counted as failed: a pool worker that is
+    killed is replaced, but the result of its image never arrives.
+    With a results cache, images analyzed before a restart are skipped.
+
+    Inputs:
+    args     = pipeline options (dir, results path, PDF or background files, watch options, ...)
+    pipeline = pipeline name
+
+    :param args: argparse.Namespace
+    :param pipeline: str
+    """
+    if args.dir is None:
+        pcv.fatal_error("Watch mode requires a directory (--dir)")
+    watcher = watch.Watcher(root=args.dir, accept=lambda image: _has_profile(pipeline, args, image),
+                            uses_nir=_uses_nir(pipeline, args), settle=args.settle, partner_wait=args.partner_wait)
+    status = watch.Status(args.status)
+    sys.stderr.write("Watching {0} ({1})\n".format(args.dir, "inotify" if watcher.inotify is not None else "polling"))
+
+    results_cache = None
+    keys = {}
+    if args.cache is not None:
+        results_cache = cache.ResultsCache(args.cache)
+    procs = args.procs or multiprocessing.cpu_count()
+    peaks = []
+    stages = instrument.StageLog(filename=args.stage_log)
+    images_out = _image_writer(args)
+    pool = multiprocessing.Pool(processes=procs, initializer=init_stream_worker, initargs=(pipeline, args))
+    stop = []
+
+    def request_stop(signum, frame):
+        stop.append(signum)
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    # Images waiting for a worker, and running images with the time they were complete and their deadline
+    queued = collections.deque()
+    running = []
+    released = 0
+    try:
+        with sink.open_sink(result=args.result, coresult=args.coresult) as results:
+            write = _record_writer(results=results, results_cache=results_cache, keys=keys, images_out=images_out,
+                                   peaks=peaks, stages=stages)
+            last_flush = time.time()
+            unflushed = False
+            while len(stop) == 0 or len(running) > 0:
+                if len(stop) == 0:
+                    # Wait briefly while images are running so their results are written promptly
+                    for image, nirpath, since in watcher.poll(timeout=min(args.poll, 0.2) if running else args.poll):
+                        if results_cache is not None:
+                            keys[image] = _cache_key(results_cache=results_cache, image=image, pipeline=pipeline,
+                                                     args=args, pairs={image: nirpath})
+                            if results_cache.get(image=image, key=keys[image]) is not None:
+                                # Analyzed before a restart; its results are already in the store
+                                status.finished("cached", since)
+                                continue
+                        # Analysis images of every Nth image only
+                        queued.append((image, nirpath, released % args.img_every == 0, since))
+                        released += 1
+                else:
+                    # Stopping: queued images are analyzed after a restart
+                    queued.clear()
+                    time.sleep(0.2)
+
+                # Keep every worker busy without queueing all images in the pool
+                while len(queued) > 0 and len(running) < 2 * procs:
+                    image, nirpath, write_images, since = queued.popleft()
+                    task = (stream_worker, (image, nirpath, write_images))
+                    running.append((pool.apply_async(batch._call, (task,)), since, time.time() + args.job_timeout,
+                                    image))
+
+                now = time.time()
+                for job in [job for job in running if job[0].ready() or now >= job[2]]:
+                    running.remove(job)
+                    if not job[0].ready():
+                        sys.stderr.write("Error processing {0}: no result after {1} s\n".format(job[3],
+                                                                                              args.job_timeout))
+                        status.finished("failed", job[1])
+                        continue
+                    task, records, error = job[0].get()
+                    if error is not None:
+                        sys.stderr.write("Error processing {0}:\n{1}".format(task[0], error))
+                        status.finished("failed", job[1])
+                    else:
+                        write(records)
+                        status.finished("processed", job[1])
+                        unflushed = True
+
+                if unflushed and time.time() - last_flush >= args.max_latency:
+                    results.flush()
+                    last_flush = time.time()
+                    unflushed = False
+                status.write("stopping" if stop else "running", queued=len(queued), running=len(running),
+                             waiting_for_partner=len(watcher.waiting))
+        pool.close()
+        status.write("stopped", queued=0, running=0, waiting_for_partner=len(watcher.waiting))
+    finally:
+        pool.terminate()
+        pool.join()
+        watcher.close()
+        if images_out is not None:
+            images_out.close()
+        stages.close()
+        if results_cache is not None:
+            results_cache.close()
+    _report_peaks(peaks, args)
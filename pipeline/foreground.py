@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+from pipeline import background, crop
+
+# Rows of the frame processed at a time, so the per-pixel scratch arrays stay small and in cache
+STRIP_ROWS = 64
+# Squared-distance thresholds of the learned background Gaussians (see background.BackgroundModel)
+MOG_THRESHOLD = np.float32(background.MOG_VAR_THRESHOLD) * np.float32(background.MOG_NOISE_SIGMA *
+                                                                      background.MOG_NOISE_SIGMA * 4 * 3)
+MOG2_THRESHOLD = np.float32(background.MOG2_VAR_THRESHOLD) * np.float32(background.MOG2_VAR_INIT)
+
+# Boolean exclusion masks already built by this process, keyed by frame shape and profile
+_exclusions = {}
+
+
+def exclusion_masks(shape, profile):
+    """Static keep masks of a profile as booleans: MOG2 pixels kept (the MOG2 rectangle and the pot
+    rectangle combined) and MOG pixels kept (the pot rectangle).
+
+    Inputs:
+    shape   = frame shape
+    profile = pipeline settings
+
+    Returns:
+    masks   = dictionary with "mog2" and "pot" boolean keep masks (None when nothing is excluded)
+
+    :param shape: tuple
+    :param profile: dict
+    :return masks: dict
+    """
+    key = (tuple(shape[:2]), profile["name"])
+    if key not in _exclusions:
+        masks = crop.static_masks(shape=shape, profile=profile)
+        pot = None if masks["pot"] is None else masks["pot"] > 0
+        mog2 = None if masks["mog2"] is None else masks["mog2"] > 0
+        if pot is not None:
+            mog2 = pot if mog2 is None else mog2 & pot
+        _exclusions[key] = {"mog2": mog2, "pot": pot}
+    return _exclusions[key]
+
+
+def foreground_mask(img, model, profile, buffers):
+    """Foreground mask of the background segmentation chain in one pass over the frame.
+
+    Same result as MOG background subtraction, the MOG2 shadow threshold, the MOG2 rectangle mask,
+    logical_or, the pot rectangle mask and median blur (engine.subtract_background), without a new
+    full-frame array for each step. The squared distance to the background, which MOG and MOG2 both
+    threshold, is computed once per strip of rows in reused scratch buffers, and the rectangle masks
+    are precomputed per profile.
+
+    A MOG2 shadow (127) is any foreground pixel where neither the background nor the image pixel is
+    black (see background.BackgroundModel.mog2), so the shadow threshold only needs those two tests.
+
+    Inputs:
+    img     = BGR image
+    model   = background.BackgroundModel of the same frame
+    profile = pipeline settings
+    buffers = lean.Buffers of the worker
+
+    Returns:
+    fgmask  = binary foreground mask (a reused buffer, overwritten by the next call)
+
+    :param img: ndarray
+    :param model: background.BackgroundModel
+    :param profile: dict
+    :param buffers: lean.Buffers
+    :return fgmask: ndarray
+    """
+    rows, cols = img.shape[:2]
+    masks = exclusion_masks(shape=img.shape, profile=profile)
+    bg_channels, bg_black = model.channels()
+    mog2_min = None
+    if profile["mog2"] is not None and profile["mog2"]["threshold"] < 255:
+        # MOG2 values are 0, 127 (shadow) and 255; the threshold keeps values above it
+        mog2_min = 255 if profile["mog2"]["threshold"] >= background.MOG2_SHADOW_VALUE else 127
+
+    fgmask = buffers.get("fg_mask", (rows, cols))
+    # Scratch buffers of one strip
+    dist = buffers.get("fg_dist", (STRIP_ROWS, cols), np.float32)
+    diff = buffers.get("fg_diff", (STRIP_ROWS, cols), np.float32)
+    mog2 = buffers.get("fg_mog2", (STRIP_ROWS, cols), np.bool_)
+    dark = buffers.get("fg_dark", (STRIP_ROWS, cols))
+    for start in range(0, rows, STRIP_ROWS):
+        end = min(start + STRIP_ROWS, rows)
+        n = end - start
+        strip = img[start:end]
+        d = dist[:n]
+        t = diff[:n]
+
+        # Squared distance to the background pixel, summed over channels in the order of the model
+        np.subtract(strip[:, :, 0], bg_channels[0][start:end], out=d)
+        np.multiply(d, d, out=d)
+        for c in (1, 2):
+            np.subtract(strip[:, :, c], bg_channels[c][start:end], out=t)
+            np.multiply(t, t, out=t)
+            np.add(d, t, out=d)
+
+        # MOG foreground, written as a boolean into the output rows
+        fg = fgmask[start:end].view(np.bool_)
+        np.greater_equal(d, MOG_THRESHOLD, out=fg)
+
+        # MOG2 foreground above the shadow threshold, within the MOG2 rectangle
+        if mog2_min is not None:
+            m = mog2[:n]
+            np.greater_equal(d, MOG2_THRESHOLD, out=m)
+            if mog2_min == 255:
+                # Not a shadow: the background or the image pixel is black
+                k = dark[:n]
+                np.bitwise_or(strip[:, :, 0], strip[:, :, 1], out=k)
+                np.bitwise_or(k, strip[:, :, 2], out=k)
+                np.equal(k, 0, out=k.view(np.bool_))
+                np.logical_or(k.view(np.bool_), bg_black[start:end], out=k.view(np.bool_))
+                np.logical_and(m, k.view(np.bool_), out=m)
+            if masks["mog2"] is not None:
+                np.logical_and(m, masks["mog2"][start:end], out=m)
+            np.logical_or(fg, m, out=fg)
+
+        # Pot rectangle
+        if masks["pot"] is not None:
+            np.logical_and(fg, masks["pot"][start:end], out=fg)
+    fgmask *= 255
+
+    # Use median blur to remove the vertical pot lines
+    if profile["median_blur"] is not None:
+        blurred = buffers.get("fg_blur", (rows, cols))
+        cv2.medianBlur(fgmask, profile["median_blur"], dst=blurred)
+        fgmask = blurred
+    return fgmask
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import cv2
+import numpy as np
+import plantcv as pcv
+
+# Frame store index file and format version
+INDEX = "index.json"
+STORE_VERSION = 1
+# Decoded frames kept by read_cached (backgrounds and other frames used for many images)
+CACHE_SIZE = 8
+
+# Frame stores opened by this process and decoded frames of read_cached, keyed by file
+_stores = {}
+_frames = OrderedDict()
+
+
+def _signature(filename):
+    # Size and modification time of a file, to tell when a stored or cached frame is out of date
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime]
+
+
+def _decode(filename):
+    # Decode an image as pcv.readimage does
+    img = cv2.imread(filename)
+    if img is None:
+        pcv.fatal_error("Failed to open " + filename)
+    return img
+
+
+class FrameStore(object):
+    """Decoded frames of an experiment, stored uncompressed as memory-mapped .npy stacks.
+
+    Each snapshot directory has one stack per frame shape (e.g. all VIS frames of a snapshot in
+    snapshot123-<hash>/2056x2454x3.npy), and index.json maps each image file to its stack and row. Reading
+    a frame maps the stack instead of decoding the PNG. Mapped frames are copy-on-write, so a
+    pipeline step that modifies its input never changes the store. Images that changed since they
+    were stored are decoded from the file again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.images = {}
+        self.stacks = {}
+        index = os.path.join(directory, INDEX)
+        if os.path.exists(index):
+            with open(index, "r") as fp:
+                stored = json.load(fp)
+            if stored.get("version") != STORE_VERSION:
+                pcv.fatal_error("Frame store {0} has an unsupported version".format(directory))
+            self.images = stored["images"]
+
+    def get(self, filename):
+        """Stored frame of an image file, or None when the image is not stored or has changed.
+
+        :param filename: str
+        :return img: ndarray
+        """
+        entry = self.images.get(os.path.abspath(filename))
+        if entry is None:
+            return None
+        try:
+            if _signature(filename) != entry["signature"]:
+                return None
+        except OSError:
+            # The image file was removed after it was stored
+            pass
+        stack = self.stacks.get(entry["stack"])
+        if stack is None:
+            stack = np.load(os.path.join(self.directory, entry["stack"]), mmap_mode="c")
+            self.stacks[entry["stack"]] = stack
+        return np.asarray(stack[entry["row"]])
+
+    def add(self, images):
+        """Decode images into the store, one snapshot directory at a time.
+
+        The stacks of a snapshot directory are rewritten when any of its images is new or changed;
+        unchanged snapshots are skipped.
+
+        Inputs:
+        images = list of image files
+
+        Returns:
+        count  = number of images decoded
+
+        :param images: list
+        :return count: int
+        """
+        snapshots = {}
+        for image in images:
+            snapshots.setdefault(os.path.dirname(os.path.abspath(image)), []).append(os.path.abspath(image))
+        count = 0
+        for snapshot_dir in sorted(snapshots):
+            # Images of the snapshot already stored are kept in its stacks
+            members = set(snapshots[snapshot_dir])
+            members.update(image for image in self.images if os.path.dirname(image) == snapshot_dir and
+                           os.path.exists(image))
+            members = sorted(members)
+            if all(image in self.images and self.images[image]["signature"] == _signature(image)
+                   for image in members):
+                continue
+            count += self._write_snapshot(snapshot_dir, members)
+        self._write_index()
+        return count
+
+    def _write_snapshot(self, snapshot_dir, images):
+        # Stack the snapshot's frames by shape; each stack is written under a new name and then renamed
+        frames = OrderedDict()
+        for image in images:
+            img = _decode(image)
+            frames.setdefault(img.shape, []).append((image, img))
+        for image in [image for image in self.images if os.path.dirname(image) == snapshot_dir]:
+            del self.images[image]
+        # Snapshot directory name, made unique by a hash of its path
+        name = os.path.basename(snapshot_dir) + "-" + hashlib.sha1(snapshot_dir.encode("utf-8")).hexdigest()[:8]
+        if not os.path.exists(os.path.join(self.directory, name)):
+            os.makedirs(os.path.join(self.directory, name))
+        for shape, members in frames.items():
+            stack = os.path.join(name, "x".join(str(n) for n in shape) + ".npy")
+            self.stacks.pop(stack, None)
+            tmp = os.path.join(self.directory, stack + ".tmp")
+            with open(tmp, "wb") as fp:
+                np.save(fp, np.stack([img for image, img in members]))
+            os.rename(tmp, os.path.join(self.directory, stack))
+            for row, (image, img) in enumerate(members):
+                self.images[image] = {"stack": stack, "row": row, "signature": _signature(image)}
+        return len(images)
+
+    def _write_index(self):
+        tmp = os.path.join(self.directory, INDEX + ".tmp")
+        with open(tmp, "w") as fp:
+            json.dump({"version": STORE_VERSION, "images": self.images}, fp, sort_keys=True)
+        os.rename(tmp, os.path.join(self.directory, INDEX))
+
+
+def open_store(directory):
+    """Frame store of a directory, opened once per process.
+
+    :param directory: str
+    :return store: FrameStore
+    """
+    if directory not in _stores:
+        if not os.path.exists(os.path.join(directory, INDEX)):
+            pcv.fatal_error("{0} is not a frame store".format(directory))
+        _stores[directory] = FrameStore(directory)
+    return _stores[directory]
+
+
+def readimage(filename, debug=None, store=None):
+    """Read an image, from the frame store when it holds the image; same return values as pcv.readimage.
+
+    Inputs:
+    filename = image file
+    debug    = None, print, or plot. Print = save to file, Plot = print to screen.
+    store    = frame store directory (None to decode the file)
+
+    Returns:
+    img      = image
+    path     = directory of the image file
+    img_name = image filename
+
+    :param filename: str
+    :param debug: str
+    :param store: str
+    :return img: ndarray
+    :return path: str
+    :return img_name: str
+    """
+    if store is not None and debug is None:
+        img = open_store(store).get(filename)
+        if img is not None:
+            path, img_name = os.path.split(filename)
+            return img, path, img_name
+    return pcv.readimage(filename=filename, debug=debug)
+
+
+def read_cached(filename, store=None):
+    """Read an image used for many images (e.g. a background frame), decoding it once per process.
+
+    The same array is returned to every caller, so it must not be modified. A frame is decoded again
+    when its file changes; the last CACHE_SIZE frames are kept.
+
+    Inputs:
+    filename = image file
+    store    = frame store directory (None to decode the file)
+
+    Returns:
+    img      = image (shared with other callers)
+
+    :param filename: str
+    :param store: str
+    :return img: ndarray
+    """
+    key = os.path.abspath(filename)
+    signature = _signature(filename)
+    cached = _frames.pop(key, None)
+    if cached is None or cached[0] != signature:
+        img = readimage(filename=filename, store=store)[0]
+        cached = (signature, img)
+    _frames[key] = cached
+    while len(_frames) > CACHE_SIZE:
+        _frames.popitem(last=False)
+    return cached[1]
@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+# Histogram columns of pcv.analyze_color, in output order
+COLOR_HEADER = ('HEADER_HISTOGRAM', 'bin-number', 'bin-values', 'blue', 'green', 'red', 'lightness',
+                'green-magenta', 'blue-yellow', 'hue', 'saturation', 'value')
+NIR_HEADER = ('HEADER_HISTOGRAM', 'bin-number', 'bin-values', 'nir')
+
+
+def analyze_color(img, mask, bins, device):
+    """Color histograms of the masked pixels, with the header and data of pcv.analyze_color.
+
+    The masked pixels are gathered once and only those pixels (not the whole frame) are converted to
+    LAB and HSV and counted. No pseudocolored image is made; use pcv.analyze_color when analysis
+    images are written. Only 256 bins are supported (pcv.analyze_color scales channel values for
+    other bin counts).
+
+    Inputs:
+    img    = BGR image
+    mask   = binary mask of the object
+    bins   = number of histogram bins (256)
+    device = device counter
+
+    Returns:
+    device = device number
+    header = histogram header
+    data   = histogram data
+    images = analysis images (always empty)
+
+    :param img: ndarray
+    :param mask: ndarray
+    :param bins: int
+    :param device: int
+    :return device: int
+    :return header: tuple
+    :return data: tuple
+    :return images: list
+    """
+    if bins != 256:
+        raise RuntimeError("Fused color histograms support 256 bins only, not {0}".format(bins))
+    device += 1
+    # BGR, LAB and HSV values of the masked pixels, as one row of pixels
+    pixels = img.reshape(-1, 3).take(np.flatnonzero(mask), axis=0)[np.newaxis]
+    spaces = [pixels, cv2.cvtColor(pixels, cv2.COLOR_BGR2LAB), cv2.cvtColor(pixels, cv2.COLOR_BGR2HSV)]
+
+    # Same bins and ranges as pcv.analyze_color; no mask is needed as only masked pixels remain
+    hists = [cv2.calcHist([channels], [c], None, [bins], [0, (bins - 1)]).ravel()
+             for channels in spaces for c in range(3)]
+
+    bin_values = [l for l in np.arange(0, bins)]
+    data = tuple(['HISTOGRAM_DATA', bins, bin_values] + [[l for l in hist] for hist in hists])
+    return device, COLOR_HEADER, data, []
+
+
+def analyze_nir_intensity(img, mask, bins, device):
+    """NIR intensity histogram of the masked pixels, with the header and data of pcv.analyze_NIR_intensity.
+
+    Only the masked pixels are counted (pcv.analyze_NIR_intensity multiplies the whole frame by the
+    mask and counts non-zero values). No pseudocolored image is made.
+
+    Inputs:
+    img    = grayscale NIR image
+    mask   = binary mask of the object
+    bins   = number of histogram bins
+    device = device counter
+
+    Returns:
+    device = device number
+    header = histogram header
+    data   = histogram data
+    images = analysis images (always empty)
+
+    :param img: ndarray
+    :param mask: ndarray
+    :param bins: int
+    :param device: int
+    :return device: int
+    :return header: tuple
+    :return data: tuple
+    :return images: list
+    """
+    device += 1
+    if img.dtype == 'uint16':
+        maxval = 65536
+    else:
+        maxval = 256
+    # Zero-valued pixels are outside the histogram range, as in the masked frame
+    hist_nir, hist_bins = np.histogram(img.ravel().take(np.flatnonzero(mask)), bins, (1, maxval))
+    data = ('NIR_DATA', bins, [l for l in hist_bins[:-1]], [l for l in hist_nir])
+    return device, NIR_HEADER, data, []
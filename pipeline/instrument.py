@@ -0,0 +1,162 @@
+import heapq
+import json
+import os
+import random
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2: no allocation tracing
+    tracemalloc = None
+
+# Wall times sampled per stage for the percentiles of the summary, and the slowest images kept
+SAMPLE_SIZE = 10000
+SLOWEST = 5
+
+
+def _cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+class StageTimer(object):
+    """Wall time, CPU time and peak allocation of the named stages of one image.
+
+    When disabled every stage is a no-op, so the pipeline can always be written with timed stages.
+    Peak allocation is only traced when asked for (trace_alloc), as tracemalloc slows down every
+    allocation and so inflates the wall and CPU times. It covers allocations made through Python
+    (Python 3.9+), including numpy array data and the arrays OpenCV returns, but not the buffers
+    OpenCV allocates internally; it is None where not traced.
+    """
+
+    def __init__(self, image, enabled=True, trace_alloc=False):
+        self.image = image
+        self.enabled = enabled
+        self.stages = []
+        # Traced allocation at the start of each open stage and the highest peak seen inside it
+        self.open = []
+        self.trace = enabled and trace_alloc and tracemalloc is not None and hasattr(tracemalloc, "reset_peak")
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as a named stage; stages may be nested.
+
+        :param name: str
+        """
+        if not self.enabled:
+            yield
+            return
+        if self.trace:
+            if len(self.open) > 0:
+                # Keep the enclosing stage's peak before it is reset
+                self.open[-1][1] = max(self.open[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            self.open.append([current, current])
+        start_wall = default_timer()
+        start_cpu = _cpu_time()
+        try:
+            yield
+        finally:
+            stage = {"image": self.image, "stage": name, "wall_s": default_timer() - start_wall,
+                     "cpu_s": _cpu_time() - start_cpu, "peak_alloc_kb": None}
+            if self.trace:
+                start_alloc, peak = self.open.pop()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                stage["peak_alloc_kb"] = (peak - start_alloc) // 1024
+                if len(self.open) > 0:
+                    self.open[-1][1] = max(self.open[-1][1], peak)
+            self.stages.append(stage)
+
+
+class StageLog(object):
+    """Stage records of a run, written as JSON lines as they arrive and summarized at the end.
+
+    Records are not kept: the summary is built from per-stage totals, a sample of at most
+    SAMPLE_SIZE wall times per stage (for the 95th percentile) and the SLOWEST slowest images, so
+    memory use stays flat in long watch-mode runs.
+    """
+
+    def __init__(self, filename=None):
+        self.log = None
+        if filename is not None:
+            self.log = open(filename, "a")
+        self.totals = OrderedDict()
+        self.slowest = []
+        self.random = random.Random(0)
+
+    def add(self, stages):
+        for stage in stages:
+            if self.log is not None:
+                self.log.write(json.dumps(stage, sort_keys=True) + "\n")
+            self._aggregate(stage)
+        if self.log is not None:
+            self.log.flush()
+
+    def _aggregate(self, stage):
+        totals = self.totals.get(stage["stage"])
+        if totals is None:
+            totals = {"images": 0, "wall_s": 0.0, "max_s": 0.0, "cpu_s": 0.0, "peak_alloc_kb": None, "sample": []}
+            self.totals[stage["stage"]] = totals
+        totals["images"] += 1
+        totals["wall_s"] += stage["wall_s"]
+        totals["max_s"] = max(totals["max_s"], stage["wall_s"])
+        totals["cpu_s"] += stage["cpu_s"]
+        if stage["peak_alloc_kb"] is not None:
+            totals["peak_alloc_kb"] = max(totals["peak_alloc_kb"] or 0, stage["peak_alloc_kb"])
+        # Reservoir sample of the wall times
+        if len(totals["sample"]) < SAMPLE_SIZE:
+            totals["sample"].append(stage["wall_s"])
+        else:
+            i = self.random.randint(0, totals["images"] - 1)
+            if i < SAMPLE_SIZE:
+                totals["sample"][i] = stage["wall_s"]
+        if stage["stage"] == "total":
+            entry = (stage["wall_s"], stage["image"])
+            if len(self.slowest) < SLOWEST:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def summary(self, slowest=SLOWEST):
+        """Per-stage aggregate timings and the slowest images of the run.
+
+        Inputs:
+        slowest = number of slowest images to list (at most SLOWEST)
+
+        Returns:
+        lines   = summary lines
+
+        :param slowest: int
+        :return lines: list
+        """
+        lines = ["{0:<20}{1:>8}{2:>12}{3:>10}{4:>10}{5:>10}{6:>10}{7:>14}".format(
+            "stage", "images", "total_s", "mean_s", "p95_s", "max_s", "cpu_s", "peak_alloc_mb")]
+        for name, totals in self.totals.items():
+            if totals["peak_alloc_kb"] is not None:
+                peak = "{0:.1f}".format(totals["peak_alloc_kb"] / 1024.0)
+            else:
+                peak = "-"
+            lines.append("{0:<20}{1:>8}{2:>12.2f}{3:>10.3f}{4:>10.3f}{5:>10.3f}{6:>10.3f}{7:>14}".format(
+                name, totals["images"], totals["wall_s"], totals["wall_s"] / totals["images"],
+                np.percentile(totals["sample"], 95), totals["max_s"], totals["cpu_s"] / totals["images"], peak))
+
+        if len(self.slowest) > 0:
+            lines.append("Slowest images:")
+            for wall_s, image in sorted(self.slowest, reverse=True)[:slowest]:
+                lines.append("  {0:.3f} s  {1}".format(wall_s, image))
+        return lines
+
+    def close(self, stream=sys.stderr):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if len(self.totals) > 0:
+            stream.write("\n".join(self.summary()) + "\n")
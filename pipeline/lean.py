@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+
+
+class Buffers(object):
+    """Arrays reused by one worker process across images, allocated on first use."""
+
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        """Return the named buffer, reallocating it only when the shape or type changes.
+
+        Inputs:
+        name   = buffer name
+        shape  = array shape
+        dtype  = array data type
+
+        Returns:
+        buffer = uninitialized array
+
+        :param name: str
+        :param shape: tuple
+        :param dtype: numpy.dtype
+        :return buffer: ndarray
+        """
+        buffer = self.arrays.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.arrays[name] = buffer
+        return buffer
+
+
+def fill(mask, size, buffers):
+    """Remove small objects from a mask in place; same result as pcv.fill(img=np.copy(mask), mask=np.copy(mask)).
+
+    Contours are found on a reusable scratch copy (findContours may modify its input) and small objects
+    are erased directly in the mask, so no new full-frame arrays are allocated.
+
+    Inputs:
+    mask    = binary mask, modified in place
+    size    = objects with an area less than or equal to size are removed
+    buffers = Buffers of the worker
+
+    Returns:
+    mask    = filled mask
+
+    :param mask: ndarray
+    :param size: int
+    :param buffers: Buffers
+    :return mask: ndarray
+    """
+    scratch = buffers.get("fill", mask.shape)
+    np.copyto(scratch, mask)
+    objects = cv2.findContours(scratch, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[-2]
+    for cnt in objects:
+        if cv2.moments(cnt)["m00"] <= size:
+            cv2.fillPoly(mask, pts=cnt, color=(0, 0, 0))
+    return mask
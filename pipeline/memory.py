@@ -0,0 +1,33 @@
+import resource
+import sys
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size of this process to its current size (Linux only; no-op elsewhere)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as cr:
+            cr.write("5")
+    except (IOError, OSError):
+        pass
+
+
+def peak_rss():
+    """Peak resident set size of this process in kB (since the last reset_peak_rss on Linux).
+
+    Returns:
+    peak = peak resident set size (kB)
+
+    :return peak: int
+    """
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # Reported in bytes on macOS
+        peak //= 1024
+    return peak
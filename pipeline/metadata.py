@@ -0,0 +1,99 @@
+import csv
+import os
+
+# LemnaTec snapshot metadata file, one per experiment export (one snapshot<id> directory per snapshot)
+SNAPSHOT_INFO = "SnapshotInfo.csv"
+SNAPSHOT_FIELDS = {"plant barcode": "plantbarcode", "timestamp": "timestamp", "car tag": "cartag",
+                   "measurement label": "measurementlabel", "treatment": "treatment"}
+
+# Fields of LemnaTec image filenames
+FILENAME_FIELDS = ["imgtype", "camera", "frame", "zoom", "lifter", "gain", "exposure", "id"]
+
+# Snapshot metadata files already read by this process, with their modification times
+_snapshots = {}
+
+
+def parse_filename(filename):
+    """Parse image metadata from a LemnaTec image filename.
+
+    Side-view images are named imgtype_SV_angle_zoom_lifter_gain_exposure_id (e.g.
+    VIS_SV_90_z300_h1_g0_e82_117770.png) and top-view images imgtype_TV_zoom_lifter_gain_exposure_id.
+    Every field is None for other filenames, so that any image can still be analyzed with the default view
+    of a pipeline.
+
+    Inputs:
+    filename = image filename or path
+
+    Returns:
+    metadata = dictionary of imgtype, camera, frame, zoom, lifter, gain, exposure and id
+
+    :param filename: str
+    :return metadata: dict
+    """
+    metadata = dict((key, None) for key in FILENAME_FIELDS)
+    fields = os.path.splitext(os.path.basename(filename))[0].split("_")
+    if len(fields) < 3:
+        return metadata
+    camera = fields[1]
+    if camera == "SV":
+        frame = fields[2]
+        settings = fields[3:]
+    elif camera == "TV":
+        frame = "none"
+        settings = fields[2:]
+    else:
+        return metadata
+    if len(settings) == 0:
+        return metadata
+    metadata.update({"imgtype": fields[0], "camera": camera, "frame": frame})
+    for key, value in zip(["zoom", "lifter", "gain", "exposure", "id"], settings):
+        metadata[key] = value
+    return metadata
+
+
+def read_snapshot_info(filename):
+    """Read a LemnaTec SnapshotInfo.csv file.
+
+    The file is read again when it changes, as the imaging system adds snapshots during an experiment.
+
+    Inputs:
+    filename  = SnapshotInfo.csv file
+
+    Returns:
+    snapshots = dictionary of snapshot id to snapshot metadata (plantbarcode, timestamp, ...)
+
+    :param filename: str
+    :return snapshots: dict
+    """
+    mtime = os.path.getmtime(filename)
+    if filename not in _snapshots or _snapshots[filename][0] != mtime:
+        snapshots = {}
+        with open(filename, "r") as sf:
+            for row in csv.DictReader(sf):
+                snapshots[row["id"]] = dict((SNAPSHOT_FIELDS[key], value) for key, value in row.items()
+                                            if key in SNAPSHOT_FIELDS)
+        _snapshots[filename] = (mtime, snapshots)
+    return _snapshots[filename][1]
+
+
+def image_metadata(image):
+    """Metadata of an image: filename metadata plus snapshot metadata when the export has a SnapshotInfo.csv.
+
+    Inputs:
+    image    = image file in a LemnaTec snapshot<id> directory
+
+    Returns:
+    metadata = dictionary of metadata; snapshot fields are None when they are not available
+
+    :param image: str
+    :return metadata: dict
+    """
+    metadata = parse_filename(image)
+    for field in SNAPSHOT_FIELDS.values():
+        metadata[field] = None
+    snapshot_dir = os.path.dirname(os.path.abspath(image))
+    snapshot = os.path.basename(snapshot_dir)
+    info = os.path.join(os.path.dirname(snapshot_dir), SNAPSHOT_INFO)
+    if snapshot.startswith("snapshot") and os.path.exists(info):
+        metadata.update(read_snapshot_info(info).get(snapshot[len("snapshot"):], {}))
+    return metadata
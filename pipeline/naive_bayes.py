@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import tempfile
+import cv2
+import numpy as np
+
+# Default location of compiled classifier lookup tables
+LUT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "plantcv-missouri-transect")
+# Lookup table value for pixels that are not assigned to any class (ties)
+NO_CLASS = 255
+# Image rows classified at a time by lut_mask
+LUT_ROWS = 256
+
+# Lookup tables already loaded by this process, keyed by (PDF file, cache directory)
+_luts = {}
+
+
+def read_pdfs(pdf_file):
+    """Parse a Naive Bayes PDF file (output of the plantcv training script) into arrays.
+
+    Inputs:
+    pdf_file = tab-delimited PDF file (class, channel, 256 probability densities per row)
+
+    Returns:
+    pdfs     = dictionary of classes, each a dictionary of channel name to ndarray
+
+    :param pdf_file: str
+    :return pdfs: dict
+    """
+    pdfs = {}
+    with open(pdf_file, "r") as pf:
+        for row in pf:
+            cols = row.rstrip("\n").split("\t")
+            # Skip the header
+            if cols[0] == "class":
+                continue
+            if cols[0] not in pdfs:
+                pdfs[cols[0]] = {}
+            pdfs[cols[0]][cols[1]] = np.array([float(i) for i in cols[2:]], dtype=np.float64)
+    return pdfs
+
+
+def naive_bayes_classifier(img, pdfs, device, debug=None):
+    """Vectorized equivalent of pcv.naive_bayes_classifier that takes pre-parsed PDFs.
+
+    Inputs:
+    img    = BGR image
+    pdfs   = PDF dictionary returned by read_pdfs
+    device = device counter
+    debug  = None, print, or plot. Print = save to file, Plot = print to screen.
+
+    Returns:
+    device = device number
+    masks  = dictionary of binary masks, one per class
+
+    :param img: ndarray
+    :param pdfs: dict
+    :param device: int
+    :param debug: str
+    :return device: int
+    :return masks: dict
+    """
+    device += 1
+
+    h, s, v = cv2.split(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+
+    # Joint probability of each pixel for each class
+    px_p = {}
+    for class_name in pdfs:
+        px_p[class_name] = pdfs[class_name]["hue"][h] * pdfs[class_name]["saturation"][s] * \
+                           pdfs[class_name]["value"][v]
+
+    # A pixel belongs to a class when its probability is greater than that of every other class
+    masks = {}
+    for class_name in pdfs:
+        background_class = np.maximum.reduce([px_p[name] for name in pdfs if name != class_name])
+        masks[class_name] = np.zeros(h.shape, dtype=np.uint8)
+        masks[class_name][px_p[class_name] > background_class] = 255
+
+    _debug_masks(masks=masks, device=device, debug=debug)
+    return device, masks
+
+
+def _debug_masks(masks, device, debug):
+    # Debug output of the class masks, as written by pcv.naive_bayes_classifier. plantcv is imported here, as
+    # only debug output needs it: the classifiers and lookup tables work without it
+    if debug is None:
+        return
+    import plantcv as pcv
+    for class_name in masks:
+        if debug == "print":
+            pcv.print_image(masks[class_name], str(device) + "_naive_bayes_" + class_name + "_mask.jpg")
+        elif debug == "plot":
+            pcv.plot_image(masks[class_name], cmap="gray")
+
+
+def compile_lut(pdfs):
+    """Precompute the Naive Bayes class of every 8-bit BGR color.
+
+    Inputs:
+    pdfs    = PDF dictionary returned by read_pdfs
+
+    Returns:
+    classes = list of class names, in lookup table index order
+    lut     = ndarray of 2^24 class indices, indexed by (blue << 16) | (green << 8) | red
+
+    :param pdfs: dict
+    :return classes: list
+    :return lut: ndarray
+    """
+    classes = sorted(pdfs.keys())
+    if len(classes) > NO_CLASS:
+        raise RuntimeError("Too many classes for a lookup table: {0}".format(len(classes)))
+    lut = np.empty(256 ** 3, dtype=np.uint8)
+    # All green/red combinations for a single blue value
+    g, r = np.mgrid[0:256, 0:256].astype(np.uint8)
+    plane = np.dstack((np.zeros_like(g), g, r))
+    for b in range(256):
+        plane[:, :, 0] = b
+        h, s, v = cv2.split(cv2.cvtColor(plane, cv2.COLOR_BGR2HSV))
+        px_p = np.array([pdfs[c]["hue"][h] * pdfs[c]["saturation"][s] * pdfs[c]["value"][v] for c in classes])
+        # A color belongs to a class only when that class is strictly the most probable
+        best = np.argmax(px_p, axis=0)
+        unique = np.sum(px_p == px_p.max(axis=0), axis=0) == 1
+        lut[b * 65536:(b + 1) * 65536] = np.where(unique, best, NO_CLASS).ravel()
+    return classes, lut
+
+
+def load_lut(pdf_file, cache_dir=LUT_CACHE):
+    """Load the compiled lookup table for a PDF file, compiling and caching it on first use.
+
+    Tables are cached as .npy files keyed by the SHA-1 hash of the PDF file contents and are
+    opened memory-mapped, so all workers on a node share a single copy.
+
+    Inputs:
+    pdf_file  = Naive Bayes PDF file
+    cache_dir = directory of compiled lookup tables
+
+    Returns:
+    classes   = list of class names, in lookup table index order
+    lut       = read-only memory-mapped lookup table
+
+    :param pdf_file: str
+    :param cache_dir: str
+    :return classes: list
+    :return lut: ndarray
+    """
+    with open(pdf_file, "rb") as pf:
+        digest = hashlib.sha1(pf.read()).hexdigest()
+    lut_file = os.path.join(cache_dir, "naive_bayes_" + digest + ".npy")
+    classes_file = os.path.join(cache_dir, "naive_bayes_" + digest + ".json")
+
+    if not (os.path.exists(lut_file) and os.path.exists(classes_file)):
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # Another process created it first
+                pass
+        classes, lut = compile_lut(read_pdfs(pdf_file))
+        # Write to temporary files and rename so concurrent readers never see a partial table
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".npy")
+        with os.fdopen(fd, "wb") as tf:
+            np.save(tf, lut)
+        os.rename(tmp, lut_file)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".json")
+        with os.fdopen(fd, "w") as tf:
+            json.dump(classes, tf)
+        os.rename(tmp, classes_file)
+
+    with open(classes_file, "r") as cf:
+        classes = json.load(cf)
+    return classes, np.load(lut_file, mmap_mode="r")
+
+
+def get_lut(pdf_file, cache_dir=LUT_CACHE):
+    """Return the lookup table for a PDF file, loading it on first use in this process.
+
+    Inputs:
+    pdf_file  = Naive Bayes PDF file
+    cache_dir = directory of compiled lookup tables
+
+    Returns:
+    classes   = list of class names, in lookup table index order
+    lut       = read-only memory-mapped lookup table
+
+    :param pdf_file: str
+    :param cache_dir: str
+    :return classes: list
+    :return lut: ndarray
+    """
+    key = (os.path.abspath(pdf_file), cache_dir)
+    if key not in _luts:
+        _luts[key] = load_lut(pdf_file=pdf_file, cache_dir=cache_dir)
+    return _luts[key]
+
+
+def lut_classifier(img, classes, lut, device, debug=None):
+    """Classify pixels with a compiled lookup table; gives the same masks as naive_bayes_classifier.
+
+    Inputs:
+    img     = BGR image
+    classes = list of class names returned by load_lut
+    lut     = lookup table returned by load_lut
+    device  = device counter
+    debug   = None, print, or plot. Print = save to file, Plot = print to screen.
+
+    Returns:
+    device  = device number
+    masks   = dictionary of binary masks, one per class
+
+    :param img: ndarray
+    :param classes: list
+    :param lut: ndarray
+    :param device: int
+    :param debug: str
+    :return device: int
+    :return masks: dict
+    """
+    device += 1
+
+    index = img[:, :, 0].astype(np.uint32) << 16
+    index |= img[:, :, 1].astype(np.uint32) << 8
+    index |= img[:, :, 2]
+    labels = np.take(lut, index)
+
+    masks = {}
+    for i, class_name in enumerate(classes):
+        masks[class_name] = np.zeros(labels.shape, dtype=np.uint8)
+        masks[class_name][labels == i] = 255
+
+    _debug_masks(masks=masks, device=device, debug=debug)
+    return device, masks
+
+
+def lut_mask(img, classes, lut, class_name, buffers):
+    """Binary mask of one class, computed in preallocated buffers (lean mode, no debug output).
+
+    Inputs:
+    img        = BGR image
+    classes    = list of class names returned by load_lut
+    lut        = lookup table returned by load_lut
+    class_name = class to return the mask of
+    buffers    = lean.Buffers of the worker
+
+    Returns:
+    mask       = binary mask (a reused buffer, overwritten by the next call)
+
+    :param img: ndarray
+    :param classes: list
+    :param lut: ndarray
+    :param class_name: str
+    :param buffers: lean.Buffers
+    :return mask: ndarray
+    """
+    mask = buffers.get("nb_mask_" + class_name, img.shape[:2])
+    label = classes.index(class_name)
+    # Look up the table a strip of rows at a time so the index buffer stays small
+    width = img.shape[1]
+    for start in range(0, img.shape[0], LUT_ROWS):
+        strip = img[start:start + LUT_ROWS]
+        rows = strip.shape[0]
+        index = buffers.get("nb_index", (LUT_ROWS, width), np.uint32)[:rows]
+        np.copyto(index, strip[:, :, 0])
+        np.left_shift(index, 8, out=index)
+        np.bitwise_or(index, strip[:, :, 1], out=index)
+        np.left_shift(index, 8, out=index)
+        np.bitwise_or(index, strip[:, :, 2], out=index)
+        labels = mask[start:start + rows]
+        np.take(lut, index, out=labels)
+        np.equal(labels, label, out=labels.view(np.bool_))
+    mask *= 255
+    return mask
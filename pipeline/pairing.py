@@ -0,0 +1,91 @@
+import os
+import re
+import threading
+
+
+def match_nir(filename, names):
+    """Find the NIR partner of a VIS image among the files of its snapshot directory.
+
+    Uses the same rules as pcv.get_nir: top-view images pair with a top-view NIR image and side-view
+    images with the side-view NIR image of the same angle (the last match in directory order wins).
+
+    Inputs:
+    filename = VIS image filename
+    names    = filenames in the snapshot directory (os.listdir order)
+
+    Returns:
+    nirname  = NIR image filename (None when there is no partner)
+
+    :param filename: str
+    :param names: list
+    :return nirname: str
+    """
+    visname = filename.split("_")
+    if len(visname) < 3:
+        # Not a LemnaTec image name
+        return None
+    camera = visname[1].upper()
+    nirname = None
+    for name in names:
+        if re.search("NIR", name) is None:
+            continue
+        if camera == "TV" and re.search("TV", name) is not None:
+            nirname = name
+        elif camera == "SV" and re.search("SV", name) is not None:
+            if re.search("\\b" + str(visname[2]) + "\\b", name.split("_")[2]) is not None:
+                nirname = name
+    return nirname
+
+
+def index_pairs(images):
+    """Map VIS images to their NIR partners with one directory listing per snapshot directory.
+
+    Inputs:
+    images = list of VIS image paths
+
+    Returns:
+    pairs  = dictionary of VIS image path to NIR image path (None when there is no partner)
+
+    :param images: list
+    :return pairs: dict
+    """
+    listings = {}
+    pairs = {}
+    for image in images:
+        path, filename = os.path.split(image)
+        if path not in listings:
+            listings[path] = os.listdir(path or ".")
+        nirname = match_nir(filename, listings[path])
+        if nirname is None:
+            pairs[image] = None
+        else:
+            pairs[image] = os.path.join(path, nirname)
+    return pairs
+
+
+class Prefetch(object):
+    """Run a function (e.g. an image read) on a background thread; result() waits for it.
+
+    OpenCV releases the interpreter lock while decoding, so the read overlaps with work on the
+    calling thread.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        self.value = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(function, args, kwargs))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, function, args, kwargs):
+        try:
+            self.value = function(*args, **kwargs)
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        self.thread.join()
+        if self.error is not None:
+            # Raise the error of the background thread in the calling thread
+            raise self.error
+        return self.value
@@ -0,0 +1,98 @@
+import json
+import os
+import plantcv as pcv
+
+# Default pipeline profiles
+PROFILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles.json")
+
+# Settings a profile may leave out
+DEFAULTS = {
+    "segmentation": None,
+    "mog2": None,
+    "pot_mask": None,
+    "median_blur": None,
+    "fill_size": None,
+    "roi": None,
+    "line_position": None,
+    "nir": None,
+    "imgname": "filename"
+}
+
+# Profile files already read by this process
+_profiles = {}
+
+
+def load_profiles(filename=PROFILES):
+    """Read a pipeline profile file (JSON, or YAML when PyYAML is installed).
+
+    Each top-level entry is a pipeline. Settings given at the pipeline level apply to every view;
+    the "views" entry holds per-view overrides keyed by camera_zoom (e.g. SV_z300), camera (e.g. TV)
+    or default.
+
+    Inputs:
+    filename = profile file
+
+    Returns:
+    profiles = dictionary of pipelines
+
+    :param filename: str
+    :return profiles: dict
+    """
+    if filename not in _profiles:
+        with open(filename, "r") as pf:
+            if filename.endswith((".yaml", ".yml")):
+                import yaml
+                _profiles[filename] = yaml.safe_load(pf)
+            else:
+                _profiles[filename] = json.load(pf)
+    return _profiles[filename]
+
+
+def view_names(metadata):
+    """Views that may hold the settings for an image, most specific first.
+
+    Inputs:
+    metadata = image metadata returned by metadata.parse_filename
+
+    Returns:
+    views    = list of view names (camera_zoom, camera, default); only default when the filename has no camera
+
+    :param metadata: dict
+    :return views: list
+    """
+    if metadata["camera"] is None:
+        return ["default"]
+    return [metadata["camera"] + "_" + (metadata["zoom"] or ""), metadata["camera"], "default"]
+
+
+def get_profile(profiles, pipeline, metadata):
+    """Resolve the settings for one image from its pipeline and filename metadata.
+
+    Inputs:
+    profiles = dictionary of pipelines returned by load_profiles
+    pipeline = pipeline name
+    metadata = image metadata returned by metadata.parse_filename
+
+    Returns:
+    profile  = dictionary of settings
+
+    :param profiles: dict
+    :param pipeline: str
+    :param metadata: dict
+    :return profile: dict
+    """
+    if pipeline not in profiles:
+        pcv.fatal_error("Unknown pipeline: {0}".format(pipeline))
+    views = profiles[pipeline].get("views", {})
+    for view in view_names(metadata):
+        if view in views:
+            profile = dict(DEFAULTS)
+            profile.update((key, value) for key, value in profiles[pipeline].items() if key != "views")
+            profile.update(views[view])
+            profile["name"] = pipeline + ":" + view
+            return profile
+    if metadata["camera"] is None:
+        pcv.fatal_error("Pipeline {0} has no default settings for images that are not named like LemnaTec "
+                        "images".format(pipeline))
+    pcv.fatal_error("Pipeline {0} has no settings for {1} images at zoom {2}".format(
+        pipeline, metadata["camera"], metadata["zoom"]))
@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+import plantcv as pcv
+
+# Interpolations of the warp (--nir-warp). Bilinear samples the mask as pcv.resize does, so a NIR pixel is in the
+# mask when any VIS pixel around its sample point is, except where warpAffine rounds the sample position (a few
+# pixels per mask). Nearest-neighbor is faster but drops about 5% of the pixels at the plant edges.
+INTERPOLATIONS = {"bilinear": cv2.INTER_LINEAR, "nearest": cv2.INTER_NEAREST}
+# Registrations already calibrated by this process, keyed by frame shapes and NIR settings
+_registrations = {}
+
+
+class Registration(object):
+    """Affine map of VIS mask coordinates onto NIR image coordinates.
+
+    The pipelines map the VIS plant mask onto its NIR partner with pcv.resize (a fixed scale) and
+    pcv.crop_position_mask (a fixed translation with cropping and padding). Both only depend on the
+    frame sizes and the profile's NIR settings, so the combined map is calibrated once and applied
+    with a single cv2.warpAffine, straight into a NIR-sized mask. The map needs no NIR pixels, so the
+    NIR mask can be made wherever the VIS plant mask is.
+    """
+
+    def __init__(self, vis_shape, nir_shape, settings):
+        self.nir_shape = tuple(nir_shape[:2])
+        scale = settings["resize"]
+        crop = settings["crop_position"]
+
+        # Size of the resized mask, as made by pcv.resize
+        device, resized = pcv.resize(img=np.zeros(vis_shape[:2], dtype=np.uint8), resize_x=scale, resize_y=scale,
+                                     device=0)
+        rows, cols = resized.shape[:2]
+
+        # Position of the resized mask in the NIR frame: place masks that hold the row (column) index of
+        # each pixel in two base-255 digits, and read the index of the first row (column) that was kept
+        nir = np.zeros(self.nir_shape, dtype=np.uint8)
+        rows_index = np.arange(rows).reshape(-1, 1).repeat(cols, axis=1)
+        cols_index = np.arange(cols).reshape(1, -1).repeat(rows, axis=0)
+        placed = [pcv.crop_position_mask(img=nir, mask=(digit + 1).astype(np.uint8), device=0, x=crop["x"],
+                                         y=crop["y"], v_pos=crop["v_pos"], h_pos=crop["h_pos"])[1]
+                  for index in (rows_index, cols_index) for digit in (index % 255, index // 255)]
+        kept = np.nonzero(placed[0])
+        self.empty = len(kept[0]) == 0
+        if self.empty:
+            offset_y = offset_x = 0
+        else:
+            y, x = kept[0][0], kept[1][0]
+            offset_y = y - ((int(placed[1][y, x]) - 1) * 255 + int(placed[0][y, x]) - 1)
+            offset_x = x - ((int(placed[3][y, x]) - 1) * 255 + int(placed[2][y, x]) - 1)
+
+        # NIR pixel (x, y) samples the VIS mask where pcv.resize samples resized pixel (x - offset_x, y - offset_y)
+        self.matrix = np.array([[1.0 / scale, 0.0, (0.5 - offset_x) / scale - 0.5],
+                                [0.0, 1.0 / scale, (0.5 - offset_y) / scale - 0.5]])
+
+    def warp(self, mask, interpolation="bilinear"):
+        """VIS mask mapped onto the NIR frame.
+
+        Inputs:
+        mask          = VIS binary mask
+        interpolation = bilinear or nearest
+
+        Returns:
+        nir_mask      = mask in NIR coordinates
+
+        :param mask: ndarray
+        :param interpolation: str
+        :return nir_mask: ndarray
+        """
+        if self.empty:
+            return np.zeros(self.nir_shape, dtype=np.uint8)
+        return cv2.warpAffine(mask, self.matrix, (self.nir_shape[1], self.nir_shape[0]),
+                              flags=INTERPOLATIONS[interpolation] | cv2.WARP_INVERSE_MAP,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+
+def get_registration(vis_shape, nir_shape, settings):
+    """Registration of VIS masks of one frame size onto NIR frames of one size, calibrated on first use.
+
+    Inputs:
+    vis_shape = VIS frame shape
+    nir_shape = NIR frame shape
+    settings  = NIR settings of the profile (resize, crop_position)
+
+    Returns:
+    registration = Registration
+
+    :param vis_shape: tuple
+    :param nir_shape: tuple
+    :param settings: dict
+    :return registration: Registration
+    """
+    crop = settings["crop_position"]
+    key = (tuple(vis_shape[:2]), tuple(nir_shape[:2]), settings["resize"], crop["x"], crop["y"], crop["v_pos"],
+           crop["h_pos"])
+    if key not in _registrations:
+        _registrations[key] = Registration(vis_shape=vis_shape, nir_shape=nir_shape, settings=settings)
+    return _registrations[key]
@@ -0,0 +1,216 @@
+import csv
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from pipeline.sink import _quote
+
+# Columns that identify a snapshot; columns whose names start with these are not prefixed
+ID_COLUMNS = ["timestamp", "treatment", "measurementlabel", "plantbarcode"]
+# Columns per statistics query (SQLite limits the number of result columns)
+STATS_BATCH = 500
+
+
+def snapshot_prefix(camera, frame):
+    """Column prefix of an image in the snapshot table (e.g. sv0_, sv90_, tv0_).
+
+    Inputs:
+    camera = camera (SV or TV)
+    frame  = side-view angle ("none" for top-view images)
+
+    Returns:
+    prefix = column prefix
+
+    :param camera: str
+    :param frame: str
+    :return prefix: str
+    """
+    if frame == "none":
+        frame = "0"
+    return camera.lower() + str(frame) + "_"
+
+
+def _is_id(column):
+    return any(column.startswith(name) for name in ID_COLUMNS)
+
+
+def column_stats(conn, columns):
+    """Number of distinct values (NULL counts as a value) and storage class of each VIS results column.
+
+    Inputs:
+    conn    = SQLite connection to a results database
+    columns = columns of metadata NATURAL JOIN features
+
+    Returns:
+    stats   = dictionary of column to (distinct values, True when any value is text)
+
+    :param conn: sqlite3.Connection
+    :param columns: list
+    :return stats: dict
+    """
+    stats = {}
+    for start in range(0, len(columns), STATS_BATCH):
+        batch = columns[start:start + STATS_BATCH]
+        select = ", ".join("COUNT(DISTINCT {0}) + MAX({0} IS NULL), MAX(typeof({0}) = 'text')".format(_quote(c))
+                           for c in batch)
+        row = conn.execute("SELECT " + select + " FROM metadata NATURAL JOIN features "
+                           "WHERE imgtype = 'VIS'").fetchone()
+        for i, column in enumerate(batch):
+            stats[column] = (row[2 * i] or 0, bool(row[2 * i + 1]))
+    return stats
+
+
+def snapshot_chunks(conn, chunksize):
+    """Read VIS results ordered by timestamp in chunks that always hold complete snapshots.
+
+    Inputs:
+    conn      = SQLite connection to a results database
+    chunksize = approximate number of image rows per chunk
+
+    Returns:
+    chunks    = generator of DataFrames
+
+    :param conn: sqlite3.Connection
+    :param chunksize: int
+    :return chunks: generator
+    """
+    carry = None
+    for chunk in pd.read_sql_query("SELECT * FROM metadata NATURAL JOIN features WHERE imgtype = 'VIS' "
+                                   "ORDER BY timestamp, image_id", conn, chunksize=chunksize):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        # The last snapshot may continue in the next chunk
+        last = chunk["timestamp"].iloc[-1]
+        complete = chunk["timestamp"] != last
+        carry = chunk[~complete]
+        if complete.any():
+            yield chunk[complete]
+    if carry is not None and len(carry) > 0:
+        yield carry
+
+
+def pivot_snapshots(images, id_columns, value_columns, prefixes):
+    """Reshape image rows into one row per snapshot, prefixing value columns with the camera and frame.
+
+    Inputs:
+    images        = DataFrame of VIS image results (one row per image)
+    id_columns    = snapshot columns kept once per row
+    value_columns = columns repeated for each image of a snapshot
+    prefixes      = all column prefixes, in output order
+
+    Returns:
+    snapshots     = DataFrame with one row per timestamp
+
+    :param images: pandas.DataFrame
+    :param id_columns: list
+    :param value_columns: list
+    :param prefixes: list
+    :return snapshots: pandas.DataFrame
+    """
+    images = images.copy()
+    images.loc[images["frame"] == "none", "frame"] = "0"
+    images["prefix"] = images["camera"].str.lower() + images["frame"].astype(str) + "_"
+    # A later image of the same view in a snapshot replaces an earlier one
+    images = images.drop_duplicates(subset=["timestamp", "prefix"], keep="last")
+
+    ids = images.groupby("timestamp", sort=True)[[c for c in id_columns if c != "timestamp"]].first()
+    wide = images.set_index(["timestamp", "prefix"])[value_columns].unstack("prefix")
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([value_columns, prefixes]))
+    wide.columns = [prefix + column for column, prefix in wide.columns]
+    order = [prefix + column for prefix in prefixes for column in value_columns]
+    snapshots = ids.join(wide[order], how="outer").reset_index()
+    return snapshots
+
+
+def reshape_results(database, outfile, chunksize=10000):
+    """Write the snapshot table (one row per timestamp) of a results database as CSV or Parquet.
+
+    Equivalent to the reshaping step of plantcv2R.R: VIS results are joined with their metadata,
+    columns with a single value are dropped and the images of each snapshot are merged into one row
+    with sv<angle>_/tv0_ column prefixes. The database is read in chunks of complete snapshots. Unlike
+    plantcv2R.R, CSV cells that hold commas (histograms) are quoted.
+
+    Inputs:
+    database  = SQLite results database
+    outfile   = output file (.parquet for Parquet, otherwise CSV)
+    chunksize = approximate number of image rows held in memory
+
+    Returns:
+    rows      = number of snapshot rows written
+
+    :param database: str
+    :param outfile: str
+    :param chunksize: int
+    :return rows: int
+    """
+    if not os.path.exists(database):
+        raise RuntimeError("Results database {0} does not exist".format(database))
+    conn = sqlite3.connect(database)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(metadata)")]
+    columns += [row[1] for row in conn.execute("PRAGMA table_info(features)") if row[1] not in columns]
+
+    # Remove features with no data (a single value, or no value, across all VIS images)
+    stats = column_stats(conn, columns)
+    kept = [c for c in columns if stats[c][0] != 1]
+    id_columns = [c for c in kept if _is_id(c)]
+    if "timestamp" not in id_columns:
+        id_columns.insert(0, "timestamp")
+    value_columns = [c for c in kept if not _is_id(c)]
+    prefixes = sorted(set(snapshot_prefix(camera, frame) for camera, frame in
+                          conn.execute("SELECT DISTINCT camera, frame FROM metadata WHERE imgtype = 'VIS'")))
+
+    pa = None
+    if outfile.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Writing Parquet output requires pyarrow")
+
+    writer = None
+    rows = 0
+    try:
+        for images in snapshot_chunks(conn, chunksize):
+            snapshots = pivot_snapshots(images=images, id_columns=id_columns, value_columns=value_columns,
+                                        prefixes=prefixes)
+            if pa is not None:
+                if writer is None:
+                    schema = _parquet_schema(pa, snapshots.columns, id_columns, stats)
+                    writer = pa.parquet.ParquetWriter(outfile, schema)
+                writer.write_table(pa.Table.from_pandas(_typed(snapshots, schema), schema=schema,
+                                                        preserve_index=False))
+            else:
+                # plantcv2R.R writes with quote = FALSE, which splits each histogram ("[1, 2, ...]") into many
+                # cells of the row. Quoted, read.table(sep = ",") in analyze-traits.R reads it back as one cell;
+                # cells without commas or quotes are written as plantcv2R.R writes them.
+                snapshots.to_csv(outfile, mode="w" if rows == 0 else "a", header=rows == 0, index=False,
+                                 na_rep="NA", quoting=csv.QUOTE_MINIMAL)
+            rows += len(snapshots)
+    finally:
+        if writer is not None:
+            writer.close()
+        conn.close()
+    return rows
+
+
+def _parquet_schema(pa, columns, id_columns, stats):
+    # Fixed schema for all chunks: text columns as strings, everything else as doubles
+    fields = []
+    for column in columns:
+        source = column if column in id_columns else column.split("_", 1)[1]
+        if stats.get(source, (0, True))[1]:
+            fields.append(pa.field(column, pa.string()))
+        else:
+            fields.append(pa.field(column, pa.float64()))
+    return pa.schema(fields)
+
+
+def _typed(snapshots, schema):
+    # Convert columns to the writer schema types
+    for field in schema:
+        if str(field.type) == "string":
+            values = snapshots[field.name]
+            snapshots[field.name] = values.where(values.isnull(), values.astype(str))
+        else:
+            snapshots[field.name] = pd.to_numeric(snapshots[field.name], errors="coerce").astype(np.float64)
+    return snapshots
@@ -0,0 +1,251 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from pipeline.metadata import image_metadata
+from pipeline.sink import SQLiteSink, _quote
+
+# Result tables of a SQLite results database, all keyed by image_id
+TABLES = ["metadata", "features", "analysis_images", "stages"]
+
+
+def shard_key(image, by="snapshot"):
+    """Key that decides the shard of an image.
+
+    Images of one snapshot (all views and their NIR partners) share the snapshot key; with by="barcode"
+    all snapshots of a plant share a key (images without a barcode fall back to their snapshot).
+
+    Inputs:
+    image = image file
+    by    = "snapshot" or "barcode"
+
+    Returns:
+    key   = shard key
+
+    :param image: str
+    :param by: str
+    :return key: str
+    """
+    if by == "barcode":
+        barcode = image_metadata(image).get("plantbarcode")
+        if barcode:
+            return "barcode:" + barcode
+    snapshot_dir = os.path.dirname(image)
+    if os.path.basename(snapshot_dir).startswith("snapshot"):
+        return "snapshot:" + os.path.basename(snapshot_dir)
+    return "directory:" + os.path.normpath(snapshot_dir)
+
+
+def shard_index(key, shards):
+    """Shard of a key (a stable hash, unlike Python's hash, so every node and run agrees).
+
+    :param key: str
+    :param shards: int
+    :return index: int
+    """
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % shards
+
+
+def split_images(images, shards, by="snapshot"):
+    """Partition images into shards.
+
+    Inputs:
+    images = list of VIS image paths
+    shards = number of shards
+    by     = shard key ("snapshot" or "barcode")
+
+    Returns:
+    parts  = list of image lists, one per shard
+
+    :param images: list
+    :param shards: int
+    :param by: str
+    :return parts: list
+    """
+    if shards < 1:
+        raise RuntimeError("The number of shards must be at least 1")
+    parts = [[] for i in range(shards)]
+    for image in sorted(images):
+        parts[shard_index(shard_key(image, by), shards)].append(image)
+    return parts
+
+
+def write_manifests(images, shards, outdir, by="snapshot"):
+    """Write one image manifest per shard (shard-0000.txt, ...) for the pipeline scripts' --manifest option.
+
+    Image paths are written as absolute paths so the manifests can be used from any node that mounts
+    the shared filesystem at the same place.
+
+    Inputs:
+    images = list of VIS image paths
+    shards = number of shards
+    outdir = output directory
+    by     = shard key ("snapshot" or "barcode")
+
+    Returns:
+    files  = list of (manifest file, number of images)
+
+    :param images: list
+    :param shards: int
+    :param outdir: str
+    :param by: str
+    :return files: list
+    """
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    files = []
+    for i, part in enumerate(split_images(images=images, shards=shards, by=by)):
+        manifest = os.path.join(outdir, "shard-{0:04d}.txt".format(i))
+        with open(manifest, "w") as mf:
+            for image in part:
+                mf.write(os.path.abspath(image) + "\n")
+        files.append((manifest, len(part)))
+    return files
+
+
+def merge_results(inputs, output):
+    """Combine the result stores of several shards into one.
+
+    SQLite databases are merged into a SQLite database and Parquet directories into a Parquet
+    directory. An image found in more than one input keeps the results of the last input, as when an
+    image is analyzed again. Merging into an existing output adds to it. Merged Parquet parts share
+    one schema with the columns of all input parts.
+
+    Inputs:
+    inputs = result stores of the shards
+    output = merged result store
+
+    Returns:
+    images = number of images in the merged store
+
+    :param inputs: list
+    :param output: str
+    :return images: int
+    """
+    for path in inputs:
+        if not os.path.exists(path):
+            raise RuntimeError("Results {0} do not exist".format(path))
+    if output.endswith((".sqlite3", ".sqlite", ".db")):
+        return _merge_sqlite(inputs, output)
+    if output.endswith(".parquet"):
+        return _merge_parquet(inputs, output)
+    raise RuntimeError("Tab-delimited results have no image key to merge on; use .sqlite3 or .parquet results")
+
+
+def _merge_sqlite(inputs, output):
+    # Create the output schema, then copy each shard with image ids moved past those already present
+    SQLiteSink(output).close()
+    conn = sqlite3.connect(output)
+    try:
+        for path in inputs:
+            conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            tables = set(row[0] for row in conn.execute("SELECT name FROM shard.sqlite_master WHERE type = 'table'"))
+            if "metadata" not in tables:
+                raise RuntimeError("{0} is not a results database".format(path))
+            columns = set(row[1] for row in conn.execute("PRAGMA main.table_info(features)"))
+            for row in conn.execute("PRAGMA shard.table_info(features)").fetchall():
+                if row[1] not in columns:
+                    conn.execute("ALTER TABLE main.features ADD COLUMN " + _quote(row[1]))
+            with conn:
+                # Results of images already merged are replaced (metadata last, as the others are matched through it)
+                for table in reversed(TABLES):
+                    conn.execute("DELETE FROM main." + table + " WHERE image_id IN (SELECT m.image_id FROM "
+                                 "main.metadata m JOIN shard.metadata s ON m.image = s.image)")
+                offset = conn.execute("SELECT COALESCE(MAX(image_id), 0) FROM main.metadata").fetchone()[0]
+                for table in TABLES:
+                    if table not in tables:
+                        continue
+                    names = [row[1] for row in conn.execute("PRAGMA shard.table_info(" + table + ")")
+                             if row[1] != "image_id"]
+                    select = "".join(", " + _quote(n) for n in names)
+                    conn.execute("INSERT INTO main." + table + " (image_id" + select + ") SELECT image_id + ?" +
+                                 select + " FROM shard." + table, (offset,))
+            conn.execute("DETACH DATABASE shard")
+        return conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _part_files(directory):
+    # Part files of a Parquet results directory in the order they were written
+    parts = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.startswith("part-") and name.endswith(".parquet")]
+    return sorted(parts, key=lambda part: (os.path.getmtime(part), part))
+
+
+def _merge_parquet(inputs, output):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Merging Parquet results requires pyarrow")
+    parts = []
+    if os.path.isdir(output):
+        # Parts merged earlier come first, so new inputs replace their images
+        parts.extend(_part_files(output))
+    for path in inputs:
+        parts.extend(_part_files(path))
+
+    # First pass: the last part and row of each image
+    latest = {}
+    for i, part in enumerate(parts):
+        for row, image in enumerate(pq.read_table(part, columns=["image"]).column("image").to_pylist()):
+            latest[image] = (i, row)
+
+    # Second pass: copy each part without the rows replaced by later parts (one part in memory at a time),
+    # with the columns of all parts. New parts are written aside first, as parts merged earlier are inputs too.
+    schema = _unified_schema(pa, pq, parts)
+    if not os.path.exists(output):
+        os.makedirs(output)
+    staging = tempfile.mkdtemp(prefix=".merge-", dir=output)
+    count = 0
+    for i, part in enumerate(parts):
+        table = pq.read_table(part)
+        keep = [latest[image] == (i, row) for row, image in enumerate(table.column("image").to_pylist())]
+        if any(keep):
+            table = _conform(pa, table.filter(pa.array(keep)), schema)
+            pq.write_table(table, os.path.join(staging, "part-merged-{0:05d}.parquet".format(i)))
+            count += table.num_rows
+    for name in os.listdir(output):
+        if name.startswith("part-") and name.endswith(".parquet"):
+            os.remove(os.path.join(output, name))
+    for name in sorted(os.listdir(staging)):
+        os.rename(os.path.join(staging, name), os.path.join(output, name))
+    os.rmdir(staging)
+    return count
+
+
+def _unified_schema(pa, pq, parts):
+    # Schema with the columns of all part files (parts written by other versions or before a feature first
+    # appeared may lack columns or type them differently)
+    types = OrderedDict()
+    for part in parts:
+        for field in pq.read_schema(part):
+            types.setdefault(field.name, []).append(field.type)
+    return pa.schema([pa.field(name, _common_type(pa, column_types)) for name, column_types in types.items()])
+
+
+def _common_type(pa, types):
+    # Type that holds the values of all types: lists of the common value type, doubles for numbers, else strings
+    types = [t for t in types if not pa.types.is_null(t)]
+    if len(types) == 0:
+        return pa.null()
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_list(t) for t in types):
+        return pa.list_(_common_type(pa, [t.value_type for t in types]))
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_boolean(t) for t in types):
+        return pa.float64()
+    return pa.string()
+
+
+def _conform(pa, table, schema):
+    # Table with the columns and types of a schema; missing columns are empty
+    columns = []
+    for field in schema:
+        if field.name in table.column_names:
+            columns.append(table.column(field.name).cast(field.type))
+        else:
+            columns.append(pa.nulls(table.num_rows, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
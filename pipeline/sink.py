@@ -0,0 +1,365 @@
+import os
+import sqlite3
+from collections import OrderedDict
+import numpy as np
+from pipeline.histograms import COLOR_HEADER, NIR_HEADER
+
+# Metadata columns of the results database, in table order
+METADATA_COLUMNS = ["image", "imgtype", "camera", "frame", "zoom", "lifter", "gain", "exposure", "id", "plantbarcode",
+                    "timestamp", "cartag", "measurementlabel", "treatment"]
+# Features of the plantcv analysis functions the pipelines run (analyze_object, analyze_bound, analyze_color and
+# analyze_NIR_intensity); list features hold histograms
+SCALAR_FEATURES = ["area", "hull-area", "solidity", "perimeter", "width", "height", "longest_axis", "center-of-mass-x",
+                   "center-of-mass-y", "hull_vertices", "in_bounds", "ellipse_center_x", "ellipse_center_y",
+                   "ellipse_major_axis", "ellipse_minor_axis", "ellipse_angle", "ellipse_eccentricity",
+                   "height_above_bound", "height_below_bound", "above_bound_area", "percent_above_bound_area",
+                   "below_bound_area", "percent_below_bound_area", "bin-number"]
+LIST_FEATURES = sorted(set(COLOR_HEADER[2:] + NIR_HEADER[2:]))
+
+
+def make_record(image, metadata, tables):
+    """Bundle the results of one image for a results sink.
+
+    Inputs:
+    image    = image file
+    metadata = image metadata
+    tables   = list of (header, data, images) results from the plantcv analysis functions
+
+    Returns:
+    record   = results record
+
+    :param image: str
+    :param metadata: dict
+    :param tables: list
+    :return record: dict
+    """
+    return {"image": image, "metadata": metadata, "tables": tables}
+
+
+def record_features(record):
+    """Flatten the analysis results of a record into feature values and analysis images.
+
+    Inputs:
+    record   = results record
+
+    Returns:
+    features = dictionary of feature name to value
+    images   = list of (image type, image path)
+
+    :param record: dict
+    :return features: dict
+    :return images: list
+    """
+    features = {}
+    images = []
+    for header, data, analysis_images in record["tables"]:
+        # The first header and data fields are table labels (e.g. HEADER_SHAPES, SHAPES_DATA)
+        for name, value in zip(header[1:], data[1:]):
+            features[name] = value
+        for row in analysis_images:
+            images.append((row[1], row[2]))
+    return features, images
+
+
+def _native(value):
+    # Convert numpy scalars (including inside histogram lists) to Python values
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_native(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class TsvSink(object):
+    """Tab-delimited results files in the format written by the original scripts.
+
+    VIS results go to the results file and NIR results to the co-results file. Files are appended to
+    unless overwrite is set.
+    """
+
+    def __init__(self, result, coresult=None, overwrite=False):
+        self.files = {}
+        self.paths = {"VIS": result, "NIR": coresult}
+        self.mode = "w" if overwrite else "a"
+
+    def stored(self, image):
+        # Results in the files before this run are not tracked (cached runs rewrite the files)
+        return False
+
+    def add(self, record):
+        path = self.paths.get(record["metadata"]["imgtype"])
+        if path is None:
+            raise RuntimeError("No results file for {0} image {1}".format(record["metadata"]["imgtype"],
+                                                                          record["image"]))
+        if path not in self.files:
+            self.files[path] = open(path, self.mode)
+        results = self.files[path]
+        for header, data, images in record["tables"]:
+            results.write("\t".join(map(str, header)) + "\n")
+            results.write("\t".join(map(str, data)) + "\n")
+            for row in images:
+                results.write("\t".join(map(str, row)) + "\n")
+
+    def flush(self):
+        for results in self.files.values():
+            results.flush()
+
+    def close(self):
+        for results in self.files.values():
+            results.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class SQLiteSink(object):
+    """SQLite results database with the metadata/features/analysis_images schema read by plantcv2R.R.
+
+    Records are buffered and committed in bulk transactions. Feature columns are added as new
+    features appear; histograms are stored as text. A re-analyzed image replaces its earlier rows.
+    Stage timings of instrumented runs go to the stages table.
+    """
+
+    def __init__(self, filename, batch_size=1000):
+        self.batch_size = batch_size
+        self.buffer = []
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS metadata (image_id INTEGER PRIMARY KEY, " +
+                          ", ".join(_quote(c) + " TEXT" + (" UNIQUE" if c == "image" else "")
+                                    for c in METADATA_COLUMNS) + ")")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS features (image_id INTEGER PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS analysis_images (image_id INTEGER, type TEXT, "
+                          "image_path TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS stages (image_id INTEGER, stage TEXT, wall_s REAL, cpu_s REAL, "
+                          "peak_alloc_kb INTEGER)")
+        self.conn.commit()
+        self.columns = set(row[1] for row in self.conn.execute("PRAGMA table_info(features)"))
+        self.next_id = (self.conn.execute("SELECT MAX(image_id) FROM metadata").fetchone()[0] or 0) + 1
+
+    def stored(self, image):
+        """True when the database holds results of an image.
+
+        :param image: str
+        :return stored: bool
+        """
+        return self.conn.execute("SELECT 1 FROM metadata WHERE image = ?", (image,)).fetchone() is not None
+
+    def add(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        # Keep only the latest results of an image analyzed more than once
+        records = list(OrderedDict((record["image"], record) for record in self.buffer).values())
+        with self.conn:
+            # Replace earlier results for re-analyzed images
+            old_ids = []
+            for record in records:
+                row = self.conn.execute("SELECT image_id FROM metadata WHERE image = ?", (record["image"],)).fetchone()
+                if row is not None:
+                    old_ids.append(row)
+            for table in ["metadata", "features", "analysis_images", "stages"]:
+                self.conn.executemany("DELETE FROM " + table + " WHERE image_id = ?", old_ids)
+
+            metadata_rows = []
+            feature_rows = {}
+            image_rows = []
+            stage_rows = []
+            for record in records:
+                image_id = self.next_id
+                self.next_id += 1
+                metadata = dict(record["metadata"], image=record["image"])
+                metadata_rows.append([image_id] + [_native(metadata.get(c)) for c in METADATA_COLUMNS])
+                features, images = record_features(record)
+                for name in features:
+                    if name not in self.columns:
+                        self.conn.execute("ALTER TABLE features ADD COLUMN " + _quote(name))
+                        self.columns.add(name)
+                names = tuple(sorted(features))
+                values = [image_id]
+                for name in names:
+                    value = _native(features[name])
+                    values.append(str(value) if isinstance(value, list) else value)
+                feature_rows.setdefault(names, []).append(values)
+                image_rows.extend((image_id, image_type, path) for image_type, path in images)
+                # Stage timings, when the run is instrumented
+                for stage in record.get("stats", {}).get("stages", []):
+                    stage_rows.append((image_id, stage["stage"], stage["wall_s"], stage["cpu_s"],
+                                       stage["peak_alloc_kb"]))
+
+            self.conn.executemany("INSERT INTO metadata VALUES (" + ", ".join(["?"] * (len(METADATA_COLUMNS) + 1)) +
+                                  ")", metadata_rows)
+            for names, rows in feature_rows.items():
+                self.conn.executemany("INSERT INTO features (image_id" + "".join(", " + _quote(n) for n in names) +
+                                      ") VALUES (" + ", ".join(["?"] * (len(names) + 1)) + ")", rows)
+            self.conn.executemany("INSERT INTO analysis_images VALUES (?, ?, ?)", image_rows)
+            self.conn.executemany("INSERT INTO stages VALUES (?, ?, ?, ?, ?)", stage_rows)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class ParquetSink(object):
+    """Directory of Parquet files with one row per image (metadata and feature columns).
+
+    Each bulk write adds a part file. All part files have one schema, so the directory reads as one
+    table: metadata columns are strings, features are doubles (histograms lists of doubles) and
+    every known feature has a column, empty when an image has no value. A feature outside
+    SCALAR_FEATURES and LIST_FEATURES adds a column to the parts written after it first appears
+    (shard.merge_results unifies such parts). A re-analyzed image gets a new row in a later part;
+    readers keep the row of the last part, as shard.merge_results does. Requires pyarrow.
+    """
+
+    def __init__(self, directory, batch_size=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Writing Parquet results requires pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.directory = directory
+        self.batch_size = batch_size
+        self.buffer = []
+        self.part = 0
+        self.scalar_features = set(SCALAR_FEATURES)
+        self.list_features = set(LIST_FEATURES)
+        # Images in the part files written before this sink was opened (read on first use)
+        self.images = None
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def stored(self, image):
+        """True when a part file written before this sink was opened holds results of an image.
+
+        :param image: str
+        :return stored: bool
+        """
+        if self.images is None:
+            self.images = set()
+            for name in sorted(os.listdir(self.directory)):
+                if name.startswith("part-") and name.endswith(".parquet"):
+                    part = self.pq.read_table(os.path.join(self.directory, name), columns=["image"])
+                    self.images.update(part.column("image").to_pylist())
+        return image in self.images
+
+    def add(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def schema(self):
+        """Schema of the part files: metadata, features in name order, then analysis images.
+
+        :return schema: pyarrow.Schema
+        """
+        pa = self.pa
+        fields = [pa.field(c, pa.string()) for c in METADATA_COLUMNS]
+        for name in sorted(self.scalar_features | self.list_features):
+            fields.append(pa.field(name, pa.list_(pa.float64()) if name in self.list_features else pa.float64()))
+        fields.append(pa.field("analysis_images", pa.list_(pa.string())))
+        return pa.schema(fields)
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        rows = []
+        for record in self.buffer:
+            metadata = dict(record["metadata"], image=record["image"])
+            row = dict((c, _text(metadata.get(c))) for c in METADATA_COLUMNS)
+            features, images = record_features(record)
+            for name, value in features.items():
+                value = _native(value)
+                if isinstance(value, list):
+                    self.list_features.add(name)
+                    row[name] = [_number(name, v) for v in value]
+                else:
+                    self.scalar_features.add(name)
+                    row[name] = _number(name, value)
+            row["analysis_images"] = [path for image_type, path in images]
+            rows.append(row)
+        schema = self.schema()
+        table = self.pa.Table.from_pydict(dict((f.name, [row.get(f.name) for row in rows]) for f in schema),
+                                          schema=schema)
+        # Part files are named by process and sequence so several writers can share a directory
+        filename = os.path.join(self.directory, "part-{0}-{1:05d}.parquet".format(os.getpid(), self.part))
+        self.pq.write_table(table, filename)
+        self.part += 1
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def _text(value):
+    # Metadata value as a string column value
+    value = _native(value)
+    return None if value is None else str(value)
+
+
+def _number(name, value):
+    # Feature value as a double column value
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RuntimeError("Feature {0} has a non-numeric value: {1}".format(name, value))
+
+
+def open_sink(result, coresult=None, overwrite=False):
+    """Open the results sink for a results path.
+
+    Paths ending in .sqlite3, .sqlite or .db are written as a SQLite database and paths ending in .parquet
+    as a Parquet directory (both hold VIS and NIR results); anything else is written as tab-delimited
+    text, with NIR results in the co-results file. With overwrite, tab-delimited files are replaced
+    instead of appended to (SQLite databases replace the rows of re-analyzed images, Parquet
+    directories add rows that supersede them).
+
+    Inputs:
+    result    = results path
+    coresult  = NIR results file (tab-delimited output only)
+    overwrite = replace tab-delimited results files instead of appending
+
+    Returns:
+    sink      = results sink
+
+    :param result: str
+    :param coresult: str
+    :param overwrite: bool
+    :return sink: TsvSink, SQLiteSink or ParquetSink
+    """
+    if result is None:
+        raise RuntimeError("A results file is required")
+    if result.endswith((".sqlite3", ".sqlite", ".db")):
+        return SQLiteSink(result)
+    if result.endswith(".parquet"):
+        return ParquetSink(result)
+    return TsvSink(result, coresult, overwrite=overwrite)
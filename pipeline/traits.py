@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Default location of cached calibration coefficients
+COEF_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "plantcv-missouri-transect")
+# LemnaTec zoom units to camera zoom units: a line through (1, 1) and (6000, 6)
+ZOOM_UNITS = (1.0, 6000.0)
+CAMERA_ZOOM = (1.0, 6.0)
+# Plants whose largest corrected area stays below this are treated as dead or slow-growing
+MIN_AREA = 100000
+# Snapshot columns used to build the traits table
+SNAPSHOT_COLUMNS = ["plantbarcode", "timestamp", "tv0_zoom", "tv0_area", "sv0_area", "sv90_area",
+                    "sv0_height_above_bound", "sv90_height_above_bound"]
+
+
+def camera_zoom(zoom):
+    """Convert LemnaTec zoom units to camera zoom units (zoom.lm in analyze-traits.R).
+
+    Inputs:
+    zoom   = LemnaTec zoom level(s)
+
+    Returns:
+    camera = camera zoom level(s)
+
+    :param zoom: ndarray
+    :return camera: ndarray
+    """
+    slope = (CAMERA_ZOOM[1] - CAMERA_ZOOM[0]) / (ZOOM_UNITS[1] - ZOOM_UNITS[0])
+    return CAMERA_ZOOM[0] + slope * (np.asarray(zoom, dtype=np.float64) - ZOOM_UNITS[0])
+
+
+def _fit_exponential(x, y, a, b, iterations=50, tolerance=1e-10):
+    # Gauss-Newton least squares fit of y = a * exp(b * x) with step halving (as R's nls)
+    params = np.array([a, b], dtype=np.float64)
+
+    def rss(p):
+        return np.sum((y - p[0] * np.exp(p[1] * x)) ** 2)
+
+    current = rss(params)
+    for i in range(iterations):
+        fitted = params[0] * np.exp(params[1] * x)
+        jacobian = np.column_stack((fitted / params[0], fitted * x))
+        step = np.linalg.lstsq(jacobian, y - fitted, rcond=None)[0]
+        factor = 1.0
+        while factor > 1e-10:
+            candidate = params + factor * step
+            new = rss(candidate)
+            if new <= current:
+                break
+            factor /= 2
+        else:
+            break
+        converged = abs(current - new) <= tolerance * max(current, 1e-300)
+        params, current = candidate, new
+        if converged:
+            break
+    return params
+
+
+def fit_calibration(calibration_file):
+    """Fit the zoom correction models of analyze-traits.R to reference object calibration data.
+
+    Inputs:
+    calibration_file = tab-delimited calibration data (zoom, camera, length_px, length_cm, rel_area)
+
+    Returns:
+    coefficients     = dictionary with "area" [a, b] of rel_area = a * exp(b * zoom.camera) and "px_cm"
+                       [c0, c1, c2] of px_cm = c0 + c1 * zoom.camera + c2 * zoom.camera^2 (side-view camera)
+
+    :param calibration_file: str
+    :return coefficients: dict
+    """
+    z_data = pd.read_csv(calibration_file, sep="\t")
+    z_data["px_cm"] = z_data["length_px"] / z_data["length_cm"]
+    zc = camera_zoom(z_data["zoom"].values)
+    rel_area = z_data["rel_area"].values.astype(np.float64)
+
+    # Starting values from the log-scale fit, log(rel_area) = log(a) + b * zoom.camera
+    b, log_a = np.polyfit(zc, np.log(rel_area), 1)
+    a, b = _fit_exponential(zc, rel_area, np.exp(log_a), b)
+
+    # Quadratic px/cm model from side-view images
+    sv = (z_data["camera"] == "VIS SV").values
+    c2, c1, c0 = np.polyfit(zc[sv], z_data["px_cm"].values[sv], 2)
+    return {"area": [float(a), float(b)], "px_cm": [float(c0), float(c1), float(c2)]}
+
+
+def load_calibration(calibration_file, cache_dir=COEF_CACHE):
+    """Load the zoom correction coefficients of a calibration file, fitting and caching them on first use.
+
+    Coefficients are cached as JSON keyed by the SHA-1 hash of the calibration file contents.
+
+    Inputs:
+    calibration_file = tab-delimited calibration data
+    cache_dir        = directory of cached coefficients
+
+    Returns:
+    coefficients     = dictionary of model coefficients (see fit_calibration)
+
+    :param calibration_file: str
+    :param cache_dir: str
+    :return coefficients: dict
+    """
+    if not os.path.exists(calibration_file):
+        raise RuntimeError("Zoom calibration file {0} does not exist".format(calibration_file))
+    with open(calibration_file, "rb") as cf:
+        digest = hashlib.sha1(cf.read()).hexdigest()
+    coef_file = os.path.join(cache_dir, "zoom_calibration_" + digest + ".json")
+    if os.path.exists(coef_file):
+        with open(coef_file, "r") as cf:
+            return json.load(cf)
+
+    coefficients = fit_calibration(calibration_file)
+    if not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # Another process created it first
+            pass
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".json")
+    with os.fdopen(fd, "w") as tf:
+        json.dump(coefficients, tf)
+    os.rename(tmp, coef_file)
+    return coefficients
+
+
+def read_snapshots(results):
+    """Read the snapshot columns needed for the traits table.
+
+    Reads a snapshot table written by plantcv-reshape.py (CSV or Parquet), or queries the area,
+    height and zoom of each VIS image directly from a SQLite results database.
+
+    Inputs:
+    results   = snapshot table or SQLite results database
+
+    Returns:
+    snapshots = DataFrame with one row per snapshot
+
+    :param results: str
+    :return snapshots: pandas.DataFrame
+    """
+    if results.endswith((".sqlite3", ".sqlite", ".db")):
+        conn = sqlite3.connect(results)
+        try:
+            images = pd.read_sql_query("SELECT timestamp, plantbarcode, camera, frame, zoom, area, "
+                                       "height_above_bound FROM metadata NATURAL JOIN features "
+                                       "WHERE imgtype = 'VIS'", conn)
+        finally:
+            conn.close()
+        images.loc[images["frame"] == "none", "frame"] = "0"
+        images["prefix"] = images["camera"].str.lower() + images["frame"].astype(str) + "_"
+        images = images.drop_duplicates(subset=["timestamp", "prefix"], keep="last")
+        wide = images.set_index(["timestamp", "prefix"])[["zoom", "area", "height_above_bound"]].unstack("prefix")
+        wide.columns = [prefix + column for column, prefix in wide.columns]
+        ids = images.groupby("timestamp")[["plantbarcode"]].first()
+        snapshots = ids.join(wide).reset_index()
+    elif results.endswith(".parquet"):
+        snapshots = pd.read_parquet(results)
+    else:
+        snapshots = pd.read_csv(results)
+    missing = [c for c in SNAPSHOT_COLUMNS if c not in snapshots.columns]
+    if len(missing) > 0:
+        raise RuntimeError("Results {0} have no columns {1}".format(results, ", ".join(missing)))
+    return snapshots[SNAPSHOT_COLUMNS]
+
+
+def build_traits(snapshots, coefficients, planting_date, barcodes=None, min_area=MIN_AREA):
+    """Zoom-corrected area and height of each snapshot (the traits table of analyze-traits.R).
+
+    Inputs:
+    snapshots     = DataFrame returned by read_snapshots
+    coefficients  = zoom correction coefficients returned by load_calibration
+    planting_date = planting date (YYYY-MM-DD)
+    barcodes      = DataFrame with Barcodes and Genotype columns; snapshots of other plants are dropped
+    min_area      = plants whose largest area is smaller than this are removed
+
+    Returns:
+    traits        = DataFrame of plantbarcode, timestamp, genotype, dap, day, tv_area, sv_area, area and height
+
+    :param snapshots: pandas.DataFrame
+    :param coefficients: dict
+    :param planting_date: str
+    :param barcodes: pandas.DataFrame
+    :param min_area: float
+    :return traits: pandas.DataFrame
+    """
+    if barcodes is not None:
+        # Use barcodes to assign genotype labels
+        snapshots = snapshots.merge(barcodes[["Barcodes", "Genotype"]], left_on="plantbarcode",
+                                    right_on="Barcodes")
+        genotype = snapshots["Genotype"].values
+    else:
+        genotype = np.full(len(snapshots), np.nan)
+
+    timestamp = pd.to_datetime(snapshots["timestamp"])
+    # Days after planting
+    dap = ((timestamp - pd.Timestamp(planting_date)) / pd.Timedelta(days=1)).values
+
+    # Zoom corrections from the top-view zoom level
+    zoom = snapshots["tv0_zoom"].astype(str).str.replace("z", "", regex=False).astype(np.float64).values
+    zc = camera_zoom(zoom)
+    a, b = coefficients["area"]
+    rel_area = a * np.exp(b * zc)
+    c0, c1, c2 = coefficients["px_cm"]
+    px_cm = c0 + c1 * zc + c2 * zc * zc
+
+    def column(name):
+        return pd.to_numeric(snapshots[name], errors="coerce").values.astype(np.float64)
+
+    tv_area = column("tv0_area") / rel_area
+    sv_area = column("sv0_area") / rel_area + column("sv90_area") / rel_area
+    height = (column("sv0_height_above_bound") / px_cm + column("sv90_height_above_bound") / px_cm) / 2
+    traits = pd.DataFrame({"plantbarcode": snapshots["plantbarcode"].values, "timestamp": timestamp.values,
+                           "genotype": genotype, "dap": dap, "day": pd.Series(np.trunc(dap)).astype("Int64").values,
+                           "tv_area": tv_area, "sv_area": sv_area, "area": tv_area + sv_area, "height": height},
+                          columns=["plantbarcode", "timestamp", "genotype", "dap", "day", "tv_area", "sv_area",
+                                   "area", "height"])
+
+    # Remove dead/slow-growing plants
+    max_area = traits.groupby("plantbarcode")["area"].transform("max")
+    return traits[~(max_area < min_area)].reset_index(drop=True)
@@ -0,0 +1,295 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from pipeline import pairing
+
+# inotify event flags (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct("iIII")
+
+
+class Inotify(object):
+    """Minimal inotify binding (Linux, through libc); raises OSError where inotify is unavailable."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify requires Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self.libc.inotify_add_watch(self.fd, path.encode(sys.getfilesystemencoding()), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", path)
+        return wd
+
+    def rm_watch(self, wd):
+        # Fails (ignored) when the directory was removed, which also removes its watch
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Events (wd, mask, name) that arrive within timeout seconds.
+
+        :param timeout: float
+        :return events: list
+        """
+        if len(select.select([self.fd], [], [], timeout)[0]) == 0:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except OSError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            events.append((wd, mask, name.decode(sys.getfilesystemencoding())))
+            offset += EVENT.size + length
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher(object):
+    """Finds new VIS images in a LemnaTec export tree while the imaging system writes it.
+
+    Directories are watched with inotify where available and polled otherwise. A file is complete
+    when it is closed after writing (inotify) or, for files found by listing a directory, when its
+    size and modification time have not changed for settle seconds. VIS images are grouped with the
+    other files of their snapshot directory and released once their NIR partner is complete too
+    (when the pipeline uses NIR images), or after waiting partner_wait seconds for it.
+
+    Snapshot directories (directories without subdirectories, other than root) are forgotten once
+    nothing in them has changed for partner_wait seconds and all their images are released, so a
+    daemon that runs for a whole experiment only tracks recent snapshots. After the first scan,
+    directories that have not changed for partner_wait seconds are not picked up again.
+    """
+
+    def __init__(self, root, accept, uses_nir=False, settle=10.0, partner_wait=600.0, use_inotify=True):
+        self.root = root
+        self.accept = accept
+        self.uses_nir = uses_nir
+        self.settle = settle
+        self.partner_wait = partner_wait
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError):
+                # No inotify on this system (or no permission): poll instead
+                self.inotify = None
+        self.watches = {}
+        # Directory modification times, last activity and directories with subdirectories, files still being
+        # written and complete files per directory
+        self.dirs = {}
+        self.active = {}
+        self.parents = set()
+        self.growing = {}
+        self.complete = {}
+        # VIS images waiting for their NIR partner and images already released per directory
+        self.waiting = {}
+        self.released = {}
+        self.retire = max(partner_wait, settle)
+        self._initial = True
+        self._add_dir(root)
+        self._initial = False
+
+    def _add_dir(self, path):
+        if path in self.dirs:
+            return
+        self.dirs[path] = None
+        self.active[path] = time.time()
+        self.complete.setdefault(path, set())
+        if self.inotify is not None:
+            try:
+                self.watches[self.inotify.add_watch(path)] = path
+            except OSError:
+                # Out of watches: this directory is polled
+                pass
+        self._scan(path)
+
+    def _scan(self, path):
+        # List a directory: new subdirectories are watched and new files are checked until they are complete
+        try:
+            self.dirs[path] = os.stat(path).st_mtime
+            names = os.listdir(path)
+        except OSError:
+            return
+        now = time.time()
+        for name in names:
+            filename = os.path.join(path, name)
+            if os.path.isdir(filename):
+                self.parents.add(path)
+                if filename not in self.dirs and (self._initial or not self._settled(filename, now)):
+                    self._add_dir(filename)
+            elif name not in self.complete[path] and filename not in self.growing:
+                self.growing[filename] = (None, now)
+                self.active[path] = now
+
+    def _settled(self, path, now):
+        # True for directories unchanged for the retire time (e.g. forgotten snapshot directories)
+        try:
+            return now - os.stat(path).st_mtime >= self.retire
+        except OSError:
+            return True
+
+    def _completed(self, filename):
+        self.growing.pop(filename, None)
+        path, name = os.path.split(filename)
+        self.complete.setdefault(path, set()).add(name)
+        self.active[path] = time.time()
+        if name not in self.released.get(path, ()) and self.accept(filename):
+            self.waiting.setdefault(filename, time.time())
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds for changes and return the VIS images that became ready.
+
+        Inputs:
+        timeout = seconds to wait
+
+        Returns:
+        ready   = list of (VIS image, NIR image or None, time the image was complete)
+
+        :param timeout: float
+        :return ready: list
+        """
+        if self.inotify is not None:
+            for wd, mask, name in self.inotify.read(timeout):
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost: list every directory again
+                    for path in list(self.dirs):
+                        self._scan(path)
+                    continue
+                path = self.watches.get(wd)
+                if path is None:
+                    continue
+                filename = os.path.join(path, name)
+                if mask & IN_ISDIR:
+                    self._add_dir(filename)
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self._completed(filename)
+        else:
+            time.sleep(timeout)
+        # Directories without a watch are listed again when they change
+        watched = set(self.watches.values())
+        for path in list(self.dirs):
+            if path not in watched:
+                try:
+                    changed = os.stat(path).st_mtime != self.dirs[path]
+                except OSError:
+                    changed = False
+                if changed:
+                    self._scan(path)
+        # Files are complete once their size and modification time settle
+        now = time.time()
+        for filename, (seen, since) in list(self.growing.items()):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                del self.growing[filename]
+                continue
+            current = (stat.st_size, stat.st_mtime)
+            if current != seen:
+                self.growing[filename] = (current, now)
+            elif now - since >= self.settle:
+                self._completed(filename)
+        ready = self._release(now)
+        self._forget(now)
+        return ready
+
+    def _release(self, now):
+        ready = []
+        for image, since in sorted(self.waiting.items()):
+            path, filename = os.path.split(image)
+            nirpath = None
+            if self.uses_nir:
+                nirname = pairing.match_nir(filename, sorted(self.complete.get(path, ())))
+                if nirname is not None:
+                    nirpath = os.path.join(path, nirname)
+                elif now - since < self.partner_wait:
+                    continue
+            del self.waiting[image]
+            self.released.setdefault(path, set()).add(filename)
+            ready.append((image, nirpath, since))
+        return ready
+
+    def _forget(self, now):
+        # Forget snapshot directories that settled with every image released
+        busy = set(os.path.dirname(filename) for filename in self.growing)
+        busy.update(os.path.dirname(image) for image in self.waiting)
+        for path in list(self.dirs):
+            if path == self.root or path in self.parents or path in busy:
+                continue
+            if now - self.active[path] < self.retire or not self._settled(path, now):
+                continue
+            for wd in [wd for wd, watched in self.watches.items() if watched == path]:
+                del self.watches[wd]
+                self.inotify.rm_watch(wd)
+            for tracked in (self.dirs, self.active, self.complete, self.released):
+                tracked.pop(path, None)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+class Status(object):
+    """Status file of a watching pipeline: queue depth, throughput and latency, rewritten as JSON."""
+
+    def __init__(self, filename, window=600.0):
+        self.filename = filename
+        self.window = window
+        self.started = time.time()
+        self.done = []
+        self.counts = {"processed": 0, "cached": 0, "failed": 0}
+        self.latency = None
+
+    def finished(self, kind, since):
+        """Count a processed, cached or failed image that was complete at time since.
+
+        :param kind: str
+        :param since: float
+        """
+        now = time.time()
+        self.counts[kind] += 1
+        self.latency = now - since
+        self.done.append(now)
+
+    def write(self, state, **depth):
+        """Write the status file (atomically).
+
+        :param state: str
+        :param depth: dict
+        """
+        now = time.time()
+        self.done = [t for t in self.done if now - t <= self.window]
+        elapsed = min(self.window, now - self.started)
+        status = {"state": state, "pid": os.getpid(),
+                  "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                  "updated": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+                  "images_per_min": 60.0 * len(self.done) / elapsed if elapsed > 0 else 0.0,
+                  "last_latency_s": self.latency}
+        status.update(self.counts)
+        status.update(depth)
+        if self.filename is None:
+            return
+        tmp = self.filename + ".tmp"
+        with open(tmp, "w") as sf:
+            json.dump(status, sf, indent=2, sort_keys=True)
+        os.rename(tmp, self.filename)
@@ -0,0 +1,179 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import cv2
+import plantcv as pcv
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Encoder settings of cv2.imwrite for each output format (quality is the JPEG quality or PNG compression level)
+FORMATS = {
+    "png": cv2.IMWRITE_PNG_COMPRESSION,
+    "jpg": cv2.IMWRITE_JPEG_QUALITY
+}
+
+
+def staging_dir(staging, image):
+    """New staging directory for the analysis images of one image.
+
+    plantcv writes some files next to the analysis images without listing them in the results (e.g.
+    the pseudocolor colorbars of pcv.analyze_color and pcv.analyze_NIR_intensity). Staging each image
+    in its own directory lets ImageWriter.publish move them with the image's results.
+
+    Inputs:
+    staging = staging directory of the ImageWriter
+    image   = image file
+
+    Returns:
+    imgdir  = directory for the analysis images of the image
+
+    :param staging: str
+    :param image: str
+    :return imgdir: str
+    """
+    stem = os.path.splitext(os.path.basename(image))[0]
+    return tempfile.mkdtemp(prefix=stem + "-", dir=staging)
+
+
+class ImageWriter(object):
+    """Moves analysis images from a local staging directory to the output directory on background threads.
+
+    The plantcv analysis functions write their images synchronously. Pointing them at a staging
+    directory on local disk keeps the slow (e.g. network) output directory out of each image's
+    critical path; the main process hands the staged files to this writer, which copies (or
+    re-encodes) them into the output directory. The queue is bounded, so a slow output directory
+    holds back the batch instead of filling the staging disk.
+    """
+
+    def __init__(self, outdir, staging=None, img_format=None, quality=None, queue_size=64, threads=2):
+        if img_format is not None and img_format not in FORMATS:
+            pcv.fatal_error("Unknown image format: {0}".format(img_format))
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        self.outdir = outdir
+        self.own_staging = staging is None
+        if staging is None:
+            staging = tempfile.mkdtemp(prefix="plantcv-images-")
+        elif not os.path.exists(staging):
+            os.makedirs(staging)
+        self.staging = staging
+        self.img_format = img_format
+        self.quality = quality
+        self.errors = []
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.threads = [threading.Thread(target=self._run) for i in range(threads)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def output_path(self, staged):
+        """Final path of a staged image.
+
+        :param staged: str
+        :return path: str
+        """
+        name = os.path.basename(staged)
+        root, ext = os.path.splitext(name)
+        if self.img_format is not None and ext.lower() in (".png", ".jpg", ".jpeg"):
+            name = root + "." + self.img_format
+        return os.path.join(self.outdir, name)
+
+    def publish(self, records):
+        """Queue the staged analysis images of the results records of one image and point the records at their
+        final paths.
+
+        The other files in the image's staging directories (see staging_dir) are queued too. Blocks while
+        the queue is full.
+
+        :param records: list
+        """
+        staging = os.path.abspath(self.staging)
+        jobs = []
+        dirs = set()
+        for record in records:
+            for header, data, analysis_images in record["tables"]:
+                for row in analysis_images:
+                    staged = os.path.abspath(row[2])
+                    if os.path.dirname(os.path.dirname(staged)) != staging:
+                        continue
+                    row[2] = self.output_path(staged)
+                    jobs.append((staged, row[2]))
+                    dirs.add(os.path.dirname(staged))
+        # List the staging directories before any file is moved (the last move removes the directory)
+        listed = set(staged for staged, path in jobs)
+        for imgdir in sorted(dirs):
+            for name in sorted(os.listdir(imgdir)):
+                staged = os.path.join(imgdir, name)
+                if staged not in listed and os.path.isfile(staged):
+                    jobs.append((staged, self.output_path(staged)))
+        for job in jobs:
+            self.jobs.put(job)
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            staged, path = job
+            try:
+                self._write(staged, path)
+            except Exception as e:
+                self._failed(staged, path, e)
+                continue
+            try:
+                # Removed with the last file of the image
+                os.rmdir(os.path.dirname(staged))
+            except OSError:
+                pass
+
+    def _failed(self, staged, path, error):
+        # Report a failed image right away (its results already point at the final path)
+        message = "{0} to {1}: {2}".format(staged, path, error)
+        self.errors.append(message)
+        sys.stderr.write("Failed to write analysis image {0}\n".format(message))
+
+    def _write(self, staged, path):
+        ext = os.path.splitext(path)[1].lower().lstrip(".")
+        if ext in FORMATS and (self.img_format is not None or self.quality is not None):
+            img = cv2.imread(staged, cv2.IMREAD_UNCHANGED)
+            if img is not None:
+                params = [] if self.quality is None else [FORMATS[ext], self.quality]
+                if not cv2.imwrite(path, img, params):
+                    raise IOError("cannot write {0}".format(path))
+                os.remove(staged)
+                return
+        # Copy as written by plantcv (other formats, or no encoder settings)
+        shutil.move(staged, path)
+
+    def close(self):
+        """Wait for all queued images to be written, then move the files left in the staging directory.
+
+        Files are left when their image failed after writing some analysis images, so its results were
+        never published. The staging directory is removed if this writer made it.
+        """
+        for thread in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        for imgdir, subdirs, names in sorted(os.walk(self.staging, topdown=False)):
+            for name in sorted(names):
+                staged = os.path.join(imgdir, name)
+                path = self.output_path(staged)
+                try:
+                    self._write(staged, path)
+                except Exception as e:
+                    self._failed(staged, path, e)
+            if os.path.abspath(imgdir) != os.path.abspath(self.staging):
+                try:
+                    os.rmdir(imgdir)
+                except OSError:
+                    pass
+        if len(self.errors) > 0:
+            sys.stderr.write("{0} analysis images could not be written\n".format(len(self.errors)))
+        if self.own_staging:
+            shutil.rmtree(self.staging, ignore_errors=True)
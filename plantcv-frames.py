@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import sys
+from pipeline import batch, frames, pairing
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Decode the images of an experiment into a frame store (memory-mapped "
+                                                 "frames the pipeline scripts read with --frames)")
+    parser.add_argument("-d", "--dir", help="Directory of input VIS images.", required=False)
+    parser.add_argument("-g", "--glob", help="Glob pattern of input VIS images.", required=False)
+    parser.add_argument("-m", "--manifest", help="File listing input VIS images, one per line.", required=False)
+    parser.add_argument("-b", "--bgimg", help="Background image file to store as well (repeatable).", default=[],
+                        action="append")
+    parser.add_argument("--no-nir", help="Do not store the NIR partners of the VIS images.", default=False,
+                        action="store_true")
+    parser.add_argument("-o", "--outdir", help="Frame store directory (added to when it exists).", required=True)
+    args = parser.parse_args()
+    inputs = [args.dir, args.glob, args.manifest]
+    if len([i for i in inputs if i is not None]) != 1:
+        parser.error("exactly one of --dir, --glob or --manifest is required")
+    return args
+
+
+def main():
+    # Get options
+    args = options()
+
+    images = batch.collect_images(directory=args.dir, pattern=args.glob, manifest=args.manifest)
+    files = list(images)
+    if not args.no_nir:
+        files.extend(nirpath for nirpath in pairing.index_pairs(images).values() if nirpath is not None)
+    files.extend(args.bgimg)
+
+    # Snapshots already in the store and unchanged are skipped
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+    store = frames.FrameStore(args.outdir)
+    count = store.add(files)
+    sys.stderr.write("Stored {0} of {1} images in {2}\n".format(count, len(files), args.outdir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+from pipeline import shard
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Merge the result stores of shard runs")
+    parser.add_argument("results", help="Shard results (.sqlite3 databases or .parquet directories).", nargs="+")
+    parser.add_argument("-o", "--output", help="Merged results (.sqlite3 or .parquet).", required=True)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    # Get options
+    args = options()
+
+    # Images found in several shards keep the results of the last one given
+    images = shard.merge_results(inputs=args.results, output=args.output)
+    sys.stderr.write("{0} images in {1}\n".format(images, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+from pipeline import reshape
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Reshape a results database into one row per snapshot")
+    parser.add_argument("-d", "--database", help="SQLite results database.", default="plantcv.sqlite3")
+    parser.add_argument("-o", "--outfile", help="Snapshot table (.parquet for Parquet, otherwise CSV).",
+                        default="plantcv_results.csv")
+    parser.add_argument("-c", "--chunksize", help="Number of image rows read at a time.", type=int, default=10000)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    # Get options
+    args = options()
+
+    # Merge the VIS images of each snapshot into one row (input of analyze-traits.R)
+    rows = reshape.reshape_results(database=args.database, outfile=args.outfile, chunksize=args.chunksize)
+    sys.stderr.write("Wrote {0} snapshots to {1}\n".format(rows, args.outfile))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+from pipeline import batch, shard
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Split VIS images into shards (one manifest per shard) for "
+                                                 "independent batch runs")
+    parser.add_argument("-d", "--dir", help="Directory of input VIS images.", required=False)
+    parser.add_argument("-g", "--glob", help="Glob pattern of input VIS images.", required=False)
+    parser.add_argument("-m", "--manifest", help="File listing input VIS images, one per line.", required=False)
+    parser.add_argument("-n", "--shards", help="Number of shards.", type=int, required=True)
+    parser.add_argument("-b", "--by", help="Keep the images of each snapshot or of each plant (barcode) together.",
+                        choices=["snapshot", "barcode"], default="snapshot")
+    parser.add_argument("-o", "--outdir", help="Output directory for the shard manifests.", default="shards")
+    args = parser.parse_args()
+    inputs = [args.dir, args.glob, args.manifest]
+    if len([i for i in inputs if i is not None]) != 1:
+        parser.error("exactly one of --dir, --glob or --manifest is required")
+    return args
+
+
+def main():
+    # Get options
+    args = options()
+
+    # Each manifest is run on its own node with the pipeline script's --manifest option
+    images = batch.collect_images(directory=args.dir, pattern=args.glob, manifest=args.manifest)
+    for manifest, count in shard.write_manifests(images=images, shards=args.shards, outdir=args.outdir, by=args.by):
+        sys.stderr.write("{0}: {1} images\n".format(manifest, count))
+
+
+if __name__ == '__main__':
+    main()
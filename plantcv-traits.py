@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+import pandas as pd
+from pipeline import traits
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Zoom-corrected plant traits from pipeline results")
+    parser.add_argument("-i", "--input", help="Snapshot table from plantcv-reshape.py (CSV or Parquet) or SQLite "
+                        "results database.", default="plantcv_results.csv")
+    parser.add_argument("-z", "--zoom-calibration", help="Zoom calibration data (zoom_calibration_data.txt).",
+                        default="zoom_calibration_data.txt")
+    parser.add_argument("-b", "--barcodes", help="Barcodes file with Barcodes and Genotype columns.", required=False)
+    parser.add_argument("-p", "--planting-date", help="Planting date (YYYY-MM-DD).", default="2015-08-10")
+    parser.add_argument("-a", "--min-area", help="Remove plants whose largest area is below this.", type=float,
+                        default=traits.MIN_AREA)
+    parser.add_argument("-c", "--cache", help="Directory of cached calibration coefficients.",
+                        default=traits.COEF_CACHE)
+    parser.add_argument("-o", "--outfile", help="Traits table (CSV).", default="plant_traits.csv")
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    # Get options
+    args = options()
+
+    # Zoom correction models
+    coefficients = traits.load_calibration(calibration_file=args.zoom_calibration, cache_dir=args.cache)
+
+    # Read data and format for analysis
+    snapshots = traits.read_snapshots(args.input)
+    barcodes = None
+    if args.barcodes is not None:
+        barcodes = pd.read_csv(args.barcodes)
+
+    # Build traits table
+    table = traits.build_traits(snapshots=snapshots, coefficients=coefficients, planting_date=args.planting_date,
+                                barcodes=barcodes, min_area=args.min_area)
+    table.to_csv(args.outfile, index=False, na_rep="NA")
+    sys.stderr.write("Wrote {0} snapshots of {1} plants to {2}\n".format(len(table), table["plantbarcode"].nunique(),
+                                                                       args.outfile))
+
+
+if __name__ == '__main__':
+    main()
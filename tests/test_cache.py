@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import cache
+from pipeline.metadata import parse_filename
+
+PROFILE = {"segmentation": "naive_bayes", "mog2": None, "pot_mask": None, "median_blur": 3, "fill_size": 200,
+           "roi": None, "line_position": None, "nir": None, "imgname": "filename"}
+
+
+def run_args(**options):
+    # Options of a default run, with the given options replaced
+    args = argparse.Namespace(crop=False, crop_margin=100, coarse=None, reference=False, debug=None, lean=False,
+                              cache_bg=False, nir_warp=None)
+    for name, value in options.items():
+        setattr(args, name, value)
+    return args
+
+
+def image_key(results_cache, image, pdfs, profile=PROFILE, outdir=None, **options):
+    # Cache key of an image as the pipeline engine computes it
+    settings = cache.result_settings(profile=profile, args=run_args(**options), outdir=outdir)
+    return results_cache.key(image=image, metadata=parse_filename(image), profile=settings, files=[pdfs])
+
+
+def write_file(filename, contents):
+    with open(filename, "w") as fp:
+        fp.write(contents)
+    return filename
+
+
+def test_cache_key_changes_with_mode_and_settings(tmpdir):
+    image = write_file(os.path.join(str(tmpdir), "VIS_SV_0_z1_h1_g0_e82_1.png"), "image")
+    pdfs = write_file(os.path.join(str(tmpdir), "pdfs.txt"), "pdfs")
+    results_cache = cache.ResultsCache(os.path.join(str(tmpdir), "cache"))
+    default = image_key(results_cache, image, pdfs)
+    assert image_key(results_cache, image, pdfs) == default
+
+    # Every mode, crop setting, profile setting and output directory gives its own key
+    keys = [default,
+            image_key(results_cache, image, pdfs, reference=True),
+            image_key(results_cache, image, pdfs, debug="print"),
+            image_key(results_cache, image, pdfs, lean=True),
+            image_key(results_cache, image, pdfs, cache_bg=True),
+            image_key(results_cache, image, pdfs, nir_warp="bilinear"),
+            image_key(results_cache, image, pdfs, crop=True),
+            image_key(results_cache, image, pdfs, crop=True, crop_margin=16),
+            image_key(results_cache, image, pdfs, coarse=4),
+            image_key(results_cache, image, pdfs, profile=dict(PROFILE, fill_size=100)),
+            image_key(results_cache, image, pdfs, outdir=str(tmpdir))]
+    assert len(set(keys)) == len(keys)
+
+    # The crop margin only matters when cropping
+    assert image_key(results_cache, image, pdfs, crop_margin=16) == default
+
+    # As do the contents of the input files
+    write_file(pdfs, "other pdfs")
+    assert image_key(results_cache, image, pdfs) != default
+    results_cache.close()
@@ -0,0 +1,78 @@
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import components
+
+# The fast path is checked against the plantcv functions it replaces
+pcv = pytest.importorskip("plantcv")
+
+# Frame size of the test masks
+SHAPE = (120, 160)
+
+
+def rectangle_roi(x_adj, y_adj, w_adj, h_adj, shape=SHAPE):
+    img = np.zeros(shape + (3,), dtype=np.uint8)
+    device, roi, roi_hierarchy = pcv.define_roi(img=img, shape="rectangle", device=0, roi=None, roi_input="default",
+                                                adjust=True, x_adj=x_adj, y_adj=y_adj, w_adj=w_adj, h_adj=h_adj)
+    return roi, roi_hierarchy
+
+
+def contour_path(mask, roi, roi_hierarchy):
+    # Kept mask of pcv.find_objects followed by pcv.roi_objects(partial), as in the debug path of the pipeline
+    img = np.zeros(mask.shape + (3,), dtype=np.uint8)
+    device, objects, obj_hierarchy = pcv.find_objects(img=img, mask=np.copy(mask), device=0)
+    if len(objects) == 0:
+        return np.zeros(mask.shape, dtype=np.uint8)
+    device, kept, hierarchy, kept_mask, obj_area = pcv.roi_objects(img=img, roi_type="partial", roi_contour=roi,
+                                                                   roi_hierarchy=roi_hierarchy,
+                                                                   object_contour=objects,
+                                                                   obj_hierarchy=obj_hierarchy, device=device)
+    return kept_mask
+
+
+def random_mask(rng, shape=SHAPE):
+    # Ring-shaped objects (with an island in the hole, and sometimes a hole in the island), partly off the
+    # frame, plus speckle noise
+    rows, cols = shape
+    mask = np.zeros(shape, dtype=np.uint8)
+    for ring in range(rng.randint(0, 4)):
+        center = (rng.randint(-20, cols + 20), rng.randint(-20, rows + 20))
+        radius = rng.randint(10, 40)
+        cv2.circle(mask, center, radius, 255, -1)
+        cv2.circle(mask, center, radius * 2 // 3, 0, -1)
+        cv2.circle(mask, center, radius // 3, 255, -1)
+        if rng.rand() < 0.5:
+            cv2.circle(mask, center, radius // 6, 0, -1)
+    mask[rng.rand(*shape) < rng.choice([0.002, 0.01])] = 255
+    return mask
+
+
+def test_island_in_hole_of_dropped_object():
+    # A ring that touches the frame edge outside the ROI, with an island in its hole inside the ROI
+    mask = np.zeros(SHAPE, dtype=np.uint8)
+    cv2.circle(mask, (45, 60), 50, 255, -1)
+    cv2.circle(mask, (45, 60), 35, 0, -1)
+    cv2.circle(mask, (45, 60), 5, 255, -1)
+    roi, roi_hierarchy = rectangle_roi(x_adj=38, y_adj=53, w_adj=-103, h_adj=-48)
+    expected = contour_path(mask, roi, roi_hierarchy)
+    kept_mask = components.roi_objects(mask=mask, roi_contour=roi, device=0)[3]
+    assert np.array_equal(kept_mask, expected)
+    assert not kept_mask.any()
+
+
+def test_matches_contour_path():
+    rng = np.random.RandomState(1)
+    for i in range(150):
+        mask = random_mask(rng)
+        x_adj, y_adj = rng.randint(0, 100), rng.randint(0, 80)
+        roi, roi_hierarchy = rectangle_roi(x_adj=x_adj, y_adj=y_adj, w_adj=-rng.randint(0, SHAPE[1] - x_adj),
+                                           h_adj=-rng.randint(0, SHAPE[0] - y_adj))
+        device, kept_cnt, hierarchy, kept_mask, obj_area = components.roi_objects(mask=mask, roi_contour=roi,
+                                                                                  device=0)
+        assert device == 1
+        assert np.array_equal(kept_mask, contour_path(mask, roi, roi_hierarchy)), "mask {0}".format(i)
+        assert obj_area == cv2.countNonZero(kept_mask)
@@ -0,0 +1,64 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import lean, naive_bayes
+
+
+def density(center, width, zero=None):
+    # Gaussian density over the 256 channel values, zero in the range zero = (start, stop) to make ties
+    values = np.exp(-0.5 * ((np.arange(256) - center) / float(width)) ** 2)
+    if zero is not None:
+        values[zero[0]:zero[1]] = 0
+    return values / values.sum()
+
+
+def write_pdfs(filename):
+    # PDF file in the format of the plantcv training script
+    pdfs = {"plant": {"hue": density(35, 10), "saturation": density(150, 50, zero=(0, 20)),
+                      "value": density(120, 60)},
+            "background": {"hue": density(100, 60), "saturation": density(40, 30, zero=(0, 20)),
+                           "value": density(180, 50)}}
+    with open(filename, "w") as pf:
+        pf.write("class\tchannel\t" + "\t".join(str(i) for i in range(256)) + "\n")
+        for class_name in sorted(pdfs):
+            for channel in ["hue", "saturation", "value"]:
+                values = [repr(float(p)) for p in pdfs[class_name][channel]]
+                pf.write("\t".join([class_name, channel] + values) + "\n")
+    return filename
+
+
+def test_lut_classifier_matches_vectorized_classifier(tmpdir):
+    pdf_file = write_pdfs(os.path.join(str(tmpdir), "pdfs.txt"))
+    classes, lut = naive_bayes.load_lut(pdf_file=pdf_file, cache_dir=os.path.join(str(tmpdir), "lut"))
+    rng = np.random.RandomState(0)
+    img = rng.randint(0, 256, size=(120, 160, 3)).astype(np.uint8)
+    # Grays have saturation 0, where both classes have zero density (no class)
+    img[:10] = rng.randint(0, 256, size=(10, 160, 1)).astype(np.uint8)
+
+    device, expected = naive_bayes.naive_bayes_classifier(img=img, pdfs=naive_bayes.read_pdfs(pdf_file), device=0)
+    device, masks = naive_bayes.lut_classifier(img=img, classes=classes, lut=lut, device=0)
+    assert device == 1
+    assert sorted(masks) == sorted(expected)
+    for class_name in expected:
+        assert np.array_equal(masks[class_name], expected[class_name]), class_name
+    assert not expected["plant"][:10].any() and not expected["background"][:10].any()
+
+    buffers = lean.Buffers()
+    for class_name in expected:
+        mask = naive_bayes.lut_mask(img=img, classes=classes, lut=lut, class_name=class_name, buffers=buffers)
+        assert np.array_equal(mask, expected[class_name]), class_name
+
+
+def test_compiled_table_is_cached(tmpdir):
+    pdf_file = write_pdfs(os.path.join(str(tmpdir), "pdfs.txt"))
+    cache_dir = os.path.join(str(tmpdir), "lut")
+    classes, lut = naive_bayes.load_lut(pdf_file=pdf_file, cache_dir=cache_dir)
+    assert classes == ["background", "plant"]
+    assert lut.shape == (256 ** 3,)
+    # The table and its class names, keyed by the PDF file contents
+    assert sorted(os.path.splitext(name)[1] for name in os.listdir(cache_dir)) == [".json", ".npy"]
+    cached_classes, cached = naive_bayes.load_lut(pdf_file=pdf_file, cache_dir=cache_dir)
+    assert cached_classes == classes
+    assert np.array_equal(cached, lut)
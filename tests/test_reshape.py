@@ -0,0 +1,74 @@
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import reshape, sink
+from pipeline.metadata import parse_filename
+
+ID_COLUMNS = ["timestamp", "treatment", "plantbarcode"]
+VALUE_COLUMNS = ["image", "camera", "frame", "area"]
+
+
+def images():
+    # Two snapshots with a side view at 0 and 90 degrees and a top view each
+    rows = []
+    for timestamp, barcode, areas in [("2014-01-01 10:00:00", "A1", (10, 20, 30)),
+                                      ("2014-01-02 10:00:00", "A1", (11, 21, 31))]:
+        for (camera, frame), area in zip([("SV", "0"), ("SV", "90"), ("TV", "none")], areas):
+            rows.append({"image": "{0}_{1}_{2}.png".format(camera, frame, area), "camera": camera, "frame": frame,
+                         "area": area, "timestamp": timestamp, "treatment": "dry", "plantbarcode": barcode})
+    return pd.DataFrame(rows)
+
+
+def test_pivot_snapshots_matches_plantcv2R():
+    snapshots = reshape.pivot_snapshots(images=images(), id_columns=ID_COLUMNS, value_columns=VALUE_COLUMNS,
+                                        prefixes=["sv0_", "sv90_", "tv0_"])
+    # plantcv2R.R: frame "none" becomes 0, every column except the snapshot columns gets the
+    # tolower(camera) + frame + "_" prefix and the images of a timestamp are merged into one row
+    expected = pd.DataFrame([
+        {"timestamp": "2014-01-01 10:00:00", "treatment": "dry", "plantbarcode": "A1",
+         "sv0_image": "SV_0_10.png", "sv0_camera": "SV", "sv0_frame": "0", "sv0_area": 10,
+         "sv90_image": "SV_90_20.png", "sv90_camera": "SV", "sv90_frame": "90", "sv90_area": 20,
+         "tv0_image": "TV_none_30.png", "tv0_camera": "TV", "tv0_frame": "0", "tv0_area": 30},
+        {"timestamp": "2014-01-02 10:00:00", "treatment": "dry", "plantbarcode": "A1",
+         "sv0_image": "SV_0_11.png", "sv0_camera": "SV", "sv0_frame": "0", "sv0_area": 11,
+         "sv90_image": "SV_90_21.png", "sv90_camera": "SV", "sv90_frame": "90", "sv90_area": 21,
+         "tv0_image": "TV_none_31.png", "tv0_camera": "TV", "tv0_frame": "0", "tv0_area": 31}])
+    assert list(snapshots.columns) == ID_COLUMNS + [prefix + column for prefix in ["sv0_", "sv90_", "tv0_"]
+                                                    for column in VALUE_COLUMNS]
+    pd.testing.assert_frame_equal(snapshots, expected[list(snapshots.columns)], check_dtype=False)
+
+
+def test_pivot_snapshots_missing_and_repeated_views():
+    rows = images()
+    # The first snapshot has no top view; the 90 degree side view of the second was imaged twice
+    rows = rows[rows["image"] != "TV_none_30.png"]
+    again = rows[rows["image"] == "SV_90_21.png"].assign(image="SV_90_22.png", area=22)
+    rows = pd.concat([rows, again], ignore_index=True)
+    snapshots = reshape.pivot_snapshots(images=rows, id_columns=ID_COLUMNS, value_columns=VALUE_COLUMNS,
+                                        prefixes=["sv0_", "sv90_", "tv0_"])
+    assert len(snapshots) == 2
+    assert pd.isnull(snapshots["tv0_area"][0]) and snapshots["tv0_area"][1] == 31
+    assert snapshots["sv90_image"][1] == "SV_90_22.png"
+
+
+def test_reshape_results_drops_constant_columns(tmpdir):
+    database = os.path.join(str(tmpdir), "results.sqlite3")
+    with sink.SQLiteSink(database) as results:
+        for snapshot, areas in [("snapshot1", (10, 20)), ("snapshot2", (11, 21))]:
+            for name, area in zip(["VIS_SV_0_z1_h1_g0_e82_1.png", "VIS_TV_z1_h1_g0_e65_2.png"], areas):
+                image = os.path.join("/data", snapshot, name)
+                metadata = dict(parse_filename(image), timestamp=snapshot, plantbarcode="A1", treatment="dry")
+                results.add(sink.make_record(image=image, metadata=metadata,
+                                             tables=[(["HEADER_SHAPES", "area", "width"],
+                                                      ["SHAPES_DATA", area, 5], [])]))
+    outfile = os.path.join(str(tmpdir), "snapshots.csv")
+    assert reshape.reshape_results(database=database, outfile=outfile) == 2
+    snapshots = pd.read_csv(outfile)
+    # Constant columns (width, imgtype, zoom, barcode and treatment) are removed, as in plantcv2R.R
+    assert list(snapshots.columns) == ["timestamp", "sv0_image_id", "sv0_image", "sv0_camera", "sv0_frame",
+                                       "sv0_exposure", "sv0_id", "sv0_area", "tv0_image_id", "tv0_image",
+                                       "tv0_camera", "tv0_frame", "tv0_exposure", "tv0_id", "tv0_area"]
+    assert list(snapshots["sv0_area"]) == [10, 11]
+    assert list(snapshots["tv0_frame"]) == [0, 0]
@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import shard, sink
+from pipeline.metadata import parse_filename
+
+
+def write_shard(database, images, feature="area"):
+    # Results database of one shard, with image ids starting at 1
+    with sink.SQLiteSink(database) as results:
+        for image, value in images:
+            results.add(sink.make_record(image=image, metadata=parse_filename(image),
+                                         tables=[(["HEADER_SHAPES", feature], ["SHAPES_DATA", value],
+                                                  [["IMAGE", "shapes", image + "_shapes.jpg"]])]))
+    return database
+
+
+def test_merge_sqlite_offsets_ids_and_deduplicates(tmpdir):
+    first = write_shard(os.path.join(str(tmpdir), "shard1.sqlite3"),
+                        [("/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png", 10),
+                         ("/data/snapshot1/VIS_TV_z1_h1_g0_e65_2.png", 20)])
+    second = write_shard(os.path.join(str(tmpdir), "shard2.sqlite3"),
+                         [("/data/snapshot2/VIS_SV_0_z1_h1_g0_e82_3.png", 30)], feature="solidity")
+    output = os.path.join(str(tmpdir), "merged.sqlite3")
+
+    # The first shard is passed twice: its images are merged once
+    assert shard._merge_sqlite([first, second, first], output) == 3
+    conn = sqlite3.connect(output)
+    rows = conn.execute("SELECT image_id, image, area, solidity FROM metadata NATURAL JOIN features "
+                        "ORDER BY image").fetchall()
+    assert [row[1:] for row in rows] == [("/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png", 10, None),
+                                         ("/data/snapshot1/VIS_TV_z1_h1_g0_e65_2.png", 20, None),
+                                         ("/data/snapshot2/VIS_SV_0_z1_h1_g0_e82_3.png", None, 30)]
+    # Ids of the later copies are moved past those already merged, so every image keeps its own id
+    ids = [row[0] for row in rows]
+    assert len(set(ids)) == 3 and min(ids) > 1
+    for table in ["metadata", "features"]:
+        assert conn.execute("SELECT COUNT(*) FROM " + table).fetchone()[0] == 3
+    # Analysis images follow their image
+    assert sorted(conn.execute("SELECT m.image || '_shapes.jpg' = a.image_path FROM metadata m JOIN "
+                               "analysis_images a ON m.image_id = a.image_id").fetchall()) == [(1,)] * 3
+    conn.close()
+
+
+def test_merge_results_into_existing_database(tmpdir):
+    first = write_shard(os.path.join(str(tmpdir), "shard1.sqlite3"),
+                        [("/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png", 10)])
+    output = os.path.join(str(tmpdir), "merged.sqlite3")
+    assert shard.merge_results([first], output) == 1
+    # A reanalyzed image replaces its merged results
+    again = write_shard(os.path.join(str(tmpdir), "shard1-again.sqlite3"),
+                        [("/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png", 12)])
+    assert shard.merge_results([again], output) == 1
+    conn = sqlite3.connect(output)
+    assert conn.execute("SELECT area FROM metadata NATURAL JOIN features").fetchall() == [(12,)]
+    conn.close()
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import sink
+from pipeline.histograms import NIR_HEADER
+from pipeline.metadata import parse_filename
+
+
+def vis_record(image, area, extra=None):
+    # VIS record with shape features (area as given, so int and float values can be mixed)
+    header = ["HEADER_SHAPES", "area", "width", "height"]
+    data = ["SHAPES_DATA", area, 20, 30]
+    if extra is not None:
+        header.append(extra[0])
+        data.append(extra[1])
+    return sink.make_record(image=image, metadata=parse_filename(image),
+                            tables=[(header, data, [["IMAGE", "shapes", image + "_shapes.jpg"]])])
+
+
+def nir_record(image):
+    # NIR record with a histogram
+    return sink.make_record(image=image, metadata=parse_filename(image),
+                            tables=[(["HEADER_SHAPES", "area"], ["SHAPES_DATA", 12.5], []),
+                                    (list(NIR_HEADER), ["NIR_DATA", 256, list(range(256)), [0] * 255 + [7]], [])])
+
+
+def test_parquet_parts_share_one_schema(tmpdir):
+    pq = pytest.importorskip("pyarrow.parquet")
+    directory = os.path.join(str(tmpdir), "results.parquet")
+    with sink.ParquetSink(directory, batch_size=1) as results:
+        results.add(vis_record("/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png", area=100))
+        results.add(nir_record("/data/snapshot1/NIR_SV_0_z1_h1_g0_e82_1.png"))
+        results.add(vis_record("/data/snapshot2/VIS_TV_z1_h1_g0_e65_3.png", area=250.5))
+    parts = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    assert len(parts) == 3
+    schemas = [pq.read_schema(part) for part in parts]
+    assert all(schema.equals(schemas[0]) for schema in schemas)
+    assert str(schemas[0].field("area").type) == "double"
+    assert str(schemas[0].field("nir").type.value_type) == "double"
+    assert str(schemas[0].field("frame").type) == "string"
+
+    # The directory reads as one table
+    table = pq.read_table(directory)
+    rows = dict((row["image"], row) for row in table.to_pylist())
+    assert rows["/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png"]["area"] == 100.0
+    assert rows["/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png"]["nir"] is None
+    assert rows["/data/snapshot1/NIR_SV_0_z1_h1_g0_e82_1.png"]["nir"][-1] == 7.0
+    assert rows["/data/snapshot2/VIS_TV_z1_h1_g0_e65_3.png"]["frame"] == "none"
+    assert rows["/data/snapshot2/VIS_TV_z1_h1_g0_e65_3.png"]["analysis_images"] == [
+        "/data/snapshot2/VIS_TV_z1_h1_g0_e65_3.png_shapes.jpg"]
+
+
+def test_parquet_rejects_non_numeric_features(tmpdir):
+    pytest.importorskip("pyarrow")
+    results = sink.ParquetSink(os.path.join(str(tmpdir), "results.parquet"))
+    results.add(vis_record("/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png", area="large"))
+    with pytest.raises(RuntimeError):
+        results.flush()
+
+
+def test_sqlite_batches_share_one_table(tmpdir):
+    database = os.path.join(str(tmpdir), "results.sqlite3")
+    with sink.SQLiteSink(database, batch_size=1) as results:
+        results.add(vis_record("/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png", area=100))
+        results.add(nir_record("/data/snapshot1/NIR_SV_0_z1_h1_g0_e82_1.png"))
+        results.add(vis_record("/data/snapshot2/VIS_TV_z1_h1_g0_e65_3.png", area=250.5, extra=("solidity", 0.5)))
+        assert results.stored("/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png")
+        assert not results.stored("/data/snapshot3/VIS_SV_0_z1_h1_g0_e82_4.png")
+
+    conn = sqlite3.connect(database)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(features)")]
+    assert columns == ["image_id", "area", "width", "height", "bin-number", "bin-values", "nir", "solidity"]
+    rows = conn.execute("SELECT image, area, solidity, nir FROM metadata NATURAL JOIN features "
+                        "ORDER BY image_id").fetchall()
+    assert [row[0] for row in rows] == ["/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png",
+                                        "/data/snapshot1/NIR_SV_0_z1_h1_g0_e82_1.png",
+                                        "/data/snapshot2/VIS_TV_z1_h1_g0_e65_3.png"]
+    assert rows[0][1:] == (100, None, None)
+    assert rows[1][3] == str([0] * 255 + [7])
+    assert rows[2][1:3] == (250.5, 0.5)
+    conn.close()
+
+
+def test_sqlite_replaces_reanalyzed_images(tmpdir):
+    database = os.path.join(str(tmpdir), "results.sqlite3")
+    image = "/data/snapshot1/VIS_SV_0_z1_h1_g0_e82_1.png"
+    with sink.SQLiteSink(database) as results:
+        results.add(vis_record(image, area=100))
+    with sink.SQLiteSink(database) as results:
+        results.add(vis_record(image, area=120))
+    conn = sqlite3.connect(database)
+    assert conn.execute("SELECT area FROM metadata NATURAL JOIN features").fetchall() == [(120,)]
+    assert conn.execute("SELECT COUNT(*) FROM analysis_images").fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,45 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import traits
+
+
+def test_fit_exponential_recovers_coefficients():
+    x = np.linspace(1, 6, 12)
+    y = 2.5 * np.exp(-0.4 * x)
+    # Starting values well away from the solution
+    a, b = traits._fit_exponential(x, y, 1.0, -0.1)
+    assert np.allclose([a, b], [2.5, -0.4], rtol=1e-8)
+
+
+def test_fit_exponential_minimizes_squared_error():
+    rng = np.random.RandomState(0)
+    x = np.linspace(1, 6, 40)
+    y = 1.2 * np.exp(0.3 * x) + rng.normal(0, 0.05, size=x.size)
+    a, b = traits._fit_exponential(x, y, 1.0, 0.25)
+    assert np.allclose([a, b], [1.2, 0.3], rtol=5e-2)
+    # The least squares solution has a zero gradient
+    fitted = a * np.exp(b * x)
+    residuals = y - fitted
+    gradient = [np.sum(residuals * fitted / a), np.sum(residuals * fitted * x)]
+    assert np.allclose(gradient, 0, atol=1e-6)
+
+
+def test_calibration_coefficients_are_cached(tmpdir):
+    # Reference object calibration: rel_area = 0.5 * exp(0.2 * zoom.camera), px_cm = 10 + 2 * z + 0.5 * z^2
+    calibration_file = os.path.join(str(tmpdir), "zoom_calibration.txt")
+    with open(calibration_file, "w") as cf:
+        cf.write("zoom\tcamera\tlength_px\tlength_cm\trel_area\n")
+        for zoom in [1, 1000, 2000, 3000, 4000, 5000, 6000]:
+            z = traits.camera_zoom(zoom)
+            for camera in ["VIS SV", "VIS TV"]:
+                cf.write("{0}\t{1}\t{2!r}\t2\t{3!r}\n".format(zoom, camera, float(2 * (10 + 2 * z + 0.5 * z ** 2)),
+                                                             float(0.5 * np.exp(0.2 * z))))
+    cache_dir = os.path.join(str(tmpdir), "coefficients")
+    coefficients = traits.load_calibration(calibration_file, cache_dir=cache_dir)
+    assert np.allclose(coefficients["area"], [0.5, 0.2])
+    assert np.allclose(coefficients["px_cm"], [10, 2, 0.5])
+    assert len(os.listdir(cache_dir)) == 1
+    assert traits.load_calibration(calibration_file, cache_dir=cache_dir) == coefficients
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+import argparse
+from pipeline import engine, naive_bayes, profiles, registration
+
+
+# Parse command-line arguments
+def options():
+    parser = argparse.ArgumentParser(description="Run a profile-driven image processing pipeline")
+    parser.add_argument("-P", "--pipeline", help="Pipeline name in the profile file (e.g. lt1, transect).",
+                        required=True)
+    parser.add_argument("--profiles", help="Pipeline profile file (JSON or YAML).", default=profiles.PROFILES)
+    parser.add_argument("-r2", "--coresult", help="NIR result file.", required=False)
+    parser.add_argument("-p", "--pdfs", help="Naive Bayes PDF file (naive_bayes pipelines).", required=False)
+    parser.add_argument("-l", "--lut-cache", help="Directory of compiled Naive Bayes lookup tables.",
+                        default=naive_bayes.LUT_CACHE)
+    parser.add_argument("-b", "--bgimg", help="Background image file (background pipelines).", required=False)
+    parser.add_argument("-c", "--cache-bg", help="Learn the background model once and reuse it for every image.",
+                        default=False, action="store_true")
+    parser.add_argument("--nir-warp", help="Map the VIS plant mask onto the NIR image with one calibrated warp "
+                        "instead of the resize and crop_position_mask steps. Needs only the frame sizes, not the NIR "
+                        "image; results differ slightly.", choices=sorted(registration.INTERPOLATIONS), default=None)
+    engine.add_options(parser)
+    args = parser.parse_args()
+    engine.check_options(parser, args)
+    return args
+
+
+def main():
+    # Get options
+    args = options()
+
+    # Settings for each image are selected from the pipeline profile by camera and zoom level
+    engine.run(args=args, pipeline=args.pipeline)
+
+
+if __name__ == '__main__':
+    main()